@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Mede o custo das dependências de config e sessão de cada requisição.
+
+Compara o caminho antigo, que relia o .env com o pydantic-settings e
+montava um sessionmaker a cada requisição, com o contexto criado uma vez
+no ciclo de vida da aplicação. Não conecta ao banco:
+
+    source .env
+    python benchmarks/dependencias.py --requisicoes 5000
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+import sqlalchemy.orm
+
+import fabriquinha as fabr
+
+
+def medir(nome: str, funcao: Callable[[], object], n: int) -> None:
+    inicio = time.perf_counter()
+    for _ in range(n):
+        funcao()
+    tempo = time.perf_counter() - inicio
+    us = 1_000_000 * tempo / n
+    print(f'{nome:>7}: {tempo:8.3f}s  {us:8.1f}us/requisição')  # NOQA: T201
+
+
+def antes() -> None:
+    config = fabr.ambiente.criar_config()
+    sessoes = sa.orm.sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=fabr.bd.criar_motor(config),
+    )
+    sessoes().close()
+
+
+def depois(requisicao: SimpleNamespace) -> None:
+    fabr.ambiente.config_deps(requisicao)  # type: ignore[arg-type]
+    for _ in fabr.bd.sessao_deps(requisicao):  # type: ignore[arg-type]
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requisicoes', type=int, default=5000)
+    args = parser.parse_args()
+
+    contexto = fabr.aplicacao.criar_contexto(fabr.ambiente.criar_config())
+    app = SimpleNamespace(state=SimpleNamespace(contexto=contexto))
+    requisicao = SimpleNamespace(app=app)
+
+    medir('antes', antes, args.requisicoes)
+    medir('depois', lambda: depois(requisicao), args.requisicoes)
+
+
+if __name__ == '__main__':
+    main()
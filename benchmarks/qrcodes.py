@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Compara o custo de gerar os qrcodes em png (base64) e em svg.
+
+Mede a geração sem a memória das funções, para comparar só o trabalho de
+cada formato, e a geração em lote de `gerar_qrcodes`:
+
+    python benchmarks/qrcodes.py --codigos 2000
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+
+import fabriquinha as fabr
+
+
+def medir(nome: str, funcao: Callable[[], object], n: int) -> None:
+    inicio = time.perf_counter()
+    funcao()
+    tempo = time.perf_counter() - inicio
+    us = 1_000_000 * tempo / n
+    print(f'{nome:>10}: {tempo:8.3f}s  {us:8.1f}us/qrcode')  # NOQA: T201
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--codigos', type=int, default=2000)
+    args = parser.parse_args()
+
+    codigos = fabr.bd.gerar_codigos(args.codigos)
+    urls = [f'https://localhost/v/{codigo}' for codigo in codigos]
+    png = fabr.bd.gerar_qrcode.__wrapped__
+    svg = fabr.bd.gerar_qrcode_svg.__wrapped__
+
+    medir('png', lambda: [png(url) for url in urls], len(urls))
+    medir('svg', lambda: [svg(url) for url in urls], len(urls))
+    medir('svg lote', lambda: fabr.bd.gerar_qrcodes(urls), len(urls))
+
+
+if __name__ == '__main__':
+    main()
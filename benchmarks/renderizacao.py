@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Compara o custo por certificado da renderização individual e em lote.
+
+Usa o modelo de teste (tests/test.html) e não precisa do banco de dados,
+apenas das variáveis de ambiente da aplicação:
+
+    source .env
+    python benchmarks/renderizacao.py --certificados 64 --lote 16
+"""
+
+import argparse
+import datetime as dt
+import functools
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import fabriquinha as fabr
+
+
+MODELO = Path(__file__).parent.parent / 'tests' / 'test.html'
+
+
+def medir(funcao: Callable[[], object], repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def criar_contextos(
+    config: fabr.ambiente.Config,
+    n: int,
+) -> list[fabr.bd.Conteudo]:
+    return [
+        dict(
+            nome=f'Pessoa {i}',
+            url_validacao=f'{config.url_base}/v/{i:012}',
+            emissora='Comunidade',
+            data=dt.date(2025, 1, 1),
+        )
+        for i in range(n)
+    ]
+
+
+def individual(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    contextos: list[fabr.bd.Conteudo],
+) -> None:
+    for contexto in contextos:
+        fabr.renderizacao.gerar_pdf(config, resumo, htmlzip, contexto)
+
+
+def em_lote(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    contextos: list[fabr.bd.Conteudo],
+    tamanho: int,
+) -> None:
+    for i in range(0, len(contextos), tamanho):
+        lote = contextos[i : i + tamanho]
+        fabr.renderizacao.gerar_pdfs(config, resumo, htmlzip, lote)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--certificados', type=int, default=64)
+    parser.add_argument('--lote', type=int, default=16)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    config = fabr.ambiente.criar_config().model_copy(
+        update=dict(cache_diretorio=tempfile.mkdtemp(), render_processos=0),
+    )
+    resumo = 'benchmark'
+    htmlzip = fabr.bd._comprimir(MODELO.read_text())  # NOQA: SLF001
+    contextos = criar_contextos(config, args.certificados)
+
+    # aquece o cache de modelos e as fontes antes de medir
+    fabr.renderizacao.gerar_pdf(config, resumo, htmlzip, contextos[0])
+
+    modos: dict[str, Callable[..., None]] = {
+        'individual': individual,
+        'em lote': functools.partial(em_lote, tamanho=args.lote),
+    }
+    n = args.certificados
+    for nome, modo in modos.items():
+        funcao = functools.partial(modo, config, resumo, htmlzip, contextos)
+        tempo = medir(funcao, args.repeticoes)
+        ms = 1000 * tempo / n
+        print(f'{nome:>10}: {tempo:8.3f}s  {ms:8.1f}ms/cert')  # NOQA: T201
+
+
+if __name__ == '__main__':
+    main()
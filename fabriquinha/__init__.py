@@ -1,2 +1,3 @@
-from . import ambiente, bd, rotas  # NOQA: I001
+from . import ambiente, cache, recursos, bd, renderizacao  # NOQA: I001
+from . import aplicacao, artefatos, fila, rotas
 from . import main
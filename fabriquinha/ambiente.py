@@ -30,6 +30,31 @@ class Config(BaseSettings):
     banco: Banco
     url_base: str = Field(alias='URL_BASE')
     segredo: SecretStr = Field(alias='SECRET')
+    cache_diretorio: str = Field(default='.cache', alias='CACHE_DIRETORIO')
+    cache_tamanho: int = Field(default=512, alias='CACHE_TAMANHO_MB')
+    cache_modelos: int = Field(default=128, alias='CACHE_MODELOS')
+    armazem: Literal['nenhum', 'disco', 'banco'] = Field(
+        default='nenhum',
+        alias='ARMAZEM',
+    )
+    armazem_diretorio: str = Field(
+        default='.armazem',
+        alias='ARMAZEM_DIRETORIO',
+    )
+    render_processos: int = Field(default=0, alias='RENDER_PROCESSOS')
+    recursos_timeout: float = Field(default=3, alias='RECURSOS_TIMEOUT')
+    recursos_validade: int = Field(default=3600, alias='RECURSOS_VALIDADE')
+    recursos_cache: int = Field(default=64, alias='RECURSOS_CACHE_MB')
+    login_validade: int = Field(default=60, alias='LOGIN_VALIDADE')
+    login_cache: int = Field(default=1024, alias='LOGIN_CACHE')
+    senha_tempo: int = Field(default=3, alias='SENHA_TEMPO')
+    senha_memoria: int = Field(default=65536, alias='SENHA_MEMORIA_KB')
+    senha_paralelismo: int = Field(default=4, alias='SENHA_PARALELISMO')
+    senha_simultaneas: int = Field(default=2, alias='SENHA_SIMULTANEAS')
+    fila_trabalhadores: int = Field(default=1, alias='FILA_TRABALHADORES')
+    fila_lote: int = Field(default=16, alias='FILA_LOTE')
+    fila_tentativas: int = Field(default=5, alias='FILA_TENTATIVAS')
+    busca_limite: int = Field(default=10, alias='BUSCA_LIMITE')
 
 
 def criar_config(
@@ -44,8 +69,9 @@ def criar_config(
     return config
 
 
-def config_deps() -> Config:
-    config = criar_config()
+def config_deps(requisicao: fastapi.Request) -> Config:
+    # criada uma vez no ciclo de vida da aplicação (veja fabr.aplicacao)
+    config: Config = requisicao.app.state.contexto.config
     return config
 
 
@@ -0,0 +1,111 @@
+import logging
+from typing import Annotated, NamedTuple
+
+import fastapi
+import sqlalchemy as sa
+import sqlalchemy.orm
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
+
+import fabriquinha as fabr
+
+
+logger = logging.getLogger(__name__)
+
+# as buscas de certificados são contadas por endereço ip, em janelas fixas
+# deste tempo, em segundos (veja BUSCA_LIMITE), e de até tantos endereços
+JANELA_DAS_BUSCAS = 60
+ENDERECOS_CONTADOS = 10_000
+
+
+class Contexto(NamedTuple):
+    """
+    Objetos da aplicação, criados uma única vez no seu ciclo de vida.
+
+    Fica em `app.state.contexto` e chega às rotas pelas dependências, então
+    uma requisição não relê o .env nem monta sessionmakers.
+
+    O pool de renderização não faz parte do contexto: ele é usado por dentro
+    das funções de fabr.renderizacao, que também rodam no run-worker.py, e
+    é obtido por config (veja `criar_pool`). O ciclo de vida da aplicação
+    apenas o encerra, em `fechar_contexto`.
+    """
+
+    config: fabr.ambiente.Config
+    motor: sa.Engine
+    sessoes: sa.orm.sessionmaker[sa.orm.Session]
+    motor_assincrono: AsyncEngine
+    sessoes_assincronas: async_sessionmaker[AsyncSession]
+    cache: fabr.cache.CacheEmDisco
+    modelos: fabr.cache.CacheLRU[str, fabr.renderizacao.ModeloCompilado]
+    buscas: fabr.cache.CacheLRU[str, tuple[float, int]]
+
+
+def criar_contexto(config: fabr.ambiente.Config) -> Contexto:
+    """
+    Cria o contexto da aplicação.
+
+    Os objetos síncronos vêm das mesmas fábricas usadas fora das rotas (os
+    processos de renderização, os scripts), que os guardam por config.
+    """
+    logger.debug('Criando o contexto da aplicação')
+    motor_assincrono = fabr.bd.criar_motor_assincrono(config)
+    return Contexto(
+        config=config,
+        motor=fabr.bd.criar_motor(config),
+        sessoes=fabr.bd.criar_fabrica_de_sessoes(config),
+        motor_assincrono=motor_assincrono,
+        # numa sessão assíncrona um atributo expirado não pode ser recarregado
+        # sob demanda, então os objetos não expiram depois do commit
+        sessoes_assincronas=async_sessionmaker(
+            motor_assincrono,
+            autoflush=False,
+            expire_on_commit=False,
+        ),
+        cache=fabr.cache.criar_cache(config),
+        modelos=fabr.renderizacao.criar_cache_de_modelos(config),
+        # início da janela e número de buscas de cada endereço
+        buscas=fabr.cache.CacheLRU(
+            tamanho_maximo=ENDERECOS_CONTADOS,
+            validade=JANELA_DAS_BUSCAS,
+        ),
+    )
+
+
+async def fechar_contexto(contexto: Contexto) -> None:
+    # o motor assíncrono pertence ao event loop da aplicação, e os processos
+    # de renderização não devem sobreviver a ela; os demais objetos são
+    # compartilhados pelo processo e continuam abertos
+    await contexto.motor_assincrono.dispose()
+    await run_in_threadpool(fabr.renderizacao.fechar_pool, contexto.config)
+
+
+def contexto_deps(requisicao: fastapi.Request) -> Contexto:
+    contexto: Contexto = requisicao.app.state.contexto
+    return contexto
+
+
+ContextoDeps = Annotated[Contexto, fastapi.Depends(contexto_deps)]
+
+
+def cache_deps(contexto: ContextoDeps) -> fabr.cache.CacheEmDisco:
+    return contexto.cache
+
+
+CacheDeps = Annotated[fabr.cache.CacheEmDisco, fastapi.Depends(cache_deps)]
+
+
+def modelos_deps(
+    contexto: ContextoDeps,
+) -> fabr.cache.CacheLRU[str, fabr.renderizacao.ModeloCompilado]:
+    return contexto.modelos
+
+
+ModelosDeps = Annotated[
+    fabr.cache.CacheLRU[str, fabr.renderizacao.ModeloCompilado],
+    fastapi.Depends(modelos_deps),
+]
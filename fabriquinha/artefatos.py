@@ -0,0 +1,271 @@
+import datetime as dt
+import functools
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql
+
+import fabriquinha as fabr
+
+
+logger = logging.getLogger(__name__)
+
+# conteúdos sem nenhum arquivo apontando para eles só são apagados depois
+# deste tempo, para não apagar um que está sendo guardado neste momento
+CARENCIA_DOS_ORFAOS = dt.timedelta(hours=1)
+
+
+class Metadados(NamedTuple):
+    """
+    nome: str
+        nome do arquivo, a chave do certificado mais a extensão
+
+    resumo: str
+        hash dos bytes; arquivos com os mesmos bytes são guardados uma vez
+
+    tamanho: int
+        tamanho em bytes
+
+    tempo: float | None
+        tempo gasto para renderizar, em segundos
+
+    versao: str
+        versão do renderizador que gerou o arquivo
+
+    criado_em: dt.datetime
+    """
+
+    nome: str
+    resumo: str
+    tamanho: int
+    tempo: float | None
+    versao: str
+    criado_em: dt.datetime
+
+
+class ArmazemColetavel(fabr.cache.Armazem, Protocol):
+    def listar(self) -> Iterator[Metadados]: ...
+
+    def remover(self, nomes: Iterable[str]) -> None: ...
+
+    def remover_orfaos(self, antes_de: dt.datetime) -> int: ...
+
+
+def resumir(dados: bytes) -> str:
+    return hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+
+class ArmazemEmDisco:
+    """
+    Armazém num diretório, que pode ser um volume compartilhado.
+
+    Os bytes ficam em conteudos/, num arquivo nomeado pelo seu resumo, e
+    os metadados de cada nome ficam em nomes/, num json que aponta para o
+    conteúdo.
+    """
+
+    def __init__(self, diretorio: str | Path) -> None:
+        self.diretorio = Path(diretorio)
+
+    def _conteudo(self, resumo: str) -> Path:
+        return self.diretorio / 'conteudos' / resumo[:2] / resumo
+
+    def _nome(self, nome: str) -> Path:
+        return self.diretorio / 'nomes' / nome[:2] / f'{nome}.json'
+
+    def obter(self, nome: str) -> bytes | None:
+        try:
+            metadados = json.loads(self._nome(nome).read_bytes())
+            return self._conteudo(metadados['resumo']).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def guardar(self, nome: str, dados: bytes, tempo: float | None) -> None:
+        resumo = resumir(dados)
+        conteudo = self._conteudo(resumo)
+        if conteudo.exists():
+            # renova a data, para a coleta não tomá-lo por um órfão antigo
+            os.utime(conteudo)
+        else:
+            fabr.cache.escrever(conteudo, dados)
+        metadados = dict(
+            resumo=resumo,
+            tamanho=len(dados),
+            tempo=tempo,
+            versao=fabr.renderizacao.VERSAO_DO_RENDERIZADOR,
+            criado_em=dt.datetime.now(dt.UTC).isoformat(),
+        )
+        fabr.cache.escrever(
+            self._nome(nome), json.dumps(metadados).encode('utf8')
+        )
+
+    def listar(self) -> Iterator[Metadados]:
+        for arquivo in self.diretorio.glob('nomes/*/*.json'):
+            try:
+                m = json.loads(arquivo.read_bytes())
+            except FileNotFoundError:
+                continue
+            yield Metadados(
+                nome=arquivo.name.removesuffix('.json'),
+                resumo=m['resumo'],
+                tamanho=m['tamanho'],
+                tempo=m['tempo'],
+                versao=m['versao'],
+                criado_em=dt.datetime.fromisoformat(m['criado_em']),
+            )
+
+    def remover(self, nomes: Iterable[str]) -> None:
+        for nome in nomes:
+            self._nome(nome).unlink(missing_ok=True)
+
+    def remover_orfaos(self, antes_de: dt.datetime) -> int:
+        usados = {m.resumo for m in self.listar()}
+        removidos = 0
+        for arquivo in self.diretorio.glob('conteudos/*/*'):
+            if arquivo.name.startswith('.') or arquivo.name in usados:
+                continue
+            modificado = dt.datetime.fromtimestamp(
+                arquivo.stat().st_mtime,
+                tz=dt.UTC,
+            )
+            if modificado < antes_de:
+                arquivo.unlink(missing_ok=True)
+                removidos += 1
+        return removidos
+
+
+class ArmazemNoBanco:
+    """
+    Armazém no postgres, nas tabelas artefato e conteudo_do_artefato.
+
+    Não precisa de nada além do banco que a aplicação já usa.
+    """
+
+    def __init__(self, config: fabr.ambiente.Config) -> None:
+        self.config = config
+
+    def obter(self, nome: str) -> bytes | None:
+        stmt = (
+            sa.select(fabr.bd.ConteudoDoArtefato.dados)
+            .join(fabr.bd.Artefato.conteudo)
+            .where(fabr.bd.Artefato.nome == nome)
+        )
+        with fabr.bd.criar_sessao(self.config) as sessao:
+            return sessao.scalars(stmt).one_or_none()
+
+    def guardar(self, nome: str, dados: bytes, tempo: float | None) -> None:
+        resumo = resumir(dados)
+        insert = sa.dialects.postgresql.insert
+        # se o conteúdo já existe, renova a data (como no disco) e trava a
+        # linha até o commit, então a coleta não o apaga nesse meio tempo
+        conteudo = (
+            insert(fabr.bd.ConteudoDoArtefato)
+            .values(resumo=resumo, dados=dados, tamanho=len(dados))
+            .on_conflict_do_update(
+                index_elements=[fabr.bd.ConteudoDoArtefato.resumo],
+                set_=dict(criado_em=sa.func.now()),
+            )
+        )
+        valores = dict(
+            resumo=resumo,
+            tempo=tempo,
+            versao=fabr.renderizacao.VERSAO_DO_RENDERIZADOR,
+        )
+        artefato = insert(fabr.bd.Artefato).values(nome=nome, **valores)
+        artefato = artefato.on_conflict_do_update(
+            index_elements=[fabr.bd.Artefato.nome],
+            set_=dict(valores, criado_em=sa.func.now()),
+        )
+        with fabr.bd.criar_sessao(self.config) as sessao:
+            sessao.execute(conteudo)
+            sessao.execute(artefato)
+            sessao.commit()
+
+    def listar(self) -> Iterator[Metadados]:
+        a = fabr.bd.Artefato
+        stmt = (
+            sa.select(
+                a.nome,
+                a.resumo,
+                fabr.bd.ConteudoDoArtefato.tamanho,
+                a.tempo,
+                a.versao,
+                a.criado_em,
+            )
+            .join(a.conteudo)
+            .execution_options(yield_per=1000)
+        )
+        with fabr.bd.criar_sessao(self.config) as sessao:
+            for linha in sessao.execute(stmt):
+                yield Metadados(*linha)
+
+    def remover(self, nomes: Iterable[str]) -> None:
+        stmt = sa.delete(fabr.bd.Artefato).where(
+            fabr.bd.Artefato.nome.in_(sa.bindparam('nomes', expanding=True))
+        )
+        nomes = list(nomes)
+        with fabr.bd.criar_sessao(self.config) as sessao:
+            for i in range(0, len(nomes), 1000):
+                sessao.execute(stmt, dict(nomes=nomes[i : i + 1000]))
+            sessao.commit()
+
+    def remover_orfaos(self, antes_de: dt.datetime) -> int:
+        c = fabr.bd.ConteudoDoArtefato
+        usado = sa.exists().where(fabr.bd.Artefato.resumo == c.resumo)
+        stmt = sa.delete(c).where(~usado, c.criado_em < antes_de)
+        with fabr.bd.criar_sessao(self.config) as sessao:
+            removidos = sessao.execute(stmt).rowcount
+            sessao.commit()
+        return removidos
+
+
+@functools.cache
+def criar_armazem(config: fabr.ambiente.Config) -> ArmazemColetavel | None:
+    if config.armazem == 'disco':
+        return ArmazemEmDisco(config.armazem_diretorio)
+    if config.armazem == 'banco':
+        return ArmazemNoBanco(config)
+    return None
+
+
+class Coleta(NamedTuple):
+    nomes: int
+    orfaos: int
+
+
+def coletar_lixo(
+    config: fabr.ambiente.Config,
+    armazem: ArmazemColetavel,
+    *,
+    outras_versoes: bool = False,
+) -> Coleta:
+    """
+    Remove do armazém o que não pode mais ser usado.
+
+    Um arquivo deixa de ser usado quando a sua chave não é mais a de nenhum
+    certificado, por exemplo depois que a URL base mudou. Com
+    `outras_versoes`, também são removidos os arquivos de outras versões do
+    renderizador, que então são renderizados de novo quando pedidos. Depois,
+    os conteúdos sem nenhum arquivo são apagados.
+    """
+    with fabr.bd.criar_sessao(config) as sessao:
+        chaves = fabr.bd.Certificado.chaves(sessao, config)
+    versao = fabr.renderizacao.VERSAO_DO_RENDERIZADOR
+    removidos = [
+        m.nome
+        for m in armazem.listar()
+        if m.nome.split('.', 1)[0] not in chaves
+        or (outras_versoes and m.versao != versao)
+    ]
+    armazem.remover(removidos)
+    orfaos = armazem.remover_orfaos(
+        dt.datetime.now(dt.UTC) - CARENCIA_DOS_ORFAOS
+    )
+    logger.info(f'{len(removidos)} arquivos e {orfaos} conteúdos removidos')
+    return Coleta(nomes=len(removidos), orfaos=orfaos)
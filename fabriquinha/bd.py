@@ -1,25 +1,44 @@
+import asyncio
 import base64
+import concurrent.futures
 import contextlib
 import datetime as dt
 import functools
 import hashlib
 import io
+import itertools
+import json
 import logging
-import random
+import secrets
 import zlib
-from collections.abc import Iterator
-from typing import Annotated, Literal, Self, TypeAlias
+from collections.abc import (
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    Sequence,
+)
+from pathlib import Path
+from typing import (
+    Annotated,
+    Literal,
+    NamedTuple,
+    ParamSpec,
+    Self,
+    TypeAlias,
+    TypeVar,
+)
 from urllib.parse import urljoin
 
 import argon2
 import fastapi
-import pymupdf
 import qrcode
 import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql
+import sqlalchemy.ext.asyncio
 import sqlalchemy.orm
-import weasyprint
-from jinja2 import Template
 from sqlalchemy import ForeignKey, String
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -33,7 +52,10 @@ import fabriquinha as fabr
 
 logger = logging.getLogger(__name__)
 
-TipoDeAcesso: TypeAlias = Literal['Organizadora', 'Administradora']
+P = ParamSpec('P')
+T = TypeVar('T')
+
+TipoDeAcesso: TypeAlias = Literal['organizadora', 'administradora']
 Conteudo: TypeAlias = dict[str, str | int | float | dt.date]
 
 
@@ -62,6 +84,17 @@ def criar_motor(config: fabr.ambiente.Config) -> sa.Engine:
     return motor
 
 
+@functools.cache
+def criar_fabrica_de_sessoes(
+    config: fabr.ambiente.Config,
+) -> sa.orm.sessionmaker[Session]:
+    return sa.orm.sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=criar_motor(config),
+    )
+
+
 @contextlib.contextmanager
 def criar_sessao(
     config: fabr.ambiente.Config | None = None,
@@ -72,26 +105,94 @@ def criar_sessao(
     Feita para ser usada dentro de blocos `with`.
     """
     config = fabr.ambiente.criar_config() if config is None else config
-    motor = criar_motor(config=config)
-    sessao_local = sa.orm.sessionmaker(
-        autocommit=False,
-        autoflush=False,
-        bind=motor,
-    )
-    sessao = sessao_local()
+    sessao = criar_fabrica_de_sessoes(config)()
     try:
         yield sessao
     finally:
         sessao.close()
 
 
-def sessao_deps() -> Iterator[Session]:
-    with criar_sessao() as sess:
+def sessao_deps(requisicao: fastapi.Request) -> Iterator[Session]:
+    with requisicao.app.state.contexto.sessoes() as sess:
         yield sess
 
 
 Sessao = Annotated[Session, fastapi.Depends(sessao_deps)]
 
+
+def criar_motor_assincrono(config: fabr.ambiente.Config) -> AsyncEngine:
+    """
+    Motor assíncrono, para as rotas de leitura mais acessadas.
+
+    As conexões de um motor assíncrono pertencem ao event loop que as criou,
+    então o motor é criado e descartado no ciclo de vida da aplicação (veja
+    `fabr.aplicacao.criar_contexto`) e não guardado em cache como
+    `criar_motor`.
+    """
+    url = criar_url(config=config)
+    logger.debug('Criando motor assíncrono de conexão ao banco de dados')
+    return sqlalchemy.ext.asyncio.create_async_engine(
+        url,
+        pool_size=config.banco.conexoes,
+        max_overflow=2,
+        pool_timeout=5,
+    )
+
+
+async def sessao_assincrona_deps(
+    requisicao: fastapi.Request,
+) -> AsyncIterator[AsyncSession]:
+    async with requisicao.app.state.contexto.sessoes_assincronas() as sessao:
+        yield sessao
+
+
+SessaoAssincrona = Annotated[
+    AsyncSession,
+    fastapi.Depends(sessao_assincrona_deps),
+]
+
+
+@functools.cache
+def criar_hasher(config: fabr.ambiente.Config) -> argon2.PasswordHasher:
+    return argon2.PasswordHasher(
+        time_cost=config.senha_tempo,
+        memory_cost=config.senha_memoria,
+        parallelism=config.senha_paralelismo,
+    )
+
+
+@functools.cache
+def criar_executor_de_senhas(
+    config: fabr.ambiente.Config,
+) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Executor exclusivo para gerar e verificar hashes de senhas.
+
+    Cada hash argon2 usa SENHA_MEMORIA_KB de memória e bastante cpu, então
+    no máximo SENHA_SIMULTANEAS são calculados ao mesmo tempo. Uma rajada
+    de logins espera na fila deste executor em vez de ocupar as threads e a
+    memória das demais requisições.
+    """
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.senha_simultaneas,
+        thread_name_prefix='senhas',
+    )
+
+
+async def executar_senha(
+    config: fabr.ambiente.Config,
+    funcao: Callable[P, T],
+    /,
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        criar_executor_de_senhas(config),
+        functools.partial(funcao, *args, **kwargs),
+    )
+
+
 convencao_de_nomes = dict(
     ix='ix_%(column_0_label)s',
     uq='uq_%(table_name)s_%(column_0_name)s',
@@ -120,10 +221,17 @@ class Base(DeclarativeBase):
 
 
 class Comunidade(Base):
+    """
+    versao: int
+        Aumenta a cada alteração na lista de pessoas da comunidade, veja
+        `_atualizar_versoes`.
+    """
+
     __tablename__ = 'comunidade'
 
     id: Mapped[int] = mapped_column(primary_key=True)
     nome: Mapped[str] = mapped_column(String(100), index=True, unique=True)
+    versao: Mapped[int] = mapped_column(server_default='0')
     modelos: Mapped[list['Modelo']] = relationship(back_populates='comunidade')
 
     @classmethod
@@ -132,6 +240,12 @@ class Comunidade(Base):
         o = sessao.execute(stmt).scalars().one_or_none()
         return o
 
+    @classmethod
+    def buscar_versao(cls, sessao: Sessao, nome: str) -> int | None:
+        """Retorna só a versão da comunidade, sem carregar o resto."""
+        stmt = sa.select(cls.versao).where(cls.nome == nome)
+        return sessao.execute(stmt).scalar_one_or_none()
+
 
 class Usuaria(Base):
     """
@@ -156,9 +270,12 @@ class Usuaria(Base):
         nome: str,
         senha: str,
         teste: bool = False,  # NOQA: FBT001, FBT002
+        config: fabr.ambiente.Config | None = None,
     ) -> Self:
         if teste:
             ph = argon2.PasswordHasher(time_cost=3, memory_cost=100)
+        elif config is not None:
+            ph = criar_hasher(config)
         else:
             ph = argon2.PasswordHasher()
         hash_da_senha = ph.hash(senha)
@@ -172,6 +289,38 @@ class Usuaria(Base):
             return False
         return True
 
+    async def verificar_senha_assincrono(
+        self,
+        sessao: SessaoAssincrona,
+        config: fabr.ambiente.Config,
+        senha_dada: str,
+    ) -> bool:
+        """
+        Verifica a senha no executor de senhas, sem ocupar o event loop.
+
+        Se a senha confere mas o hash foi gerado com outros parâmetros de
+        custo, ele é refeito com os parâmetros atuais da config e gravado.
+        """
+        if not await executar_senha(config, self.verifica_senha, senha_dada):
+            return False
+        hasher = criar_hasher(config)
+        if hasher.check_needs_rehash(self.senha):
+            self.senha = await executar_senha(config, hasher.hash, senha_dada)
+            await sessao.commit()
+            logger.info(f'Hash da senha de {self.nome} refeito')
+        return True
+
+    @classmethod
+    async def buscar_assincrono(
+        cls,
+        sessao: SessaoAssincrona,
+        nome: str,
+    ) -> Self | None:
+        """Como `buscar`, numa sessão assíncrona."""
+        stmt = sa.select(cls).where(cls.nome == nome).where(cls.ativa == True)  # NOQA: E712
+        resultado = await sessao.execute(stmt)
+        return resultado.scalars().one_or_none()
+
     @classmethod
     def buscar(
         cls,
@@ -194,31 +343,34 @@ class Usuaria(Base):
         o = sessao.execute(stmt).scalars().one_or_none()
         return o
 
-    def organizadora(self, sessao: Sessao) -> list[Comunidade]:
-        """Retorna as comunidades onde a usuária é Organizadora."""
-        stmt = (
-            sa.select(Comunidade)
-            .join(Acesso)
-            .where(Acesso.usuaria_id == self.id)
-            .where(Acesso.tipo == 'organizadora')
-        )
-        comunidades = sessao.execute(stmt).scalars().all()
-        return list(comunidades)
+    def papeis(self, sessao: Sessao) -> dict[str, TipoDeAcesso]:
+        """
+        Retorna o tipo de acesso da usuária em cada comunidade, numa consulta.
 
-    def administradora(self, sessao: Sessao) -> list[Comunidade]:
-        """Retorna as comunidades onde a usuária é Administradora."""
+        As rotas não chamam este método: usam os papéis da credencial em
+        cache (veja `buscar_credencial`).
+        """
         stmt = (
-            sa.select(Comunidade)
+            sa.select(Comunidade.nome, Acesso.tipo)
             .join(Acesso)
             .where(Acesso.usuaria_id == self.id)
-            .where(Acesso.tipo == 'administradora')
         )
-        comunidades = sessao.execute(stmt).scalars().all()
-        return list(comunidades)
+        return dict(sessao.execute(stmt).tuples().all())
+
+
+class Membro(NamedTuple):
+    """Uma linha da lista de pessoas de uma comunidade."""
+
+    nome: str
+    ativa: bool
+    tipo: TipoDeAcesso
 
 
 class Acesso(Base):
     __tablename__ = 'acesso'
+    __table_args__ = (
+        sa.Index('ix_acesso_comunidade_id_tipo', 'comunidade_id', 'tipo'),
+    )
 
     usuaria_id: Mapped[int] = mapped_column(
         sa.ForeignKey('usuaria.id'),
@@ -230,6 +382,156 @@ class Acesso(Base):
     )
     tipo: Mapped[TipoDeAcesso] = mapped_column(String(100), index=True)
 
+    @classmethod
+    def membros(
+        cls,
+        sessao: Sessao,
+        comunidade: str,
+        limite: int,
+        depois_de: tuple[str, str] | None = None,
+    ) -> list[Membro]:
+        """
+        Retorna uma página das pessoas com acesso à comunidade.
+
+        As pessoas são ordenadas por tipo de acesso e nome, e a página seguinte
+        começa depois do (tipo, nome) da última pessoa da anterior, então
+        nenhuma página lê as linhas das páginas anteriores.
+        """
+        stmt = (
+            sa.select(Usuaria.nome, Usuaria.ativa, cls.tipo)
+            .select_from(cls)
+            .join(Usuaria)
+            .join(Comunidade)
+            .where(Comunidade.nome == comunidade)
+            .order_by(cls.tipo, Usuaria.nome)
+            .limit(limite)
+        )
+        if depois_de is not None:
+            stmt = stmt.where(sa.tuple_(cls.tipo, Usuaria.nome) > depois_de)
+        return [Membro(*linha) for linha in sessao.execute(stmt)]
+
+
+def _mudou_a_lista(o: object) -> bool:
+    """Diz se a alteração muda as listas de pessoas das comunidades."""
+    if isinstance(o, Acesso):
+        return True
+    if not isinstance(o, Usuaria):
+        return False
+    campos = sa.inspect(o).attrs
+    return any(campos[c].history.has_changes() for c in ('nome', 'ativa'))
+
+
+@sa.event.listens_for(Session, 'after_flush')
+def _atualizar_versoes(
+    sessao: Session,
+    _contexto_do_flush: sa.orm.UOWTransaction,
+) -> None:
+    """
+    Aumenta a versão das comunidades cujas listas de pessoas mudaram.
+
+    A página da comunidade compara só a versão para responder 304, sem
+    consultar as pessoas. Valem as alterações feitas pelo ORM, em qualquer
+    processo; as feitas diretamente no banco precisam aumentar a versão.
+    """
+    alterados = [
+        o
+        for o in [*sessao.new, *sessao.dirty, *sessao.deleted]
+        if _mudou_a_lista(o)
+    ]
+    if not alterados:
+        return
+    ids = {o.comunidade_id for o in alterados if isinstance(o, Acesso)}
+    usuarias = [o.id for o in alterados if isinstance(o, Usuaria)]
+    das_usuarias = sa.select(Acesso.comunidade_id).where(
+        Acesso.usuaria_id.in_(usuarias)
+    )
+    stmt = (
+        sa.update(Comunidade)
+        .where(Comunidade.id.in_(ids) | Comunidade.id.in_(das_usuarias))
+        .values(versao=Comunidade.versao + 1)
+    )
+    sessao.execute(stmt)
+
+
+class Credencial(NamedTuple):
+    """
+    usuaria: Usuaria
+        pessoa usuária autenticada, desanexada de qualquer sessão
+
+    papeis: dict[str, TipoDeAcesso]
+        tipo de acesso da usuária em cada comunidade
+    """
+
+    usuaria: Usuaria
+    papeis: dict[str, TipoDeAcesso]
+
+
+def _invalidar_credenciais(
+    cache: fabr.cache.CacheLRU[str, Credencial],
+    sessao: Session,
+    _contexto_do_flush: sa.orm.UOWTransaction,
+) -> None:
+    alterados = [*sessao.new, *sessao.dirty, *sessao.deleted]
+    if any(isinstance(o, Usuaria | Acesso | Comunidade) for o in alterados):
+        cache.limpar()
+
+
+@functools.cache
+def criar_cache_de_credenciais(
+    config: fabr.ambiente.Config,
+) -> fabr.cache.CacheLRU[str, Credencial]:
+    """
+    Cache das credenciais das pessoas usuárias autenticadas.
+
+    É esvaziado sempre que uma sessão deste processo grava alterações em
+    usuárias, acessos ou comunidades. Alterações feitas por outros processos
+    só aparecem quando a entrada expira, depois de LOGIN_VALIDADE segundos.
+    """
+    cache: fabr.cache.CacheLRU[str, Credencial] = fabr.cache.CacheLRU(
+        tamanho_maximo=config.login_cache,
+        validade=config.login_validade,
+    )
+    sa.event.listen(
+        Session,
+        'after_flush',
+        functools.partial(_invalidar_credenciais, cache),
+    )
+    return cache
+
+
+def _desanexar(usuaria: Usuaria) -> Usuaria:
+    """Cria uma cópia da usuária, desanexada, para ser guardada em cache."""
+    colunas = sa.inspect(Usuaria).column_attrs
+    copia = Usuaria(**{c.key: getattr(usuaria, c.key) for c in colunas})
+    sa.orm.make_transient_to_detached(copia)
+    return copia
+
+
+def buscar_credencial(
+    sessao: Sessao,
+    config: fabr.ambiente.Config,
+    nome: str,
+) -> Credencial | None:
+    """
+    Retorna a credencial da pessoa usuária ativa, do cache se possível.
+
+    A usuária da credencial é compartilhada entre requisições: use
+    `sessao.merge(credencial.usuaria, load=False)` para obter uma cópia
+    na sessão da requisição, sem consultar o banco.
+    """
+    cache = criar_cache_de_credenciais(config)
+    credencial = cache.obter(nome)
+    if credencial is None:
+        usuaria = Usuaria.buscar(sessao=sessao, nome=nome)
+        if usuaria is None:
+            return None
+        credencial = Credencial(
+            usuaria=_desanexar(usuaria),
+            papeis=usuaria.papeis(sessao),
+        )
+        cache.guardar(nome, credencial)
+    return credencial
+
 
 class Modelo(Base):
     """
@@ -241,8 +543,9 @@ class Modelo(Base):
         hash de 16 caracteres do html do certificado
         hexdigest da função blake2b com 64 bits (digest_size=8)
 
-    htmlzip: str
-        html zipado para renderizar o certificado
+    htmlzip: bytes
+        html comprimido para renderizar o certificado (veja `_comprimir`)
+        Não é carregado junto com o modelo, só quando acessado.
 
     comunidade: Comunidade
         a comunidade emissora do certificado
@@ -254,7 +557,7 @@ class Modelo(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     nome: Mapped[str] = mapped_column(String(100))
     resumo: Mapped[str] = mapped_column(index=True)
-    htmlzip: Mapped[str] = mapped_column(String(1024 * 100))
+    htmlzip: Mapped[bytes] = mapped_column(sa.LargeBinary, deferred=True)
     comunidade_id: Mapped[int] = mapped_column(
         sa.ForeignKey('comunidade.id'),
         index=True,
@@ -279,8 +582,7 @@ class Modelo(Base):
         return o
 
 
-def gerar_qrcode(s: str) -> str:
-    # the mimetype is "image/png"
+def _criar_qrcode(s: str) -> qrcode.QRCode:  # type: ignore[type-arg]
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -288,6 +590,13 @@ def gerar_qrcode(s: str) -> str:
         border=4,
     )
     qr.add_data(s)
+    return qr
+
+
+@functools.lru_cache(maxsize=1024)
+def gerar_qrcode(s: str) -> str:
+    # the mimetype is "image/png"
+    qr = _criar_qrcode(s)
     img_obj = qr.make_image(fill_color='black', back_color='white')
 
     img_io = io.BytesIO()
@@ -299,20 +608,164 @@ def gerar_qrcode(s: str) -> str:
     return img_base64_str
 
 
-def _comprimir(s: str) -> str:
-    raw_bytes = s.encode('utf8')
-    z_bytes = zlib.compress(raw_bytes)
-    z_b64 = base64.b64encode(z_bytes)
-    z_str = z_b64.decode('utf8')
-    return z_str
+@functools.lru_cache(maxsize=1024)
+def gerar_qrcode_svg(s: str) -> str:
+    """
+    Gera o qrcode como um elemento <svg>, para ser incluído direto no html.
 
+    Cada sequência de módulos escuros de uma linha vira um retângulo de um
+    único <path>: não há imagem a codificar, e o weasyprint desenha o
+    qrcode como vetor, sem decodificar um png. Os módulos são os mesmos do
+    qrcode em png (veja `gerar_qrcode`), inclusive a máscara escolhida.
+    """
+    qr = _criar_qrcode(s)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()
+    retangulos = []
+    for y, linha in enumerate(matriz):
+        x = 0
+        for escuro, grupo in itertools.groupby(linha):
+            n = len(list(grupo))
+            if escuro:
+                retangulos.append(f'M{x} {y}h{n}v1h-{n}z')
+            x += n
+    lado = len(matriz)
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" class="qrcode"'
+        f' viewBox="0 0 {lado} {lado}" width="{lado * qr.box_size}"'
+        f' height="{lado * qr.box_size}" shape-rendering="crispEdges">'
+        '<rect width="100%" height="100%" fill="white"/>'
+        f'<path d="{"".join(retangulos)}"/></svg>'
+    )
 
-def _descomprimir(s: str) -> str:
-    z_b64 = s.encode('utf8')
-    z_bytes = base64.b64decode(z_b64)
-    raw_bytes = zlib.decompress(z_bytes)
-    s = raw_bytes.decode('utf8')
-    return s
+
+def gerar_qrcodes(
+    urls: Iterable[str],
+    gerar: Callable[[str], str] = gerar_qrcode_svg,
+) -> dict[str, str]:
+    """
+    Gera os qrcodes de muitas urls de uma vez, como na emissão em lote.
+
+    Cada url distinta é gerada uma só vez, sem passar pela memória de
+    `gerar`: ela serve às renderizações avulsas, e os milhares de códigos
+    de um lote, usados uma vez cada, só expulsariam uns aos outros dela.
+    """
+    gerar = getattr(gerar, '__wrapped__', gerar)
+    return {url: gerar(url) for url in dict.fromkeys(urls)}
+
+
+# o html dos modelos é guardado comprimido com zlib, usando como dicionário
+# um modelo típico: os modelos têm muito em comum (a estrutura do html, o css
+# de página, as variáveis do sistema), então mesmo um modelo pequeno já
+# encontra no dicionário a maior parte do que repete. O primeiro byte indica
+# o formato; o dicionário de um formato nunca muda, um dicionário novo seria
+# um formato novo
+FORMATO_ZLIB_COM_DICIONARIO = 1
+DICIONARIO_DOS_MODELOS = (
+    Path(__file__).parent / 'dicionario-dos-modelos.html'
+).read_bytes()
+
+
+def _comprimir(s: str) -> bytes:
+    compressor = zlib.compressobj(level=9, zdict=DICIONARIO_DOS_MODELOS)
+    z_bytes = compressor.compress(s.encode('utf8')) + compressor.flush()
+    return bytes([FORMATO_ZLIB_COM_DICIONARIO]) + z_bytes
+
+
+def _descomprimir(dados: bytes) -> str:
+    formato, z_bytes = dados[0], dados[1:]
+    if formato != FORMATO_ZLIB_COM_DICIONARIO:
+        msg = f'Formato de html comprimido desconhecido: {formato}'
+        raise ValueError(msg)
+    descompressor = zlib.decompressobj(zdict=DICIONARIO_DOS_MODELOS)
+    raw_bytes = descompressor.decompress(z_bytes) + descompressor.flush()
+    return raw_bytes.decode('utf8')
+
+
+ALFABETO_DOS_CODIGOS = (
+    'abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+)
+TAMANHO_DOS_CODIGOS = 12
+
+# campos do conteudo usados pela busca das pessoas participantes (veja
+# `Certificado.procurar_assincrono`): o email, que encontra os certificados
+# num índice do email em minúsculas, e o nome, mostrado nos resultados
+CAMPO_DO_NOME = 'titular'
+CAMPO_DO_EMAIL = 'email'
+
+# traduz cada byte aleatório para um caractere do alfabeto; os bytes acima
+# do maior múltiplo do tamanho do alfabeto são descartados para não criar viés
+_limite = 256 - 256 % len(ALFABETO_DOS_CODIGOS)
+_tabela = bytes(
+    ord(ALFABETO_DOS_CODIGOS[b % len(ALFABETO_DOS_CODIGOS)])
+    for b in range(256)
+)
+_descartados = bytes(range(_limite, 256))
+
+
+def gerar_codigos(n: int) -> list[str]:
+    """
+    Gera `n` códigos de certificado distintos entre si.
+
+    Os bytes de todos os códigos são obtidos de uma vez do gerador
+    criptográfico do sistema e traduzidos para o alfabeto dos códigos.
+    """
+    codigos: dict[str, None] = {}
+    while len(codigos) < n:
+        faltam = n - len(codigos)
+        # sobra de 25% para compensar os bytes descartados
+        brutos = secrets.token_bytes(faltam * TAMANHO_DOS_CODIGOS * 5 // 4)
+        caracteres = brutos.translate(_tabela, _descartados).decode('ascii')
+        for i in range(0, len(caracteres), TAMANHO_DOS_CODIGOS):
+            codigo = caracteres[i : i + TAMANHO_DOS_CODIGOS]
+            if len(codigo) == TAMANHO_DOS_CODIGOS and len(codigos) < n:
+                codigos[codigo] = None
+    return list(codigos)
+
+
+def calcular_chave(  # NOQA: PLR0913
+    config: fabr.ambiente.Config,
+    resumo: str,
+    emissora: str,
+    conteudo: Conteudo,
+    data: dt.date,
+    codigo: str,
+) -> str:
+    """Veja `Certificado.chave`."""
+    dados = json.dumps(
+        [
+            resumo,
+            emissora,
+            conteudo,
+            data.isoformat(),
+            codigo,
+            config.url_base,
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    r = hashlib.blake2b(dados.encode('utf8'), digest_size=16).hexdigest()
+    return r
+
+
+class Encontrado(NamedTuple):
+    """Um certificado encontrado pela busca das pessoas participantes."""
+
+    id: int
+    codigo: str
+    data: dt.date
+    titular: str | None
+    modelo: str
+    emissora: str
+
+
+def _campo_do_conteudo(campo: str) -> sa.ColumnElement[str]:
+    # o nome do campo vai escrito no sql, e não como parâmetro: um índice
+    # de uma expressão como conteudo ->> 'email' só é usado por consultas
+    # com a mesma expressão, e um plano preparado não conhece o parâmetro
+    chave = sa.literal(campo, literal_execute=True)
+    valor: sa.ColumnElement[str] = Certificado.conteudo[chave].astext
+    return valor
 
 
 class Certificado(Base):
@@ -334,29 +787,101 @@ class Certificado(Base):
     conteudo: Conteudo
         Quase um JSON. Permite incluir campos customizados no certificado.
         Por exemplo: titulo_da_palestra, duração, cpf, etc...
+        Guardado como jsonb, com um índice do email (veja
+        `procurar_assincrono`).
     """
 
     __tablename__ = 'certificado'
+    __table_args__ = (
+        sa.Index(
+            'ix_certificado_email',
+            sa.text(f"lower(conteudo ->> '{CAMPO_DO_EMAIL}')"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     codigo: Mapped[str] = mapped_column(String(12), index=True, unique=True)
-    modelo_id: Mapped[int] = mapped_column(ForeignKey('modelo.id'))
+    modelo_id: Mapped[int] = mapped_column(
+        ForeignKey('modelo.id'),
+        index=True,
+    )
     modelo: Mapped[Modelo] = relationship()
     data: Mapped[dt.date] = mapped_column(index=True)
-    conteudo: Mapped[Conteudo] = mapped_column(sa.JSON)
+    conteudo: Mapped[Conteudo] = mapped_column(
+        sa.dialects.postgresql.JSONB,
+    )
 
     @classmethod
     def novo(cls, modelo: Modelo, data: dt.date, conteudo: Conteudo) -> Self:
-        car = 'abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ23456789'
-        codigo = ''.join(random.choices(car, k=12))  # NOQA: S311
         o = cls(
-            codigo=codigo,
+            codigo=gerar_codigos(1)[0],
             modelo=modelo,
             data=data,
             conteudo=conteudo,
         )
         return o
 
+    @classmethod
+    def emitir(
+        cls,
+        sessao: Sessao,
+        modelo: Modelo,
+        data: dt.date,
+        conteudos: Sequence[Conteudo],
+    ) -> list[str]:
+        """
+        Emite um certificado para cada conteudo e retorna os seus códigos.
+
+        As linhas são inseridas com INSERTs de várias linhas de uma vez, sem
+        criar um objeto por certificado. Códigos que colidem com códigos já
+        existentes são ignorados pelo banco (ON CONFLICT DO NOTHING) e apenas
+        eles são gerados de novo, então a transação nunca é abortada por uma
+        colisão. Cada certificado emitido entra na fila de pré-renderização
+        (veja `Tarefa`). Não faz commit.
+        """
+        if not conteudos:
+            return []
+
+        codigos = gerar_codigos(len(conteudos))
+        pendentes = list(range(len(conteudos)))
+        ids: list[int] = []
+        stmt = (
+            sa.dialects.postgresql.insert(cls)
+            .on_conflict_do_nothing(index_elements=[cls.codigo])
+            .returning(cls.id, cls.codigo)
+        )
+
+        for _ in range(10):
+            linhas = [
+                dict(
+                    codigo=codigos[i],
+                    modelo_id=modelo.id,
+                    data=data,
+                    conteudo=conteudos[i],
+                )
+                for i in pendentes
+            ]
+            # id -> código dos certificados que não colidiram
+            inseridos = dict(sessao.execute(stmt, linhas).tuples().all())
+            ids.extend(inseridos)
+            inseridos_codigos = set(inseridos.values())
+            pendentes = [
+                i for i in pendentes if codigos[i] not in inseridos_codigos
+            ]
+            if not pendentes:
+                break
+            logger.info(f'{len(pendentes)} códigos colidiram, gerando outros')
+            novos = gerar_codigos(len(pendentes))
+            for i, codigo in zip(pendentes, novos, strict=True):
+                codigos[i] = codigo
+        else:
+            msg = 'não foi possível gerar códigos únicos'
+            raise RuntimeError(msg)
+
+        Tarefa.enfileirar(sessao, ids)
+        logger.debug(f'{len(codigos)} certificados emitidos')
+        return codigos
+
     @classmethod
     def buscar(cls, sessao: Sessao, codigo: str) -> Self | None:
         stmt = sa.select(cls).where(cls.codigo == codigo)
@@ -366,34 +891,319 @@ class Certificado(Base):
             cert = None
         return cert
 
-    def to_pdf(self, config: fabr.ambiente.Config) -> bytes:
-        url_validacao = urljoin(config.url_base, 'v/' + self.codigo)
-        qrcode = gerar_qrcode(url_validacao)
+    @classmethod
+    async def buscar_assincrono(
+        cls,
+        sessao: SessaoAssincrona,
+        codigo: str,
+    ) -> Self | None:
+        """
+        Como `buscar`, numa sessão assíncrona, para a validação e o download.
+
+        Uma única consulta traz o certificado, o resumo do modelo e o nome da
+        comunidade, que é tudo o que a chave, o contexto e a página usam;
+        uma sessão assíncrona não carregaria os relacionamentos sob demanda.
+        Do modelo e da comunidade só essas colunas são lidas, e o html só é
+        carregado por `carregar_html_assincrono`, se for preciso renderizar.
+        """
+        modelo = sa.orm.joinedload(cls.modelo).load_only(Modelo.resumo)
+        stmt = (
+            sa.select(cls)
+            .where(cls.codigo == codigo)
+            .options(
+                modelo.joinedload(Modelo.comunidade).load_only(Comunidade.nome)
+            )
+        )
+        resultado = await sessao.execute(stmt)
+        return resultado.scalars().one_or_none()
 
+    async def carregar_html_assincrono(
+        self,
+        sessao: SessaoAssincrona,
+    ) -> None:
+        """Carrega o html do modelo, antes de renderizar o certificado."""
+        await sessao.refresh(self.modelo, attribute_names=['htmlzip'])
+
+    @classmethod
+    def listar(
+        cls,
+        sessao: Sessao,
+        modelo_id: int,
+        limite: int,
+        data: dt.date | None = None,
+        depois_de: int | None = None,
+    ) -> list[Self]:
+        """
+        Retorna uma página dos certificados do modelo, opcionalmente apenas
+        de uma data.
+
+        Os certificados são ordenados pelo id, e a página seguinte começa
+        depois do id do último certificado da anterior. O modelo, com o html
+        e a comunidade, é carregado junto, uma vez por página, então os
+        certificados podem ser usados depois de a sessão ser fechada.
+        """
+        stmt = (
+            sa.select(cls)
+            .where(cls.modelo_id == modelo_id)
+            .order_by(cls.id)
+            .limit(limite)
+            .options(
+                sa.orm.selectinload(cls.modelo).options(
+                    sa.orm.undefer(Modelo.htmlzip),
+                    sa.orm.joinedload(Modelo.comunidade),
+                )
+            )
+        )
+        if data is not None:
+            stmt = stmt.where(cls.data == data)
+        if depois_de is not None:
+            stmt = stmt.where(cls.id > depois_de)
+        return list(sessao.scalars(stmt))
+
+    def chave(self, config: fabr.ambiente.Config) -> str:
+        """
+        Retorna um resumo de tudo o que determina o certificado renderizado.
+
+        Certificados não mudam depois de emitidos, então a chave identifica
+        unicamente os bytes gerados por `to_pdf` e pode ser usada como chave
+        de cache.
+        """
+        return calcular_chave(
+            config=config,
+            resumo=self.modelo.resumo,
+            emissora=self.modelo.comunidade.nome,
+            conteudo=self.conteudo,
+            data=self.data,
+            codigo=self.codigo,
+        )
+
+    @classmethod
+    def chaves(cls, sessao: Sessao, config: fabr.ambiente.Config) -> set[str]:
+        """
+        Retorna a chave de todos os certificados.
+
+        Só as colunas usadas pela chave são lidas, aos poucos, através de um
+        cursor no servidor.
+        """
+        stmt = (
+            sa.select(
+                Modelo.resumo,
+                Comunidade.nome,
+                cls.conteudo,
+                cls.data,
+                cls.codigo,
+            )
+            .join(cls.modelo)
+            .join(Modelo.comunidade)
+            .execution_options(yield_per=1000)
+        )
+        return {
+            calcular_chave(config, *linha) for linha in sessao.execute(stmt)
+        }
+
+    @classmethod
+    async def procurar_assincrono(
+        cls,
+        sessao: SessaoAssincrona,
+        email: str,
+        limite: int,
+        depois_de: int | None = None,
+    ) -> list[Encontrado]:
+        """
+        Procura os certificados emitidos para um email.
+
+        O email é comparado inteiro, sem diferenciar maiúsculas, pelo índice
+        do email em minúsculas. Não há busca por parte do nome ou do email:
+        o código de um certificado é o que protege a sua página, então só
+        quem sabe o email encontra os certificados dele. Os certificados são
+        ordenados pelo id, e a página seguinte começa depois do id do último
+        certificado da anterior.
+        """
+        filtro = sa.func.lower(_campo_do_conteudo(CAMPO_DO_EMAIL))
+        stmt = (
+            sa.select(
+                cls.id,
+                cls.codigo,
+                cls.data,
+                _campo_do_conteudo(CAMPO_DO_NOME),
+                Modelo.nome,
+                Comunidade.nome,
+            )
+            .join(cls.modelo)
+            .join(Modelo.comunidade)
+            .where(filtro == email.lower())
+            .order_by(cls.id)
+            .limit(limite)
+        )
+        if depois_de is not None:
+            stmt = stmt.where(cls.id > depois_de)
+        resultado = await sessao.execute(stmt)
+        return [Encontrado(*linha) for linha in resultado]
+
+    def contexto(self, config: fabr.ambiente.Config) -> Conteudo:
+        """
+        Retorna o contexto para renderizar o modelo deste certificado.
+
+        O qrcode não faz parte do contexto: ele é gerado a partir da
+        `url_validacao` no momento da renderização.
+        """
+        url_validacao = urljoin(config.url_base, 'v/' + self.codigo)
         contexto = {
             **self.conteudo,
-            'qrcode': qrcode,
             'url_validacao': url_validacao,
             'emissora': self.modelo.comunidade.nome,
             'data': self.data,
         }
+        return contexto
 
-        html_modelo = _descomprimir(self.modelo.htmlzip)
-        html_final = Template(html_modelo).render(contexto)
-
-        pdf_bytes = bytes(
-            weasyprint.HTML(string=html_final).write_pdf(  # type: ignore[no-untyped-call]
-                target=None,
-                pdf_variant='pdf/a-3u',
-            )
+    def to_pdf(self, config: fabr.ambiente.Config) -> bytes:
+        pdf_bytes = fabr.renderizacao.executar(
+            config,
+            fabr.renderizacao.gerar_pdf,
+            config=config,
+            resumo=self.modelo.resumo,
+            htmlzip=self.modelo.htmlzip,
+            contexto=self.contexto(config),
         )
         return pdf_bytes
 
     def to_png(self, config: fabr.ambiente.Config) -> str:
         pdf_bytes = self.to_pdf(config=config)
-        doc = pymupdf.Document(stream=pdf_bytes)  # type: ignore[no-untyped-call]
-        pagina = next(iter(doc))
-        pixels = pagina.get_pixmap()  # type: ignore[attr-defined]
-        png_bytes = pixels.tobytes(output='png')
+        png_bytes = fabr.renderizacao.pdf_para_png(pdf_bytes)
         b64_str = base64.b64encode(png_bytes).decode('utf8')
         return b64_str
+
+
+class Tarefa(Base):
+    """
+    Pré-renderização pendente de um certificado recém emitido.
+
+    As tarefas são consumidas pelos trabalhadores de `fabr.fila`, que
+    renderizam o pdf e as prévias antes da primeira visita ao certificado.
+    Uma tarefa concluída é apagada; uma que falhou é adiada.
+
+    tentativas: int
+        quantas vezes a renderização já falhou
+
+    disponivel_em: dt.datetime
+        a partir de quando a tarefa pode ser executada
+
+    erro: str | None
+        mensagem da última falha
+    """
+
+    __tablename__ = 'tarefa'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    certificado_id: Mapped[int] = mapped_column(
+        ForeignKey('certificado.id', ondelete='CASCADE'),
+        unique=True,
+    )
+    certificado: Mapped[Certificado] = relationship()
+    tentativas: Mapped[int] = mapped_column(server_default='0')
+    disponivel_em: Mapped[dt.datetime] = mapped_column(
+        sa.DateTime(timezone=True),
+        server_default=sa.func.now(),
+        index=True,
+    )
+    erro: Mapped[str | None] = mapped_column(sa.Text)
+
+    @classmethod
+    def enfileirar(
+        cls, sessao: Sessao, certificado_ids: Iterable[int]
+    ) -> None:
+        linhas = [dict(certificado_id=i) for i in certificado_ids]
+        if not linhas:
+            return
+        stmt = sa.dialects.postgresql.insert(cls).on_conflict_do_nothing(
+            index_elements=[cls.certificado_id],
+        )
+        sessao.execute(stmt, linhas)
+
+    @classmethod
+    def reivindicar(
+        cls,
+        sessao: Sessao,
+        lote: int,
+        tentativas: int,
+    ) -> list[Self]:
+        """
+        Trava e retorna até `lote` tarefas disponíveis.
+
+        As tarefas travadas por outro trabalhador são puladas (SKIP LOCKED),
+        então vários trabalhadores consomem a fila sem disputar as mesmas
+        linhas. A trava dura até o fim da transação, e é liberada pelo banco
+        se o trabalhador morrer no meio. Tarefas que já falharam `tentativas`
+        vezes ficam na tabela, para consulta, mas não são mais executadas.
+        """
+        stmt = (
+            sa.select(cls)
+            .where(
+                cls.tentativas < tentativas,
+                cls.disponivel_em <= sa.func.now(),
+            )
+            .order_by(cls.disponivel_em, cls.id)
+            .limit(lote)
+            .with_for_update(skip_locked=True, of=cls)
+            .options(
+                sa.orm.joinedload(cls.certificado)
+                .joinedload(Certificado.modelo)
+                .joinedload(Modelo.comunidade),
+            )
+        )
+        return list(sessao.scalars(stmt))
+
+    def adiar(self, erro: Exception, espera: dt.timedelta) -> None:
+        self.tentativas += 1
+        self.erro = repr(erro)
+        self.disponivel_em = sa.func.now() + espera
+
+
+class ConteudoDoArtefato(Base):
+    """
+    Bytes de um arquivo renderizado, guardados uma única vez.
+
+    resumo: str
+        hash de 32 caracteres dos bytes
+        hexdigest da função blake2b com 128 bits (digest_size=16)
+    """
+
+    __tablename__ = 'conteudo_do_artefato'
+
+    resumo: Mapped[str] = mapped_column(String(32), primary_key=True)
+    dados: Mapped[bytes] = mapped_column(sa.LargeBinary)
+    tamanho: Mapped[int] = mapped_column()
+    criado_em: Mapped[dt.datetime] = mapped_column(
+        sa.DateTime(timezone=True),
+        server_default=sa.func.now(),
+    )
+
+
+class Artefato(Base):
+    """
+    Arquivo renderizado guardado no banco (veja fabr.artefatos).
+
+    nome: str
+        nome do arquivo no cache, a chave do certificado mais a extensão
+
+    tempo: float | None
+        tempo gasto para renderizar, em segundos
+
+    versao: str
+        versão do renderizador que gerou o arquivo
+    """
+
+    __tablename__ = 'artefato'
+
+    nome: Mapped[str] = mapped_column(String(100), primary_key=True)
+    resumo: Mapped[str] = mapped_column(
+        ForeignKey('conteudo_do_artefato.resumo'),
+        index=True,
+    )
+    conteudo: Mapped[ConteudoDoArtefato] = relationship()
+    tempo: Mapped[float | None] = mapped_column()
+    versao: Mapped[str] = mapped_column(String(100))
+    criado_em: Mapped[dt.datetime] = mapped_column(
+        sa.DateTime(timezone=True),
+        server_default=sa.func.now(),
+    )
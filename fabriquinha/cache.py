@@ -0,0 +1,387 @@
+import functools
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from pathlib import Path
+from typing import Generic, NamedTuple, Protocol, TypeVar
+
+import fabriquinha as fabr
+
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+def escrever(arquivo: Path, dados: bytes) -> os.stat_result:
+    """
+    Escreve os dados no arquivo, criando o diretório se preciso.
+
+    Escreve num arquivo temporário e renomeia, para que leitores (inclusive
+    de outros processos) nunca vejam um arquivo incompleto. Os temporários
+    começam com um ponto, e quem lista o diretório deve ignorá-los. Retorna
+    o estado do arquivo escrito, que a renomeação não altera.
+    """
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=arquivo.parent, prefix='.')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(dados)
+        f.flush()
+        estado = os.fstat(f.fileno())
+    Path(temporario).replace(arquivo)
+    return estado
+
+
+class CacheLRU(Generic[K, V]):
+    """
+    Cache em memória, seguro entre threads, limitado a `tamanho_maximo`.
+
+    Com `validade`, em segundos, as entradas expiram depois desse tempo. Com
+    `medir`, que dá o tamanho de cada valor (em bytes, por exemplo), o limite
+    é a soma dos tamanhos, e não o número de entradas.
+    """
+
+    def __init__(
+        self,
+        tamanho_maximo: int,
+        validade: float | None = None,
+        medir: Callable[[V], int] | None = None,
+    ) -> None:
+        self.tamanho_maximo = tamanho_maximo
+        self.validade = validade
+        self.medir = medir
+        self.acertos = 0
+        self.falhas = 0
+        self._trava = threading.Lock()
+        # cada entrada guarda o instante em que expira, ou None, e o tamanho
+        self._entradas: OrderedDict[K, tuple[float | None, int, V]] = (
+            OrderedDict()
+        )
+        self._tamanho = 0
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    @property
+    def tamanho(self) -> int:
+        """Soma do tamanho das entradas (o número delas, sem `medir`)."""
+        return self._tamanho
+
+    def obter(self, chave: K) -> V | None:
+        with self._trava:
+            try:
+                expira, _, valor = self._entradas[chave]
+            except KeyError:
+                self.falhas += 1
+                return None
+            if expira is not None and expira <= time.monotonic():
+                self._esquecer(chave)
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(
+        self,
+        chave: K,
+        valor: V,
+        validade: float | None = None,
+    ) -> None:
+        """Guarda o valor; `validade` substitui a validade do cache."""
+        validade = self.validade if validade is None else validade
+        expira = None if validade is None else time.monotonic() + validade
+        tamanho = 1 if self.medir is None else self.medir(valor)
+        with self._trava:
+            self._esquecer(chave)
+            if tamanho > self.tamanho_maximo:
+                return
+            self._entradas[chave] = (expira, tamanho, valor)
+            self._tamanho += tamanho
+            while self._tamanho > self.tamanho_maximo:
+                _, (_, descartado, _) = self._entradas.popitem(last=False)
+                self._tamanho -= descartado
+
+    def _esquecer(self, chave: K) -> None:
+        entrada = self._entradas.pop(chave, None)
+        if entrada is not None:
+            self._tamanho -= entrada[1]
+
+    def obter_ou_gerar(self, chave: K, gerar: Callable[[], V]) -> V:
+        valor = self.obter(chave)
+        if valor is None:
+            valor = gerar()
+            self.guardar(chave, valor)
+        return valor
+
+    def remover(self, chave: K) -> None:
+        with self._trava:
+            self._esquecer(chave)
+
+    def limpar(self) -> None:
+        with self._trava:
+            self._entradas.clear()
+            self._tamanho = 0
+
+
+class Armazem(Protocol):
+    """Armazenamento compartilhado por trás do cache (veja fabr.artefatos)."""
+
+    def obter(self, nome: str) -> bytes | None: ...
+
+    def guardar(
+        self, nome: str, dados: bytes, tempo: float | None
+    ) -> None: ...
+
+
+class Arquivo(NamedTuple):
+    """
+    caminho: Path
+
+    estado: os.stat_result
+        do arquivo no momento da consulta; a data de modificação é a da
+        escrita, e a de acesso, a do último uso
+
+    resumo: str
+        hash dos bytes do arquivo (veja fabr.artefatos.resumir)
+    """
+
+    caminho: Path
+    estado: os.stat_result
+    resumo: str
+
+
+def _identidade(estado: os.stat_result) -> tuple[int, int]:
+    # um arquivo reescrito é outro inode, com outra data de modificação
+    return estado.st_ino, estado.st_mtime_ns
+
+
+class CacheEmDisco:
+    """
+    Cache persistente de bytes em disco com política de descarte LRU.
+
+    Cada entrada é um arquivo cujo nome é a própria chave. As chaves devem
+    ser derivadas do conteúdo (hashes), assim uma entrada nunca precisa ser
+    invalidada: ela apenas deixa de ser usada e é descartada quando o cache
+    ultrapassa `tamanho_maximo` bytes.
+
+    A ordem de uso é mantida em memória e também na data de acesso dos
+    arquivos, para sobreviver a reinicializações do processo. A data de
+    modificação fica sendo a da escrita de cada arquivo.
+
+    Com um `armazem`, o que é guardado também vai para ele, e uma entrada
+    que não está no disco é buscada nele antes de ser dada como ausente.
+    Assim vários processos ou máquinas compartilham o que já foi gerado.
+    Uma falha do armazém não é uma falha do cache: ela é registrada e o
+    cache segue só com o disco.
+    """
+
+    def __init__(
+        self,
+        diretorio: str | Path,
+        tamanho_maximo: int,
+        armazem: Armazem | None = None,
+    ) -> None:
+        self.diretorio = Path(diretorio)
+        self.tamanho_maximo = tamanho_maximo
+        self.armazem = armazem
+        self.acertos = 0
+        self.falhas = 0
+        self._trava = threading.Lock()
+        self._entradas: OrderedDict[str, int] = OrderedDict()
+        self._tamanho = 0
+        # resumo dos bytes de cada arquivo, pela identidade do arquivo
+        self._resumos: dict[str, tuple[tuple[int, int], str]] = {}
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self._carregar()
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    @property
+    def tamanho(self) -> int:
+        """Soma do tamanho, em bytes, de todas as entradas do cache."""
+        return self._tamanho
+
+    def _arquivo(self, chave: str) -> Path:
+        return self.diretorio / chave[:2] / chave
+
+    def _carregar(self) -> None:
+        """Indexa os arquivos já presentes no diretório, do mais antigo."""
+        arquivos = [
+            (a.stat().st_atime, a.name, a.stat().st_size)
+            for a in self.diretorio.glob('*/*')
+            if a.is_file() and not a.name.startswith('.')
+        ]
+        with self._trava:
+            for _, chave, tamanho in sorted(arquivos):
+                self._entradas[chave] = tamanho
+                self._tamanho += tamanho
+            self._descartar()
+        logger.debug(f'Cache em disco carregado com {len(arquivos)} entradas')
+
+    def _descartar(self) -> None:
+        """Remove as entradas menos usadas até caber no tamanho máximo."""
+        while self._tamanho > self.tamanho_maximo and self._entradas:
+            chave, tamanho = self._entradas.popitem(last=False)
+            self._tamanho -= tamanho
+            self._resumos.pop(chave, None)
+            self._arquivo(chave).unlink(missing_ok=True)
+            logger.debug(f'Entrada {chave} descartada do cache em disco')
+
+    def _esquecer(self, chave: str) -> None:
+        tamanho = self._entradas.pop(chave, None)
+        if tamanho is not None:
+            self._tamanho -= tamanho
+        self._resumos.pop(chave, None)
+
+    def caminho(self, chave: str) -> Path | None:
+        """
+        Retorna o caminho do arquivo da entrada, ou None se ela não existe.
+
+        Conta como um acesso: a entrada passa a ser a mais recente.
+        """
+        arquivo = self._caminho_no_disco(chave)
+        if arquivo is None and self.armazem is not None:
+            dados = self._obter_do_armazem(chave)
+            if dados is not None:
+                arquivo = self._guardar_no_disco(chave, dados)
+        return arquivo
+
+    def consultar(self, chave: str) -> Arquivo | None:
+        """
+        Retorna o arquivo da entrada, ou None se ela não existe.
+
+        Conta como um acesso, como `caminho`. O resumo é o calculado quando
+        o cache escreveu o arquivo; o de um arquivo escrito antes de uma
+        reinicialização ou por outro processo é calculado uma vez, no
+        primeiro uso, e também fica guardado.
+        """
+        arquivo = self.caminho(chave)
+        if arquivo is None:
+            return None
+        try:
+            with arquivo.open('rb') as f:
+                estado = os.fstat(f.fileno())
+                with self._trava:
+                    guardado = self._resumos.get(chave)
+                if guardado is not None and guardado[0] == _identidade(estado):
+                    resumo = guardado[1]
+                else:
+                    resumo = fabr.artefatos.resumir(f.read())
+                    with self._trava:
+                        self._resumos[chave] = (_identidade(estado), resumo)
+        except FileNotFoundError:
+            # descartado por outro processo depois de encontrado
+            return None
+        return Arquivo(caminho=arquivo, estado=estado, resumo=resumo)
+
+    def _caminho_no_disco(self, chave: str) -> Path | None:
+        arquivo = self._arquivo(chave)
+        with self._trava:
+            try:
+                _usar(arquivo)
+                tamanho = arquivo.stat().st_size
+            except FileNotFoundError:
+                # a entrada pode ter sido descartada por outro processo
+                self._esquecer(chave)
+                self.falhas += 1
+                return None
+            if chave not in self._entradas:
+                # a entrada pode ter sido criada por outro processo
+                self._entradas[chave] = tamanho
+                self._tamanho += tamanho
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+        return arquivo
+
+    def obter(self, chave: str) -> bytes | None:
+        arquivo = self.caminho(chave)
+        if arquivo is None:
+            return None
+        try:
+            return arquivo.read_bytes()
+        except FileNotFoundError:
+            with self._trava:
+                self._esquecer(chave)
+            return None
+
+    def guardar(
+        self,
+        chave: str,
+        dados: bytes,
+        tempo: float | None = None,
+    ) -> Path:
+        """Guarda os dados; `tempo` é o tempo gasto para gerá-los."""
+        arquivo = self._guardar_no_disco(chave, dados)
+        if self.armazem is not None:
+            try:
+                self.armazem.guardar(chave, dados, tempo)
+            except Exception:
+                logger.exception(f'Falha ao guardar {chave} no armazém')
+        return arquivo
+
+    def _obter_do_armazem(self, chave: str) -> bytes | None:
+        assert self.armazem is not None  # NOQA: S101
+        try:
+            return self.armazem.obter(chave)
+        except Exception:
+            logger.exception(f'Falha ao buscar {chave} no armazém')
+            return None
+
+    def _guardar_no_disco(self, chave: str, dados: bytes) -> Path:
+        arquivo = self._arquivo(chave)
+        estado = escrever(arquivo, dados)
+        resumo = fabr.artefatos.resumir(dados)
+        with self._trava:
+            self._esquecer(chave)
+            self._entradas[chave] = len(dados)
+            self._tamanho += len(dados)
+            self._resumos[chave] = (_identidade(estado), resumo)
+            self._descartar()
+        return arquivo
+
+    def obter_ou_gerar(self, chave: str, gerar: Callable[[], bytes]) -> bytes:
+        dados = self.obter(chave)
+        if dados is None:
+            dados = gerar()
+            self.guardar(chave, dados)
+        return dados
+
+    def estatisticas(self) -> dict[str, int]:
+        return dict(
+            acertos=self.acertos,
+            falhas=self.falhas,
+            entradas=len(self),
+            tamanho=self.tamanho,
+            tamanho_maximo=self.tamanho_maximo,
+        )
+
+
+def _usar(arquivo: Path) -> None:
+    """Atualiza a data de acesso do arquivo, que guarda a ordem LRU."""
+    # pelo descritor, para não mexer num arquivo que outro processo acabou
+    # de pôr no lugar deste
+    fd = os.open(arquivo, os.O_RDONLY)
+    try:
+        estado = os.fstat(fd)
+        os.utime(fd, ns=(time.time_ns(), estado.st_mtime_ns))
+    finally:
+        os.close(fd)
+
+
+@functools.cache
+def criar_cache(config: fabr.ambiente.Config) -> CacheEmDisco:
+    diretorio = Path(config.cache_diretorio) / 'certificados'
+    tamanho_maximo = config.cache_tamanho * 1024 * 1024
+    logger.debug(f'Criando cache de certificados em {diretorio}')
+    return CacheEmDisco(
+        diretorio=diretorio,
+        tamanho_maximo=tamanho_maximo,
+        armazem=fabr.artefatos.criar_armazem(config),
+    )
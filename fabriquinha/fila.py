@@ -0,0 +1,114 @@
+import collections
+import datetime as dt
+import logging
+import threading
+
+import fabriquinha as fabr
+
+
+logger = logging.getLogger(__name__)
+
+# por quanto tempo, em segundos, um trabalhador espera quando a fila está vazia
+ESPERA_COM_FILA_VAZIA = 2
+
+# espera antes da primeira nova tentativa; dobra a cada falha
+ESPERA_APOS_FALHA = dt.timedelta(seconds=30)
+
+
+def pre_renderizar(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+) -> None:
+    """Deixa no cache o pdf e as prévias que a página de validação usa."""
+    fabr.renderizacao.obter_pdf(cert, config)
+    fabr.renderizacao.obter_imagem(cert, config, 'completo', 'webp')
+
+
+def _renderizar_em_lote(
+    tarefas: list[fabr.bd.Tarefa],
+    config: fabr.ambiente.Config,
+) -> None:
+    certs = [t.certificado for t in tarefas]
+    try:
+        collections.deque(fabr.renderizacao.obter_pdfs(certs, config), 0)
+    except Exception:  # NOQA: BLE001
+        # um certificado com problema derruba o lote todo; ele é isolado
+        # depois, quando cada tarefa é concluída separadamente
+        logger.warning(
+            'Falha ao renderizar o lote, seguindo um a um',
+            exc_info=True,
+        )
+
+
+def _concluir(
+    sessao: fabr.bd.Sessao,
+    tarefa: fabr.bd.Tarefa,
+    config: fabr.ambiente.Config,
+) -> None:
+    try:
+        pre_renderizar(tarefa.certificado, config)
+    except Exception as e:
+        logger.exception(f'Falha ao pré-renderizar a tarefa {tarefa.id}')
+        tarefa.adiar(e, ESPERA_APOS_FALHA * 2**tarefa.tentativas)
+    else:
+        sessao.delete(tarefa)
+
+
+def executar_lote(
+    sessao: fabr.bd.Sessao,
+    config: fabr.ambiente.Config,
+) -> int:
+    """
+    Executa um lote de tarefas da fila e retorna quantas foram executadas.
+
+    Os pdfs do lote são renderizados juntos (veja `obter_pdfs`). As tarefas
+    concluídas são apagadas e as que falharam são adiadas, com espera
+    crescente, tudo na mesma transação que as travou.
+    """
+    tarefas = fabr.bd.Tarefa.reivindicar(
+        sessao,
+        lote=config.fila_lote,
+        tentativas=config.fila_tentativas,
+    )
+    if not tarefas:
+        sessao.rollback()
+        return 0
+
+    _renderizar_em_lote(tarefas, config)
+    for tarefa in tarefas:
+        _concluir(sessao, tarefa, config)
+    sessao.commit()
+    logger.debug(f'{len(tarefas)} tarefas executadas')
+    return len(tarefas)
+
+
+def trabalhar(config: fabr.ambiente.Config, parar: threading.Event) -> None:
+    """Consome a fila até que `parar` seja sinalizado."""
+    while not parar.is_set():
+        try:
+            with fabr.bd.criar_sessao(config) as sessao:
+                executadas = executar_lote(sessao, config)
+        except Exception:
+            # por exemplo, o banco fora do ar; tenta de novo depois da espera
+            logger.exception('Falha ao consumir a fila')
+            executadas = 0
+        if not executadas:
+            parar.wait(ESPERA_COM_FILA_VAZIA)
+
+
+def iniciar_trabalhadores(
+    config: fabr.ambiente.Config,
+    parar: threading.Event,
+) -> list[threading.Thread]:
+    """Inicia `config.fila_trabalhadores` threads que consomem a fila."""
+    trabalhadores = [
+        threading.Thread(
+            target=trabalhar,
+            args=(config, parar),
+            name=f'fila-{i}',
+        )
+        for i in range(config.fila_trabalhadores)
+    ]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    return trabalhadores
@@ -1,4 +1,8 @@
+import contextlib
+from collections.abc import AsyncIterator
+
 import fastapi
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 
 import fabriquinha as fabr
@@ -7,11 +11,24 @@ import fabriquinha as fabr
 def criar_app(config: fabr.ambiente.Config | None = None) -> fastapi.FastAPI:
     config = fabr.ambiente.criar_config() if config is None else config
 
+    @contextlib.asynccontextmanager
+    async def ciclo_de_vida(app: fastapi.FastAPI) -> AsyncIterator[None]:
+        # só fica pronta depois de renderizar um certificado fictício, para
+        # que a primeira requisição não pague pela carga do weasyprint
+        app.state.pronta = False
+        app.state.contexto = fabr.aplicacao.criar_contexto(config)
+        await run_in_threadpool(fabr.renderizacao.aquecer, config)
+        app.state.pronta = True
+        yield
+        await fabr.aplicacao.fechar_contexto(app.state.contexto)
+
     app = fastapi.FastAPI(
         title='Fabriquinha de Certificados',
         description='',
         version='0.1',
+        lifespan=ciclo_de_vida,
     )
+    app.state.pronta = False
 
     app.mount(
         '/e',
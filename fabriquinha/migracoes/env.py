@@ -32,7 +32,7 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
     """
     config = fabr.ambiente.criar_config()
-    motor = fabr.bd.criar_motor(config=config)
+    motor = fabr.bd.criar_motor(config)
 
     with motor.connect() as conexao:
         context.configure(
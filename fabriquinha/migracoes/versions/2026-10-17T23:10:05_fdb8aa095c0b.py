@@ -0,0 +1,64 @@
+"""
+Adiciona tabela Tarefa, a fila de pré-renderização.
+
+Revisão: fdb8aa095c0b
+Anterior: 28a984041866
+Data de Criação: 2026-10-17 23:10:05.402117
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fdb8aa095c0b'
+down_revision: str | None = '28a984041866'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'tarefa',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('certificado_id', sa.Integer(), nullable=False),
+        sa.Column(
+            'tentativas',
+            sa.Integer(),
+            server_default='0',
+            nullable=False,
+        ),
+        sa.Column(
+            'disponivel_em',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.Column('erro', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['certificado_id'],
+            ['certificado.id'],
+            name=op.f('fk_tarefa_certificado_id_certificado'),
+            ondelete='CASCADE',
+        ),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_tarefa')),
+        sa.UniqueConstraint(
+            'certificado_id',
+            name=op.f('uq_tarefa_certificado_id'),
+        ),
+    )
+    op.create_index(
+        op.f('ix_tarefa_disponivel_em'),
+        'tarefa',
+        ['disponivel_em'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_tarefa_disponivel_em'), table_name='tarefa')
+    op.drop_table('tarefa')
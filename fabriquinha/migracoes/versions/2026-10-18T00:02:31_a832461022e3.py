@@ -0,0 +1,76 @@
+"""
+Adiciona tabelas Artefato e ConteudoDoArtefato, o armazém no banco.
+
+Revisão: a832461022e3
+Anterior: fdb8aa095c0b
+Data de Criação: 2026-10-18 00:02:31.771520
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a832461022e3'
+down_revision: str | None = 'fdb8aa095c0b'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'conteudo_do_artefato',
+        sa.Column('resumo', sa.String(length=32), nullable=False),
+        sa.Column('dados', sa.LargeBinary(), nullable=False),
+        sa.Column('tamanho', sa.Integer(), nullable=False),
+        sa.Column(
+            'criado_em',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint(
+            'resumo', name=op.f('pk_conteudo_do_artefato')
+        ),
+    )
+    # pdfs e imagens já são comprimidos: o postgres não tenta comprimi-los
+    op.execute(
+        'ALTER TABLE conteudo_do_artefato '
+        'ALTER COLUMN dados SET STORAGE EXTERNAL'
+    )
+
+    op.create_table(
+        'artefato',
+        sa.Column('nome', sa.String(length=100), nullable=False),
+        sa.Column('resumo', sa.String(length=32), nullable=False),
+        sa.Column('tempo', sa.Float(), nullable=True),
+        sa.Column('versao', sa.String(length=100), nullable=False),
+        sa.Column(
+            'criado_em',
+            sa.DateTime(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ['resumo'],
+            ['conteudo_do_artefato.resumo'],
+            name=op.f('fk_artefato_resumo_conteudo_do_artefato'),
+        ),
+        sa.PrimaryKeyConstraint('nome', name=op.f('pk_artefato')),
+    )
+    op.create_index(
+        op.f('ix_artefato_resumo'),
+        'artefato',
+        ['resumo'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_artefato_resumo'), table_name='artefato')
+    op.drop_table('artefato')
+    op.drop_table('conteudo_do_artefato')
@@ -0,0 +1,184 @@
+"""
+Guarda o html dos modelos em binário, comprimido com dicionário.
+
+Revisão: ad22f2b562a2
+Anterior: a832461022e3
+Data de Criação: 2026-10-18 01:15:42.230964
+"""
+
+import base64
+import zlib
+from collections.abc import Callable, Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ad22f2b562a2'
+down_revision: str | None = 'a832461022e3'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+# quantos modelos são convertidos de cada vez
+TAMANHO_DO_LOTE = 100
+
+
+# cópia do formato de fabr.bd nesta revisão: a migração grava sempre este
+# formato, mesmo que o de fabr.bd mude depois
+FORMATO_ZLIB_COM_DICIONARIO = 1
+DICIONARIO_DOS_MODELOS = b"""<!DOCTYPE html>
+<html lang="pt-br">
+  <head>
+    <meta charset="utf-8">
+    <style>
+      @page {
+        size: A4 landscape;
+        margin: 0;
+        margin-top: 1.0cm;
+        margin-left: 1.0cm;
+        margin-right: 1.0cm;
+        margin-bottom: 1.0cm;
+      }
+
+      body {
+        font-family: sans-serif;
+        text-align: center;
+      }
+
+      .titulo {
+        font-size: 32px;
+        font-weight: bold;
+      }
+
+      .texto {
+        text-align: center;
+        color: #303030;
+        font-size: 16px;
+      }
+
+      .qrcode {
+        position: absolute;
+        bottom: 0px;
+        right: 0px;
+        width: 100px;
+        height: 100px;
+      }
+
+      .rodape {
+        position: absolute;
+        bottom: 0px;
+        left: 0px;
+        right: 0px;
+        font-size: 8px;
+        text-align: right;
+      }
+
+      .logo {
+        display: block;
+        margin-left: auto;
+        margin-right: auto;
+        width: 50%;
+      }
+    </style>
+  </head>
+
+  <body>
+    <div class="caixa">
+      <img class="logo" src="https://">
+      <div class="texto">
+        <p>Certificamos que <strong>{{ titular }}</strong> participou do evento {{ evento }}, realizado em {{ data.strftime('%d/%m/%Y') }} pela comunidade {{ emissora }}.</p>
+      </div>
+      <img class="qrcode" src="data:image/png;base64,{{ qrcode }}">
+      <div class="qrcode">{{ qrcode_svg }}</div>
+      <div class="rodape">
+        <p>Valide este certificado em {{ url_validacao }}</p>
+      </div>
+    </div>
+  </body>
+</html>
+"""  # NOQA: E501
+
+
+def _comprimir(html: str) -> bytes:
+    compressor = zlib.compressobj(level=9, zdict=DICIONARIO_DOS_MODELOS)
+    z_bytes = compressor.compress(html.encode('utf8')) + compressor.flush()
+    return bytes([FORMATO_ZLIB_COM_DICIONARIO]) + z_bytes
+
+
+def _descomprimir(dados: bytes) -> str:
+    formato, z_bytes = dados[0], dados[1:]
+    if formato != FORMATO_ZLIB_COM_DICIONARIO:
+        msg = f'Formato de html comprimido desconhecido: {formato}'
+        raise ValueError(msg)
+    descompressor = zlib.decompressobj(zdict=DICIONARIO_DOS_MODELOS)
+    raw_bytes = descompressor.decompress(z_bytes) + descompressor.flush()
+    return raw_bytes.decode('utf8')
+
+
+def _de_base64(htmlzip: str) -> bytes:
+    html = zlib.decompress(base64.b64decode(htmlzip)).decode('utf8')
+    return _comprimir(html)
+
+
+def _para_base64(htmlzip: bytes) -> str:
+    html = _descomprimir(htmlzip)
+    return base64.b64encode(zlib.compress(html.encode('utf8'))).decode()
+
+
+def _converter(
+    tipo: sa.types.TypeEngine[str] | sa.types.TypeEngine[bytes],
+    converter: Callable[..., str | bytes],
+) -> None:
+    """
+    Converte a coluna htmlzip para o tipo dado.
+
+    Os modelos são lidos e gravados em lotes, em ordem de id, numa coluna
+    nova que depois substitui a antiga.
+    """
+    op.add_column('modelo', sa.Column('htmlzip_novo', tipo, nullable=True))
+    modelo = sa.table(
+        'modelo',
+        sa.column('id', sa.Integer()),
+        sa.column('htmlzip'),
+        sa.column('htmlzip_novo', tipo),
+    )
+    atualizar = (
+        modelo.update()
+        .where(modelo.c.id == sa.bindparam('b_id'))
+        .values(htmlzip_novo=sa.bindparam('b_htmlzip'))
+    )
+    conexao = op.get_bind()
+    ultimo = 0
+    while True:
+        lote = conexao.execute(
+            sa.select(modelo.c.id, modelo.c.htmlzip)
+            .where(modelo.c.id > ultimo)
+            .order_by(modelo.c.id)
+            .limit(TAMANHO_DO_LOTE)
+        ).all()
+        if not lote:
+            break
+        conexao.execute(
+            atualizar,
+            [dict(b_id=i, b_htmlzip=converter(h)) for i, h in lote],
+        )
+        ultimo = lote[-1].id
+
+    op.drop_column('modelo', 'htmlzip')
+    op.alter_column(
+        'modelo',
+        'htmlzip_novo',
+        new_column_name='htmlzip',
+        nullable=False,
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _converter(sa.LargeBinary(), _de_base64)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _converter(sa.String(length=1024 * 100), _para_base64)
@@ -0,0 +1,33 @@
+"""
+Adiciona índice de acesso por comunidade e tipo
+
+Revisão: 1bb355e561e8
+Anterior: ad22f2b562a2
+Data de Criação: 2026-10-18 02:28:22.218514
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1bb355e561e8'
+down_revision: str | None = 'ad22f2b562a2'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        op.f('ix_acesso_comunidade_id_tipo'),
+        'acesso',
+        ['comunidade_id', 'tipo'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_acesso_comunidade_id_tipo'), table_name='acesso')
@@ -0,0 +1,72 @@
+"""
+Conteudo do certificado em jsonb, com índices para a busca.
+
+A mudança de tipo reescreve a tabela certificado, travada durante a
+migração. O índice de trigramas do nome só é criado se a extensão pg_trgm
+estiver disponível no servidor (ela faz parte da imagem oficial do
+postgres); sem ele, a busca por nome funciona, mas percorre a tabela.
+
+Revisão: 3e2f7a9c41d5
+Anterior: 1bb355e561e8
+Data de Criação: 2026-10-18 03:36:22.007747
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e2f7a9c41d5'
+down_revision: str | None = '1bb355e561e8'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def _pg_trgm_disponivel() -> bool:
+    stmt = sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )
+    return op.get_bind().execute(stmt).scalar() is not None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column(
+        'certificado',
+        'conteudo',
+        existing_type=postgresql.JSON(astext_type=sa.Text()),
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        existing_nullable=False,
+        postgresql_using='conteudo::jsonb',
+    )
+    op.create_index(
+        'ix_certificado_conteudo',
+        'certificado',
+        ['conteudo'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'conteudo': 'jsonb_path_ops'},
+    )
+    if _pg_trgm_disponivel():
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX ix_certificado_titular_trgm ON certificado '
+            "USING gin ((conteudo ->> 'titular') gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP INDEX IF EXISTS ix_certificado_titular_trgm')
+    op.drop_index('ix_certificado_conteudo', table_name='certificado')
+    op.alter_column(
+        'certificado',
+        'conteudo',
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        type_=postgresql.JSON(astext_type=sa.Text()),
+        existing_nullable=False,
+        postgresql_using='conteudo::json',
+    )
@@ -0,0 +1,61 @@
+"""
+Busca de certificados só pelo email, sem diferenciar maiúsculas.
+
+A busca por parte do nome deixou de existir, e com ela o índice de
+trigramas do nome; o índice gin do conteudo, que comparava o email exato,
+dá lugar a um índice do email em minúsculas.
+
+Revisão: c52e0d7a9b14
+Anterior: 3e2f7a9c41d5
+Data de Criação: 2026-10-18 04:51:07.318204
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52e0d7a9b14'
+down_revision: str | None = '3e2f7a9c41d5'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def _pg_trgm_disponivel() -> bool:
+    stmt = sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    )
+    return op.get_bind().execute(stmt).scalar() is not None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('DROP INDEX IF EXISTS ix_certificado_titular_trgm')
+    op.drop_index('ix_certificado_conteudo', table_name='certificado')
+    op.create_index(
+        'ix_certificado_email',
+        'certificado',
+        [sa.text("lower(conteudo ->> 'email')")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_certificado_email', table_name='certificado')
+    op.create_index(
+        'ix_certificado_conteudo',
+        'certificado',
+        ['conteudo'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'conteudo': 'jsonb_path_ops'},
+    )
+    if _pg_trgm_disponivel():
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX ix_certificado_titular_trgm ON certificado '
+            "USING gin ((conteudo ->> 'titular') gin_trgm_ops)"
+        )
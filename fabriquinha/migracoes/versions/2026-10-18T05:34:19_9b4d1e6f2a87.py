@@ -0,0 +1,32 @@
+"""
+Adiciona a versão da lista de pessoas da comunidade
+
+Revisão: 9b4d1e6f2a87
+Anterior: c52e0d7a9b14
+Data de Criação: 2026-10-18 05:34:19.642871
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4d1e6f2a87'
+down_revision: str | None = 'c52e0d7a9b14'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'comunidade',
+        sa.Column('versao', sa.Integer(), server_default='0', nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('comunidade', 'versao')
@@ -0,0 +1,158 @@
+import functools
+import io
+import logging
+import mimetypes
+import time
+import urllib.error
+import urllib.parse
+from pathlib import Path
+from typing import Any, TypeAlias
+
+import weasyprint
+
+import fabriquinha as fabr
+
+
+logger = logging.getLogger(__name__)
+
+ESTATICO = Path(__file__).parent / 'estatico'
+
+# maior recurso externo aceito, em bytes
+TAMANHO_MAXIMO = 10 * 1024 * 1024
+
+# os recursos externos são lidos em pedaços de até este tamanho, em bytes
+TAMANHO_DA_LEITURA = 64 * 1024
+
+# por quanto tempo, em segundos, um servidor que falhou deixa de ser buscado
+ESPERA_APOS_FALHA = 60
+
+# de quantos servidores com falha o buscador se lembra
+SERVIDORES_COM_FALHA = 256
+
+Recurso: TypeAlias = dict[str, Any]
+
+
+class BuscadorDeRecursos:
+    """
+    `url_fetcher` do weasyprint para as imagens, fontes e css dos modelos.
+
+    Os arquivos estáticos da própria aplicação (em /e/) são lidos direto do
+    disco. Os recursos externos são buscados em até `timeout` segundos, da
+    conexão ao fim da leitura, e guardados em memória por `validade`
+    segundos, até somarem `tamanho_maximo` bytes. As buscas não seguram
+    nenhuma trava, então um servidor lento atrasa apenas as renderizações
+    que dependem dele. Um servidor que não responde é evitado
+    por `ESPERA_APOS_FALHA` segundos, para não travar as renderizações
+    seguintes. Outros esquemas, como file://, são recusados.
+    """
+
+    def __init__(
+        self,
+        url_base: str,
+        timeout: float,
+        validade: float,
+        tamanho_maximo: int,
+    ) -> None:
+        self.prefixo_estatico = urllib.parse.urljoin(url_base, 'e/')
+        self.timeout = timeout
+        self.recursos: fabr.cache.CacheLRU[str, Recurso] = fabr.cache.CacheLRU(
+            tamanho_maximo=tamanho_maximo,
+            validade=validade,
+            medir=lambda recurso: len(recurso['string']),
+        )
+        self.servidores_com_falha: fabr.cache.CacheLRU[str, str] = (
+            fabr.cache.CacheLRU(
+                tamanho_maximo=SERVIDORES_COM_FALHA,
+                validade=ESPERA_APOS_FALHA,
+            )
+        )
+
+    def __call__(self, url: str) -> Recurso:
+        if url.startswith('data:'):
+            return dict(weasyprint.default_url_fetcher(url))
+        if url.startswith(self.prefixo_estatico):
+            return self._estatico(url.removeprefix(self.prefixo_estatico))
+        if urllib.parse.urlsplit(url).scheme not in {'http', 'https'}:
+            msg = f'Endereço não permitido: {url}'
+            raise ValueError(msg)
+        recurso = self.recursos.obter(url)
+        if recurso is None:
+            recurso = self._baixar(url)
+            self.recursos.guardar(url, recurso)
+        return recurso
+
+    def _estatico(self, nome: str) -> Recurso:
+        caminho = urllib.parse.unquote(urllib.parse.urlsplit(nome).path)
+        arquivo = (ESTATICO / caminho).resolve()
+        if not arquivo.is_relative_to(ESTATICO.resolve()):
+            msg = f'Endereço não permitido: {nome}'
+            raise ValueError(msg)
+        return dict(
+            string=arquivo.read_bytes(),
+            mime_type=mimetypes.guess_type(arquivo.name)[0],
+            filename=arquivo.name,
+        )
+
+    def _baixar(self, url: str) -> Recurso:
+        servidor = urllib.parse.urlsplit(url).netloc
+        erro = self.servidores_com_falha.obter(servidor)
+        if erro is not None:
+            msg = f'Servidor {servidor} indisponível: {erro}'
+            raise OSError(msg)
+
+        try:
+            return self._buscar(url)
+        except urllib.error.HTTPError:
+            raise
+        except (urllib.error.URLError, TimeoutError) as e:
+            logger.warning(f'Falha ao buscar {url}: {e}')
+            self.servidores_com_falha.guardar(servidor, str(e))
+            raise
+
+    def _buscar(self, url: str) -> Recurso:
+        prazo = time.monotonic() + self.timeout
+        recurso = dict(
+            weasyprint.default_url_fetcher(url, timeout=self.timeout)
+        )
+        if 'file_obj' in recurso:
+            with recurso.pop('file_obj') as f:
+                recurso['string'] = _ler(f, prazo, url)
+        if len(recurso['string']) > TAMANHO_MAXIMO:
+            msg = f'Recurso muito grande: {url}'
+            raise ValueError(msg)
+        return recurso
+
+
+def _ler(arquivo: io.BufferedIOBase, prazo: float, url: str) -> bytes:
+    """
+    Lê até TAMANHO_MAXIMO + 1 bytes do arquivo, sem passar do prazo.
+
+    O timeout da conexão só limita cada leitura, então um servidor que envia
+    poucos bytes por vez seguraria a renderização indefinidamente. Cada
+    `read1` espera por no máximo uma leitura do socket, e o prazo é conferido
+    entre elas.
+    """
+    partes = []
+    lidos = 0
+    while lidos <= TAMANHO_MAXIMO:
+        if time.monotonic() > prazo:
+            msg = f'Prazo esgotado ao buscar {url}'
+            raise TimeoutError(msg)
+        parte = arquivo.read1(
+            min(TAMANHO_DA_LEITURA, TAMANHO_MAXIMO + 1 - lidos)
+        )
+        if not parte:
+            break
+        partes.append(parte)
+        lidos += len(parte)
+    return b''.join(partes)
+
+
+@functools.cache
+def criar_buscador(config: fabr.ambiente.Config) -> BuscadorDeRecursos:
+    return BuscadorDeRecursos(
+        url_base=config.url_base,
+        timeout=config.recursos_timeout,
+        validade=config.recursos_validade,
+        tamanho_maximo=config.recursos_cache * 1024 * 1024,
+    )
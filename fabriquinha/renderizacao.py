@@ -0,0 +1,832 @@
+import concurrent.futures
+import contextlib
+import functools
+import io
+import itertools
+import logging
+import multiprocessing
+import re
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+from typing import Literal, NamedTuple, ParamSpec, TypeAlias, TypeVar
+
+import jinja2
+import jinja2.meta
+import jinja2.nodes
+import jinja2.sandbox
+import PIL.Image
+import pymupdf
+import weasyprint
+from fastapi.concurrency import run_in_threadpool
+from weasyprint.text.fonts import FontConfiguration
+
+import fabriquinha as fabr
+
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec('P')
+T = TypeVar('T')
+
+_PdfsEPngs: TypeAlias = list[tuple[bytes, bytes]]
+
+Variante: TypeAlias = Literal['miniatura', 'completo']
+FormatoDeImagem: TypeAlias = Literal['png', 'webp']
+
+# largura, em pixels, da miniatura da prévia
+LARGURA_DA_MINIATURA = 320
+
+# registrada junto de cada arquivo guardado no armazém (veja fabr.artefatos)
+VERSAO_DO_RENDERIZADOR = (
+    f'weasyprint {weasyprint.__version__}; pymupdf {pymupdf.VersionBind}'
+)
+
+# variáveis que o próprio sistema inclui no contexto de renderização
+VARIAVEIS_DO_SISTEMA = frozenset(
+    {'qrcode', 'qrcode_svg', 'url_validacao', 'emissora', 'data'}
+)
+
+
+class ModeloCompilado(NamedTuple):
+    """
+    template: jinja2.Template
+        template do modelo, pronto para renderizar
+
+    variaveis: frozenset[str]
+        variáveis usadas pelo template e não definidas nele próprio
+
+    obrigatorias: frozenset[str]
+        das `variaveis`, as usadas incondicionalmente; as que o template só
+        usa dentro de um `if`, com `default` ou testando `is defined` são
+        opcionais
+    """
+
+    template: jinja2.Template
+    variaveis: frozenset[str]
+    obrigatorias: frozenset[str]
+
+    def faltantes(self, conteudo: fabr.bd.Conteudo) -> set[str]:
+        """Retorna as variáveis obrigatórias que o conteudo não preenche."""
+        return set(self.obrigatorias - VARIAVEIS_DO_SISTEMA - conteudo.keys())
+
+
+@functools.cache
+def criar_ambiente_jinja(
+    config: fabr.ambiente.Config,
+) -> jinja2.sandbox.SandboxedEnvironment:
+    """
+    Ambiente jinja para os modelos de certificado.
+
+    Os modelos são enviados pelas pessoas usuárias, então são executados numa
+    sandbox. O bytecode compilado fica em disco e sobrevive a reinícios.
+    """
+    diretorio = Path(config.cache_diretorio) / 'jinja'
+    diretorio.mkdir(parents=True, exist_ok=True)
+    bcc = jinja2.FileSystemBytecodeCache(str(diretorio))
+    return jinja2.sandbox.SandboxedEnvironment(bytecode_cache=bcc)
+
+
+@functools.cache
+def criar_cache_de_modelos(
+    config: fabr.ambiente.Config,
+) -> fabr.cache.CacheLRU[str, ModeloCompilado]:
+    return fabr.cache.CacheLRU(tamanho_maximo=config.cache_modelos)
+
+
+# filtros e testes que tratam uma variável indefinida
+_FILTROS_OPCIONAIS = frozenset({'default', 'd'})
+_TESTES_OPCIONAIS = frozenset({'defined', 'undefined'})
+
+
+def _usadas_incondicionalmente(no: jinja2.nodes.Node) -> Iterator[str]:
+    """Nomes lidos pelo template fora de qualquer ramo condicional."""
+    if isinstance(no, jinja2.nodes.Name):
+        if no.ctx == 'load':
+            yield no.name
+        return
+    for filho, teste in _filhos(no):
+        if teste:
+            yield from _usadas_no_teste(filho)
+        else:
+            yield from _usadas_incondicionalmente(filho)
+
+
+def _filhos(no: jinja2.nodes.Node) -> Iterator[tuple[jinja2.nodes.Node, bool]]:
+    # dos ifs só o teste é sempre avaliado, e de `a and b` só o `a`
+    if isinstance(no, jinja2.nodes.If | jinja2.nodes.CondExpr):
+        yield no.test, True
+    elif isinstance(no, jinja2.nodes.And | jinja2.nodes.Or):
+        yield no.left, True
+    else:
+        for filho in no.iter_child_nodes(exclude=_ignorados(no)):
+            yield filho, False
+
+
+def _ignorados(no: jinja2.nodes.Node) -> tuple[str, ...]:
+    # o valor filtrado por `default` ou testado por `defined` pode faltar
+    opcional = (
+        isinstance(no, jinja2.nodes.Filter) and no.name in _FILTROS_OPCIONAIS
+    ) or (isinstance(no, jinja2.nodes.Test) and no.name in _TESTES_OPCIONAIS)
+    return ('node',) if opcional else ()
+
+
+def _usadas_no_teste(no: jinja2.nodes.Node) -> Iterator[str]:
+    # uma variável indefinida é falsa, então `if x` ou `x or y` não a exigem
+    if isinstance(no, jinja2.nodes.Name):
+        return
+    if isinstance(no, jinja2.nodes.Not):
+        yield from _usadas_no_teste(no.node)
+        return
+    yield from _usadas_incondicionalmente(no)
+
+
+def _compilar(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+) -> ModeloCompilado:
+    ambiente = criar_ambiente_jinja(config)
+    html = fabr.bd._descomprimir(htmlzip)  # NOQA: SLF001
+
+    # o mesmo que jinja2.BaseLoader.load faz, usando o resumo como nome
+    bcc = ambiente.bytecode_cache
+    assert bcc is not None  # NOQA: S101
+    balde = bcc.get_bucket(ambiente, resumo, None, html)
+    codigo = balde.code
+    if codigo is None:
+        codigo = ambiente.compile(html, name=resumo)
+        balde.code = codigo
+        bcc.set_bucket(balde)
+    template = ambiente.template_class.from_code(
+        ambiente,
+        codigo,
+        ambiente.make_globals(None),
+    )
+
+    arvore = ambiente.parse(html)
+    variaveis = frozenset(jinja2.meta.find_undeclared_variables(arvore))
+    obrigatorias = variaveis & set(_usadas_incondicionalmente(arvore))
+    logger.debug(f'Modelo {resumo} compilado')
+    return ModeloCompilado(
+        template=template,
+        variaveis=variaveis,
+        obrigatorias=obrigatorias,
+    )
+
+
+def compilar_modelo(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    modelos: fabr.cache.CacheLRU[str, ModeloCompilado] | None = None,
+) -> ModeloCompilado:
+    """
+    Retorna o modelo compilado, do cache `modelos` sempre que possível.
+
+    O `resumo` identifica unicamente o html do modelo, então somente a
+    primeira renderização de cada modelo paga pela descompressão e compilação.
+    Sem `modelos`, usa o cache do processo (veja `criar_cache_de_modelos`).
+    """
+    if modelos is None:
+        modelos = criar_cache_de_modelos(config)
+    return modelos.obter_ou_gerar(
+        resumo,
+        lambda: _compilar(config, resumo, htmlzip),
+    )
+
+
+# evita que requisições simultâneas ao mesmo certificado o renderizem
+# várias vezes; as travas são compartilhadas entre chaves para não crescer
+_travas = [threading.Lock() for _ in range(64)]
+
+
+def _trava(chave: str) -> threading.Lock:
+    return _travas[int(chave[:8], 16) % len(_travas)]
+
+
+def pdf_para_png(pdf_bytes: bytes) -> bytes:
+    """Rasteriza a primeira página do pdf."""
+    doc = pymupdf.Document(stream=pdf_bytes)
+    pagina = next(iter(doc))
+    pixels = pagina.get_pixmap()  # type: ignore[attr-defined]
+    png_bytes: bytes = pixels.tobytes(output='png')
+    return png_bytes
+
+
+# o FontConfiguration não é seguro entre threads, então cada renderização
+# toma uma configuração do estoque e a devolve ao terminar; o estoque é
+# limitado ao número de threads do pool das rotas (40, o padrão do anyio)
+MAXIMO_DE_FONTES = 40
+_fontes: list[FontConfiguration] = []
+_trava_das_fontes = threading.Lock()
+
+
+@contextlib.contextmanager
+def usar_fontes() -> Iterator[FontConfiguration]:
+    """
+    Empresta uma configuração de fontes durante uma renderização.
+
+    Criar um FontConfiguration consulta o fontconfig e carrega as fontes do
+    sistema, o que o weasyprint faria a cada `write_pdf`. As configurações
+    são compartilhadas por todas as threads, uma renderização de cada vez:
+    a que foi aquecida em `aquecer` serve a qualquer thread, e as fontes de
+    @font-face dos modelos continuam disponíveis nos renders seguintes. Só
+    quando todas estão em uso é criada uma nova, que depois entra no estoque.
+    """
+    with _trava_das_fontes:
+        fontes = _fontes.pop() if _fontes else None
+    if fontes is None:
+        fontes = FontConfiguration()
+    try:
+        yield fontes
+    finally:
+        with _trava_das_fontes:
+            if len(_fontes) < MAXIMO_DE_FONTES:
+                _fontes.append(fontes)
+
+
+def _html(config: fabr.ambiente.Config, html: str) -> weasyprint.HTML:
+    return weasyprint.HTML(
+        string=html,
+        base_url=config.url_base,
+        url_fetcher=fabr.recursos.criar_buscador(config),
+    )
+
+
+def html_para_pdf(config: fabr.ambiente.Config, html: str) -> bytes:
+    with usar_fontes() as fontes:
+        return bytes(
+            _html(config, html).write_pdf(
+                target=None,
+                pdf_variant='pdf/a-3u',
+                font_config=fontes,
+            )
+        )
+
+
+def html_para_png(config: fabr.ambiente.Config, html: str) -> bytes:
+    return pdf_para_png(html_para_pdf(config, html))
+
+
+def _geradores_de_qrcode(
+    modelo: ModeloCompilado,
+) -> dict[str, Callable[[str], str]]:
+    # os qrcodes só são gerados se o modelo os usa
+    geradores = {
+        'qrcode': fabr.bd.gerar_qrcode,
+        'qrcode_svg': fabr.bd.gerar_qrcode_svg,
+    }
+    return {n: g for n, g in geradores.items() if n in modelo.variaveis}
+
+
+def _renderizar_html(
+    modelo: ModeloCompilado,
+    contexto: fabr.bd.Conteudo,
+    qrcodes: dict[str, str] | None = None,
+) -> str:
+    if qrcodes is None:
+        url = str(contexto['url_validacao'])
+        geradores = _geradores_de_qrcode(modelo)
+        qrcodes = {nome: gerar(url) for nome, gerar in geradores.items()}
+    return modelo.template.render({**contexto, **qrcodes})
+
+
+def gerar_pdf(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    contexto: fabr.bd.Conteudo,
+) -> bytes:
+    """
+    Renderiza um modelo para pdf.
+
+    Recebe apenas tipos simples, para poder ser executada em outro processo:
+    veja `executar`.
+    """
+    modelo = compilar_modelo(config=config, resumo=resumo, htmlzip=htmlzip)
+    return html_para_pdf(config, _renderizar_html(modelo, contexto))
+
+
+def gerar_pdf_e_png(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    contexto: fabr.bd.Conteudo,
+) -> tuple[bytes, bytes]:
+    pdf_bytes = gerar_pdf(config, resumo, htmlzip, contexto)
+    return pdf_bytes, pdf_para_png(pdf_bytes)
+
+
+def _copiar_pdfa(origem: pymupdf.Document, destino: pymupdf.Document) -> None:
+    """Copia os metadados e o perfil de cor que o PDF/A exige no catálogo."""
+    destino.set_metadata(origem.metadata)  # type: ignore[attr-defined]
+    destino.set_xml_metadata(origem.get_xml_metadata())
+
+    tipo, intencoes = origem.xref_get_key(
+        origem.pdf_catalog(), 'OutputIntents'
+    )
+    if tipo == 'null':
+        return
+    if tipo == 'xref':
+        intencoes = origem.xref_object(int(intencoes.split()[0]))
+
+    # copia os objetos referenciados (o perfil icc) e troca as referências
+    novas = {}
+    for xref in {int(r) for r in re.findall(r'(\d+) 0 R', intencoes)}:
+        novas[xref] = destino.get_new_xref()
+        destino.update_object(novas[xref], origem.xref_object(xref))
+        if origem.xref_is_stream(xref):
+            destino.update_stream(novas[xref], origem.xref_stream(xref))
+    intencoes = re.sub(
+        r'(\d+) 0 R',
+        lambda m: f'{novas[int(m[1])]} 0 R',
+        intencoes,
+    )
+    destino.xref_set_key(destino.pdf_catalog(), 'OutputIntents', intencoes)
+
+
+def dividir_pdf(pdf_bytes: bytes, paginas: list[int]) -> list[bytes]:
+    """Divide o pdf em partes com `paginas[i]` páginas cada uma."""
+    doc = pymupdf.Document(stream=pdf_bytes)
+    partes = []
+    inicio = 0
+    for n in paginas:
+        parte = pymupdf.Document()
+        parte.insert_pdf(doc, from_page=inicio, to_page=inicio + n - 1)
+        _copiar_pdfa(doc, parte)
+        partes.append(parte.tobytes(garbage=3, deflate=True))
+        inicio += n
+    return partes
+
+
+def gerar_pdfs(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    contextos: list[fabr.bd.Conteudo],
+) -> list[bytes]:
+    """
+    Renderiza vários certificados do mesmo modelo, um pdf por contexto.
+
+    Os qrcodes de todos são gerados de uma vez (veja `fabr.bd.gerar_qrcodes`).
+    Cada certificado é diagramado separadamente, com uma mesma configuração
+    de fontes (veja `usar_fontes`), mas as páginas de todos são escritas
+    num único pdf, então o weasyprint recorta e incorpora as fontes e imagens
+    uma só vez. Depois o pdf é dividido em um pdf por certificado.
+    """
+    if not contextos:
+        return []
+    modelo = compilar_modelo(config=config, resumo=resumo, htmlzip=htmlzip)
+    urls = [str(contexto['url_validacao']) for contexto in contextos]
+    lotes = {
+        nome: fabr.bd.gerar_qrcodes(urls, gerar)
+        for nome, gerar in _geradores_de_qrcode(modelo).items()
+    }
+    qrcodes = [
+        {nome: lote[url] for nome, lote in lotes.items()} for url in urls
+    ]
+    htmls = [
+        _renderizar_html(modelo, c, q)
+        for c, q in zip(contextos, qrcodes, strict=True)
+    ]
+    with usar_fontes() as fontes:
+        documentos = [
+            _html(config, html).render(font_config=fontes) for html in htmls
+        ]
+        paginas = [pagina for doc in documentos for pagina in doc.pages]
+        pdf_bytes = bytes(
+            documentos[0]
+            .copy(paginas)
+            .write_pdf(target=None, pdf_variant='pdf/a-3u')
+        )
+    return dividir_pdf(pdf_bytes, [len(doc.pages) for doc in documentos])
+
+
+def gerar_pdfs_e_pngs(
+    config: fabr.ambiente.Config,
+    resumo: str,
+    htmlzip: bytes,
+    contextos: list[fabr.bd.Conteudo],
+) -> _PdfsEPngs:
+    pdfs = gerar_pdfs(config, resumo, htmlzip, contextos)
+    return [(pdf_bytes, pdf_para_png(pdf_bytes)) for pdf_bytes in pdfs]
+
+
+# certificado fictício usado para aquecer os processos de renderização; usa
+# as famílias genéricas para que o fontconfig carregue as fontes dos modelos
+_MODELO_DE_AQUECIMENTO = """
+<html><body>
+<p style="font-family: serif">{{ titular }}</p>
+<p style="font-family: sans-serif"><b>{{ emissora }}</b></p>
+<p style="font-family: monospace"><i>{{ data }}</i></p>
+<img src="data:image/png;base64,{{ qrcode }}">
+{{ qrcode_svg }}
+</body></html>
+"""
+
+
+@functools.cache
+def _aquecer_processo(config: fabr.ambiente.Config) -> None:
+    """Renderiza o certificado fictício uma vez, no processo atual."""
+    gerar_pdf_e_png(
+        config=config,
+        resumo='aquecimento',
+        htmlzip=fabr.bd._comprimir(_MODELO_DE_AQUECIMENTO),  # NOQA: SLF001
+        contexto=dict(
+            titular='Fabriquinha',
+            emissora='Fabriquinha',
+            data='2025-01-01',
+            url_validacao=config.url_base,
+        ),
+    )
+    logger.debug('Processo de renderização pronto')
+
+
+# um pool por config, criado no primeiro uso e encerrado por `fechar_pool`
+_pools: dict[fabr.ambiente.Config, concurrent.futures.ProcessPoolExecutor] = {}
+_trava_dos_pools = threading.Lock()
+
+
+def criar_pool(
+    config: fabr.ambiente.Config,
+) -> concurrent.futures.ProcessPoolExecutor | None:
+    """
+    Retorna o pool de processos de renderização, criando-o se preciso.
+
+    O weasyprint e o pymupdf mantém o GIL durante quase toda a renderização,
+    então renderizar em threads serializa as requisições. Com RENDER_PROCESSOS
+    igual a 0 não há pool e tudo é renderizado no próprio processo.
+    """
+    if config.render_processos == 0:
+        return None
+    with _trava_dos_pools:
+        pool = _pools.get(config)
+        if pool is None:
+            logger.debug(
+                f'Criando pool com {config.render_processos} processos'
+            )
+            pool = _pools[config] = concurrent.futures.ProcessPoolExecutor(
+                max_workers=config.render_processos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_aquecer_processo,
+                initargs=(config,),
+            )
+    return pool
+
+
+def fechar_pool(config: fabr.ambiente.Config) -> None:
+    """
+    Encerra o pool de renderização e os seus processos, se ele existir.
+
+    As renderizações em andamento terminam, as que estão na fila são
+    canceladas. Um uso seguinte do pool cria outro.
+    """
+    with _trava_dos_pools:
+        pool = _pools.pop(config, None)
+    if pool is not None:
+        logger.debug('Encerrando o pool de renderização')
+        pool.shutdown(cancel_futures=True)
+
+
+def submeter(
+    config: fabr.ambiente.Config,
+    funcao: Callable[P, T],
+    /,
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> concurrent.futures.Future[T]:
+    """
+    Submete `funcao` ao pool de renderização sem aguardar o resultado.
+
+    Sem pool, `funcao` é executada imediatamente e o futuro já vem resolvido.
+    """
+    pool = criar_pool(config)
+    if pool is not None:
+        return pool.submit(funcao, *args, **kwargs)
+
+    futuro: concurrent.futures.Future[T] = concurrent.futures.Future()
+    try:
+        futuro.set_result(funcao(*args, **kwargs))
+    except Exception as e:  # NOQA: BLE001
+        futuro.set_exception(e)
+    return futuro
+
+
+def executar(
+    config: fabr.ambiente.Config,
+    funcao: Callable[P, T],
+    /,
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> T:
+    """Executa `funcao` no pool de renderização e aguarda o resultado."""
+    return submeter(config, funcao, *args, **kwargs).result()
+
+
+def aquecer(config: fabr.ambiente.Config) -> None:
+    """
+    Prepara a renderização antes de a aplicação receber requisições.
+
+    Carrega o weasyprint, as fontes e o modelo fictício no próprio processo e
+    inicia todos os processos do pool, que se aquecem ao iniciar. A
+    configuração de fontes aquecida fica no estoque de `usar_fontes`, então
+    serve à primeira renderização de qualquer thread.
+    """
+    _aquecer_processo(config)
+    pool = criar_pool(config)
+    if pool is None:
+        return
+    futuros = [
+        pool.submit(_aquecer_processo, config)
+        for _ in range(config.render_processos)
+    ]
+    concurrent.futures.wait(futuros)
+
+
+# as funções abaixo buscam e guardam os arquivos em `cache` ou, sem ele, no
+# cache do processo; as rotas passam o do contexto da aplicação
+def _cache(
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco | None,
+) -> fabr.cache.CacheEmDisco:
+    return fabr.cache.criar_cache(config) if cache is None else cache
+
+
+def renderizar(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> tuple[bytes, bytes]:
+    """
+    Renderiza o certificado e guarda no cache o pdf e a sua prévia em png.
+
+    Retorna os bytes do pdf e do png, nesta ordem.
+    """
+    chave = cert.chave(config)
+    cache = _cache(config, cache)
+
+    inicio = time.perf_counter()
+    pdf_bytes, png_bytes = executar(
+        config,
+        gerar_pdf_e_png,
+        config=config,
+        resumo=cert.modelo.resumo,
+        htmlzip=cert.modelo.htmlzip,
+        contexto=cert.contexto(config),
+    )
+    tempo = time.perf_counter() - inicio
+    cache.guardar(chave + '.pdf', pdf_bytes, tempo=tempo)
+    cache.guardar(chave + '.png', png_bytes, tempo=tempo)
+    logger.debug(f'Certificado {cert.codigo} renderizado')
+    return pdf_bytes, png_bytes
+
+
+def obter_pdf(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> bytes:
+    """Retorna o pdf do certificado, renderizando somente se necessário."""
+    chave = cert.chave(config)
+    cache = _cache(config, cache)
+
+    pdf_bytes = cache.obter(chave + '.pdf')
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    with _trava(chave):
+        # outra requisição pode ter renderizado enquanto esperávamos
+        pdf_bytes = cache.obter(chave + '.pdf')
+        if pdf_bytes is None:
+            pdf_bytes, _ = renderizar(cert, config, cache)
+    return pdf_bytes
+
+
+def _em_blocos(itens: Iterable[T], tamanho: int) -> Iterator[list[T]]:
+    iterador = iter(itens)
+    while bloco := list(itertools.islice(iterador, tamanho)):
+        yield bloco
+
+
+class _Bloco(NamedTuple):
+    certs: list[fabr.bd.Certificado]
+    chaves: list[str]
+    pdfs: list[bytes | None]
+    # índices dos certificados renderizados em cada lote e o seu futuro
+    lotes: list[tuple[list[int], concurrent.futures.Future[_PdfsEPngs]]]
+    inicio: float
+
+
+def _submeter_lote(
+    certs: list[fabr.bd.Certificado],
+    config: fabr.ambiente.Config,
+) -> concurrent.futures.Future[_PdfsEPngs]:
+    modelo = certs[0].modelo
+    return submeter(
+        config,
+        gerar_pdfs_e_pngs,
+        config=config,
+        resumo=modelo.resumo,
+        htmlzip=modelo.htmlzip,
+        contextos=[c.contexto(config) for c in certs],
+    )
+
+
+def _iniciar_bloco(
+    certs: list[fabr.bd.Certificado],
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco,
+) -> _Bloco:
+    """Busca os pdfs no cache e submete ao pool a renderização dos demais."""
+    chaves = [c.chave(config) for c in certs]
+    pdfs = [cache.obter(chave + '.pdf') for chave in chaves]
+
+    # os certificados de um mesmo modelo são renderizados num único lote
+    faltantes: dict[str, list[int]] = {}
+    for i, pdf_bytes in enumerate(pdfs):
+        if pdf_bytes is None:
+            faltantes.setdefault(certs[i].modelo.resumo, []).append(i)
+    lotes = [
+        (indices, _submeter_lote([certs[i] for i in indices], config))
+        for indices in faltantes.values()
+    ]
+    return _Bloco(
+        certs=certs,
+        chaves=chaves,
+        pdfs=pdfs,
+        lotes=lotes,
+        inicio=time.perf_counter(),
+    )
+
+
+def _concluir_bloco(
+    bloco: _Bloco,
+    cache: fabr.cache.CacheEmDisco,
+) -> Iterator[tuple[fabr.bd.Certificado, bytes]]:
+    """Aguarda as renderizações do bloco e guarda os resultados no cache."""
+    pdfs = dict(enumerate(bloco.pdfs))
+    for indices, futuro in bloco.lotes:
+        resultados = futuro.result()
+        # aproximado: o lote é renderizado de uma vez, e o tempo inclui a
+        # espera na fila do pool
+        tempo = (time.perf_counter() - bloco.inicio) / len(indices)
+        for i, (pdf_bytes, png_bytes) in zip(indices, resultados):
+            cache.guardar(bloco.chaves[i] + '.pdf', pdf_bytes, tempo=tempo)
+            cache.guardar(bloco.chaves[i] + '.png', png_bytes, tempo=tempo)
+            pdfs[i] = pdf_bytes
+    for i, cert in enumerate(bloco.certs):
+        pdf = pdfs[i]
+        assert pdf is not None  # NOQA: S101
+        yield cert, pdf
+
+
+def obter_pdfs(
+    certs: Iterable[fabr.bd.Certificado],
+    config: fabr.ambiente.Config,
+    lote: int = 16,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> Iterator[tuple[fabr.bd.Certificado, bytes]]:
+    """
+    Retorna o pdf de cada certificado, na mesma ordem em que foram dados.
+
+    Os certificados são tratados em blocos de `lote` certificados. Os que
+    não estão no cache são renderizados em lote (veja `gerar_pdfs`), com
+    vários blocos em paralelo no pool. O número de blocos em andamento é
+    limitado, então a memória usada não depende do número de certificados.
+    """
+    cache = _cache(config, cache)
+    janela = max(1, config.render_processos)
+    pendentes: deque[_Bloco] = deque()
+
+    for bloco in _em_blocos(certs, lote):
+        pendentes.append(_iniciar_bloco(bloco, config, cache))
+        if len(pendentes) > janela:
+            yield from _concluir_bloco(pendentes.popleft(), cache)
+
+    while pendentes:
+        yield from _concluir_bloco(pendentes.popleft(), cache)
+
+
+async def obter_pdf_assincrono(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> bytes:
+    """
+    `obter_pdf` numa thread, fora do event loop.
+
+    Mesmo um acerto no cache lê o disco e disputa a trava do cache com as
+    threads que renderizam, então nada disso roda no event loop. A thread
+    vem do mesmo pool das rotas síncronas.
+    """
+    return await run_in_threadpool(obter_pdf, cert, config, cache)
+
+
+async def obter_png_assincrono(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> bytes:
+    return await run_in_threadpool(obter_png, cert, config, cache)
+
+
+def obter_png(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> bytes:
+    """
+    Retorna a prévia em png do certificado.
+
+    Se o pdf já estiver no cache, apenas o rasteriza, sem passar de novo pelo
+    weasyprint.
+    """
+    chave = cert.chave(config)
+    cache = _cache(config, cache)
+
+    png_bytes = cache.obter(chave + '.png')
+    if png_bytes is not None:
+        return png_bytes
+
+    with _trava(chave):
+        png_bytes = cache.obter(chave + '.png')
+        if png_bytes is not None:
+            return png_bytes
+
+        pdf_bytes = cache.obter(chave + '.pdf')
+        if pdf_bytes is None:
+            _, png_bytes = renderizar(cert, config, cache)
+        else:
+            png_bytes = pdf_para_png(pdf_bytes)
+            cache.guardar(chave + '.png', png_bytes)
+    return png_bytes
+
+
+def converter_imagem(
+    png_bytes: bytes,
+    variante: Variante,
+    formato: FormatoDeImagem,
+) -> bytes:
+    """Converte a prévia em png para a variante e o formato pedidos."""
+    with PIL.Image.open(io.BytesIO(png_bytes)) as imagem:
+        if variante == 'miniatura':
+            imagem.thumbnail((LARGURA_DA_MINIATURA, imagem.height))
+        saida = io.BytesIO()
+        if formato == 'webp':
+            imagem.save(saida, format='WEBP', quality=80)
+        else:
+            imagem.save(saida, format='PNG', optimize=True)
+    return saida.getvalue()
+
+
+def sufixo_da_imagem(variante: Variante, formato: FormatoDeImagem) -> str:
+    """Sufixo da imagem no cache; a prévia completa em png é a de sempre."""
+    if variante == 'completo' and formato == 'png':
+        return '.png'
+    return f'.{variante}.{formato}'
+
+
+def obter_imagem(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    variante: Variante,
+    formato: FormatoDeImagem,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> bytes:
+    """
+    Retorna a prévia do certificado na variante e no formato pedidos.
+
+    As variantes são derivadas da prévia em png e guardadas no cache.
+    """
+    sufixo = sufixo_da_imagem(variante, formato)
+    cache = _cache(config, cache)
+    if sufixo == '.png':
+        return obter_png(cert, config, cache)
+    return cache.obter_ou_gerar(
+        cert.chave(config) + sufixo,
+        lambda: converter_imagem(
+            obter_png(cert, config, cache),
+            variante,
+            formato,
+        ),
+    )
+
+
+async def obter_imagem_assincrono(
+    cert: fabr.bd.Certificado,
+    config: fabr.ambiente.Config,
+    variante: Variante,
+    formato: FormatoDeImagem,
+    cache: fabr.cache.CacheEmDisco | None = None,
+) -> bytes:
+    return await run_in_threadpool(
+        obter_imagem,
+        cert,
+        config,
+        variante,
+        formato,
+        cache,
+    )
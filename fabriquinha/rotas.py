@@ -1,17 +1,24 @@
 import base64
+import csv
 import datetime as dt
+import email.utils
+import functools
+import hashlib
 import io
 import logging
+import math
 import re
+import time
+import zipfile
+from collections.abc import Awaitable, Callable, Iterable, Iterator
 from typing import Annotated, NoReturn
 
 import fastapi
 import jwt
-import pymupdf
 import sqlalchemy as sa
-import toolz
-import weasyprint
-from fastapi import Form, Request
+import sqlalchemy.orm
+from fastapi import Form, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import (
     FileResponse,
     HTMLResponse,
@@ -33,7 +40,12 @@ htmls = Jinja2Templates(directory='fabriquinha/htmls')
 
 
 @roteador.get('/ping', status_code=fastapi.status.HTTP_200_OK)
-def ping() -> str:
+async def ping(requisicao: Request) -> str:
+    if not requisicao.app.state.pronta:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Aquecendo',
+        )
     return 'pong'
 
 
@@ -67,16 +79,64 @@ def verificar_login(
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         redireciona_para_login()
 
-    usuaria = fabr.bd.Usuaria.buscar(sessao=sessao, nome=dados['nome'])
-    if usuaria is None:
+    credencial = fabr.bd.buscar_credencial(sessao, config, dados['nome'])
+    if credencial is None:
         redireciona_para_login()
 
-    return usuaria
+    requisicao.state.papeis = credencial.papeis
+    return sessao.merge(credencial.usuaria, load=False)
 
 
 LoginDeps = Annotated[fabr.bd.Usuaria, fastapi.Depends(verificar_login)]
 
 
+def papeis_deps(
+    requisicao: Request,
+    usuaria: LoginDeps,
+    config: fabr.ambiente.ConfigDeps,
+    sessao: fabr.bd.Sessao,
+) -> dict[str, fabr.bd.TipoDeAcesso]:
+    """
+    Tipo de acesso da usuária logada em cada comunidade.
+
+    Vem da credencial que verificar_login acabou de buscar, sem nenhuma
+    consulta, e o FastAPI guarda o resultado até o fim da requisição, então
+    todas as verificações de acesso de uma rota usam o mesmo mapa.
+    """
+    papeis: dict[str, fabr.bd.TipoDeAcesso] | None = getattr(
+        requisicao.state,
+        'papeis',
+        None,
+    )
+    if papeis is None:
+        credencial = fabr.bd.buscar_credencial(sessao, config, usuaria.nome)
+        papeis = {} if credencial is None else credencial.papeis
+    return papeis
+
+
+PapeisDeps = Annotated[
+    dict[str, fabr.bd.TipoDeAcesso],
+    fastapi.Depends(papeis_deps),
+]
+
+
+def _comunidades_com_acesso(
+    papeis: dict[str, fabr.bd.TipoDeAcesso],
+) -> list[str]:
+    return sorted(papeis)
+
+
+def _verificar_acesso(
+    papeis: dict[str, fabr.bd.TipoDeAcesso],
+    comunidade: str,
+) -> None:
+    if comunidade not in papeis:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_403_FORBIDDEN,
+            detail='Acesso negado a esta comunidade.',
+        )
+
+
 @roteador.get(
     '/',
     status_code=fastapi.status.HTTP_200_OK,
@@ -92,18 +152,120 @@ def get_raiz(
     )
 
 
+# certificados não mudam depois de emitidos: o pdf e as imagens podem ficar
+# em cache para sempre, mas a página de validação é revalidada para refletir
+# exclusões
+CACHE_DO_PDF = 'public, max-age=31536000, immutable'
+CACHE_DA_VALIDACAO = 'no-cache'
+CACHE_DA_COMUNIDADE = 'private, no-cache'
+
+MEMBROS_POR_PAGINA = 50
+# quantos certificados o zip lê do banco de cada vez
+CERTIFICADOS_POR_LEITURA = 500
+RESULTADOS_POR_PAGINA = 20
+
+# o bastante para separar um email de um nome ou de parte de um email
+EMAIL = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+
+@functools.cache
+def _resumo_do_html(nome: str) -> str:
+    """Resumo de um template das páginas, para mudar o ETag a cada versão."""
+    with open(f'fabriquinha/htmls/{nome}', 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=4).hexdigest()
+
+
+def _cabecalho_de_cache(
+    etag: str,
+    cache_control: str,
+    modificado_em: float | None = None,
+) -> dict[str, str]:
+    cabecalho = {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+    if modificado_em is not None:
+        cabecalho['Last-Modified'] = email.utils.formatdate(
+            modificado_em,
+            usegmt=True,
+        )
+    return cabecalho
+
+
+def _nao_modificado(req: Request, cabecalho: dict[str, str]) -> bool:
+    """Avalia If-None-Match e, na sua ausência, If-Modified-Since."""
+    if_none_match = req.headers.get('if-none-match')
+    if if_none_match is not None:
+        etags = {
+            e.strip().removeprefix('W/') for e in if_none_match.split(',')
+        }
+        return '*' in etags or cabecalho['ETag'] in etags
+
+    if_modified_since = req.headers.get('if-modified-since')
+    if if_modified_since is None or 'Last-Modified' not in cabecalho:
+        return False
+    try:
+        data = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    ultima = email.utils.parsedate_to_datetime(cabecalho['Last-Modified'])
+    return data.tzinfo is not None and ultima <= data
+
+
+@roteador.get(
+    '/v/{codigo}.{formato}',
+    status_code=fastapi.status.HTTP_200_OK,
+    responses={200: dict(content={'image/png': {}, 'image/webp': {}})},
+    response_class=FileResponse,
+)
+async def get_imagem(  # NOQA: PLR0913
+    req: Request,
+    codigo: str,
+    formato: fabr.renderizacao.FormatoDeImagem,
+    sessao: fabr.bd.SessaoAssincrona,
+    config: fabr.ambiente.ConfigDeps,
+    cache: fabr.aplicacao.CacheDeps,
+    variante: fabr.renderizacao.Variante = 'completo',
+) -> Response:
+    cert = await fabr.bd.Certificado.buscar_assincrono(sessao, codigo)
+    if cert is None:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_404_NOT_FOUND,
+            detail='Certificado não encontrado.',
+        )
+
+    async def gerar() -> bytes:
+        await cert.carregar_html_assincrono(sessao)
+        return await fabr.renderizacao.obter_imagem_assincrono(
+            cert,
+            config,
+            variante,
+            formato,
+            cache,
+        )
+
+    nome = cert.chave(config) + fabr.renderizacao.sufixo_da_imagem(
+        variante,
+        formato,
+    )
+    return await _servir_do_cache(
+        req,
+        cache,
+        nome,
+        gerar,
+        media_type=f'image/{formato}',
+    )
+
+
 @roteador.get(
     '/v/{codigo}',
     status_code=fastapi.status.HTTP_200_OK,
     response_class=HTMLResponse,
 )
-def get_validar(
+async def get_validar(
     req: Request,
     codigo: str,
-    sessao: fabr.bd.Sessao,
+    sessao: fabr.bd.SessaoAssincrona,
     config: fabr.ambiente.ConfigDeps,
-) -> HTMLResponse:
-    cert = fabr.bd.Certificado.buscar(sessao, codigo)
+) -> Response:
+    cert = await fabr.bd.Certificado.buscar_assincrono(sessao, codigo)
 
     if cert is None:
         return htmls.TemplateResponse(
@@ -112,42 +274,192 @@ def get_validar(
             context=dict(codigo=codigo),
         )
 
+    pagina = 'validar-certificado.html'
+    # a página é gerada do certificado e do template, então o ETag também
+    cabecalho = _cabecalho_de_cache(
+        etag=f'{cert.chave(config)}-{_resumo_do_html(pagina)}',
+        cache_control=CACHE_DA_VALIDACAO,
+    )
+    if _nao_modificado(req, cabecalho):
+        return Response(status_code=304, headers=cabecalho)
+
     context = dict(
         certificado=cert.asdict(),
         emissora=cert.modelo.comunidade.nome,
-        png=cert.to_png(config),
     )
     return htmls.TemplateResponse(
         request=req,
-        name='validar-certificado.html',
+        name=pagina,
         context=context,
+        headers=cabecalho,
     )
 
 
+def _limitar_buscas(req: Request, contexto: fabr.aplicacao.Contexto) -> None:
+    """Limita as buscas de cada endereço a BUSCA_LIMITE por janela."""
+    endereco = '' if req.client is None else req.client.host
+    agora = time.monotonic()
+    inicio, buscas = contexto.buscas.obter(endereco) or (agora, 0)
+    restante = inicio + fabr.aplicacao.JANELA_DAS_BUSCAS - agora
+    if buscas >= contexto.config.busca_limite:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Muitas buscas. Tente de novo em instantes.',
+            headers={'Retry-After': str(math.ceil(restante))},
+        )
+    contexto.buscas.guardar(endereco, (inicio, buscas + 1), validade=restante)
+
+
+@roteador.get(
+    '/busca',
+    status_code=fastapi.status.HTTP_200_OK,
+    response_class=HTMLResponse,
+)
+async def get_busca(
+    req: Request,
+    contexto: fabr.aplicacao.ContextoDeps,
+    sessao: fabr.bd.SessaoAssincrona,
+    email: str = '',
+    depois: int | None = None,
+) -> Response:
+    """
+    Busca os certificados de uma pessoa pelo email completo.
+
+    Só o email exato encontra os certificados, e só os emitidos para ele:
+    uma busca por partes do nome permitiria listar os códigos, e assim as
+    páginas, dos certificados de qualquer pessoa.
+    """
+    email = email.strip()[:254]
+    encontrados: list[fabr.bd.Encontrado] = []
+    proxima = None
+    valido = EMAIL.fullmatch(email) is not None
+    if valido:
+        _limitar_buscas(req, contexto)
+        encontrados = await fabr.bd.Certificado.procurar_assincrono(
+            sessao,
+            email,
+            limite=RESULTADOS_POR_PAGINA + 1,
+            depois_de=depois,
+        )
+        if len(encontrados) > RESULTADOS_POR_PAGINA:
+            encontrados = encontrados[:RESULTADOS_POR_PAGINA]
+            proxima = encontrados[-1].id
+
+    context = dict(
+        email=email,
+        valido=valido,
+        encontrados=encontrados,
+        proxima=proxima,
+    )
+    return htmls.TemplateResponse(
+        request=req,
+        name='busca.html',
+        context=context,
+    )
+
+
+async def _arquivo_do_cache(
+    req: Request,
+    cache: fabr.cache.CacheEmDisco,
+    nome: str,
+    media_type: str,
+    filename: str | None = None,
+) -> Response | None:
+    """
+    Serve um arquivo já renderizado direto do cache, ou None se não houver.
+
+    O FileResponse envia o arquivo sem copiá-lo para a memória, com
+    Content-Length e suporte a Range e If-Range. O ETag é o resumo dos bytes
+    que o cache guardou ao escrever o arquivo, e não a chave do certificado:
+    uma mesma chave pode gerar bytes diferentes (na renderização em lote ou
+    depois de um descarte), e um download retomado com If-Range não pode
+    juntar pedaços de dois arquivos. O Last-Modified é o momento da escrita.
+    O cache é consultado numa thread, pois mexe no disco e disputa a trava
+    do cache com as threads que renderizam.
+    """
+    arquivo = await run_in_threadpool(cache.consultar, nome)
+    if arquivo is None:
+        return None
+    cabecalho = _cabecalho_de_cache(
+        etag=arquivo.resumo,
+        cache_control=CACHE_DO_PDF,
+        modificado_em=arquivo.estado.st_mtime,
+    )
+    if _nao_modificado(req, cabecalho):
+        return Response(status_code=304, headers=cabecalho)
+    return FileResponse(
+        arquivo.caminho,
+        headers=cabecalho,
+        media_type=media_type,
+        filename=filename,
+        stat_result=arquivo.estado,
+    )
+
+
+async def _servir_do_cache(  # NOQA: PLR0913
+    req: Request,
+    cache: fabr.cache.CacheEmDisco,
+    nome: str,
+    gerar: Callable[[], Awaitable[bytes]],
+    media_type: str,
+    filename: str | None = None,
+) -> Response:
+    """
+    Serve o arquivo `nome` do cache, gerando-o com `gerar` se ele faltar.
+
+    O 304 só depende do que o cache guardou, então uma requisição repetida
+    não carrega o html do modelo. Um arquivo que falta não tem como atender
+    ao If-None-Match ou ao If-Modified-Since da requisição: ele é gerado, e
+    então servido do cache como os demais. Só se ele já tiver sido
+    descartado (num cache pequeno demais) os bytes vão direto da memória.
+    """
+    resposta = await _arquivo_do_cache(req, cache, nome, media_type, filename)
+    if resposta is not None:
+        return resposta
+    dados = await gerar()
+    resposta = await _arquivo_do_cache(req, cache, nome, media_type, filename)
+    if resposta is not None:
+        return resposta
+    cabecalho = _cabecalho_de_cache(
+        etag=fabr.artefatos.resumir(dados),
+        cache_control=CACHE_DO_PDF,
+    )
+    if filename is not None:
+        cabecalho['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return Response(dados, media_type=media_type, headers=cabecalho)
+
+
 @roteador.get(
     '/download/{codigo}.pdf',
     status_code=fastapi.status.HTTP_200_OK,
-    response_class=StreamingResponse,
+    response_class=FileResponse,
 )
-def get_download(
+async def get_download(
+    req: Request,
     codigo: str,
-    sessao: fabr.bd.Sessao,
+    sessao: fabr.bd.SessaoAssincrona,
     config: fabr.ambiente.ConfigDeps,
+    cache: fabr.aplicacao.CacheDeps,
 ) -> Response:
-    cert = fabr.bd.Certificado.buscar(sessao, codigo)
-
+    cert = await fabr.bd.Certificado.buscar_assincrono(sessao, codigo)
     if cert is None:
         return RedirectResponse(url=f'/v/{codigo}', status_code=302)
 
-    pdf_bytes = cert.to_pdf(config=config)
-    pdf_stream = io.BytesIO(pdf_bytes)
-    pdf_stream.seek(0)
+    async def gerar() -> bytes:
+        await cert.carregar_html_assincrono(sessao)
+        return await fabr.renderizacao.obter_pdf_assincrono(
+            cert,
+            config,
+            cache,
+        )
 
-    cabecalho = {'Content-Disposition': 'attachment; filename=certificado.pdf'}
-    return StreamingResponse(
-        pdf_stream,
+    return await _servir_do_cache(
+        req,
+        cache,
+        cert.chave(config) + '.pdf',
+        gerar,
         media_type='application/pdf',
-        headers=cabecalho,
+        filename='certificado.pdf',
     )
 
 
@@ -158,12 +470,10 @@ def get_download(
 )
 def get_criar_modelo(
     req: Request,
-    usuaria: LoginDeps,
-    sessao: fabr.bd.Sessao,
+    papeis: PapeisDeps,
 ) -> HTMLResponse:
     # Busca comunidades que a pessoa usuária tem acesso
-    comunidades = usuaria.organizadora(sessao) + usuaria.administradora(sessao)
-    comunidades_nomes = sorted({c.nome for c in comunidades})
+    comunidades_nomes = _comunidades_com_acesso(papeis)
 
     context = dict(png='', comunidades=comunidades_nomes)
     return htmls.TemplateResponse(
@@ -183,22 +493,23 @@ class TextoHtml(BaseModel):
     responses={200: dict(content={'image/png': {}})},
     response_class=Response,
 )
-def post_html2png(texto_html: TextoHtml) -> Response:
+def post_html2png(
+    texto_html: TextoHtml,
+    config: fabr.ambiente.ConfigDeps,
+) -> Response:
     html_inicial = texto_html.html
 
     qrcode = fabr.bd.gerar_qrcode('a')
     html = re.sub(r'\{\{ *?qrcode *?\}\}', qrcode, html_inicial)
-
-    pdf_bytes = bytes(
-        weasyprint.HTML(string=html).write_pdf(  # type: ignore[no-untyped-call]
-            target=None,
-            pdf_variant='pdf/a-3u',
-        )
+    qrcode_svg = fabr.bd.gerar_qrcode_svg('a')
+    html = re.sub(r'\{\{ *?qrcode_svg *?\}\}', qrcode_svg, html)
+
+    png_bytes = fabr.renderizacao.executar(
+        config,
+        fabr.renderizacao.html_para_png,
+        config,
+        html,
     )
-    doc = pymupdf.Document(stream=pdf_bytes)  # type: ignore[no-untyped-call]
-    pagina = next(iter(doc))
-    pixels = pagina.get_pixmap()  # type: ignore[attr-defined]
-    png_bytes = pixels.tobytes(output='png')
     b64_str = base64.b64encode(png_bytes).decode('utf8')
     src = 'data:image/png;base64,' + b64_str
     return Response(content=src, media_type='application/octet-stream')
@@ -210,27 +521,13 @@ def post_html2png(texto_html: TextoHtml) -> Response:
     response_class=JSONResponse,
 )
 def post_criar_modelo(
-    usuaria: LoginDeps,
+    papeis: PapeisDeps,
     sessao: fabr.bd.Sessao,
     nome: Annotated[str, Form()],
     comunidade: Annotated[str, Form()],
     html: Annotated[str, Form()],
 ) -> JSONResponse:
-    # Verifica se a usuária tem acesso à comunidade selecionada
-    acesso = (
-        sessao.query(fabr.bd.Acesso)
-        .join(fabr.bd.Comunidade)
-        .where(
-            fabr.bd.Acesso.usuaria_id == usuaria.id,
-            fabr.bd.Comunidade.nome == comunidade,
-        )
-        .first()
-    )
-    if not acesso:
-        raise fastapi.HTTPException(
-            status_code=fastapi.status.HTTP_403_FORBIDDEN,
-            detail='Acesso negado a esta comunidade.',
-        )
+    _verificar_acesso(papeis, comunidade)
 
     m = fabr.bd.Modelo.novo(
         sessao=sessao,
@@ -247,6 +544,253 @@ def post_criar_modelo(
     )
 
 
+def _buscar_modelo_com_acesso(
+    papeis: dict[str, fabr.bd.TipoDeAcesso],
+    sessao: fabr.bd.Sessao,
+    modelo_id: int,
+) -> fabr.bd.Modelo:
+    modelo = sessao.get(
+        fabr.bd.Modelo,
+        modelo_id,
+        options=[sa.orm.joinedload(fabr.bd.Modelo.comunidade)],
+    )
+    if modelo is None:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_404_NOT_FOUND,
+            detail='Modelo não encontrado.',
+        )
+    _verificar_acesso(papeis, modelo.comunidade.nome)
+    return modelo
+
+
+def _emitir(  # NOQA: PLR0913
+    papeis: dict[str, fabr.bd.TipoDeAcesso],
+    sessao: fabr.bd.Sessao,
+    config: fabr.ambiente.Config,
+    modelos: fabr.cache.CacheLRU[str, fabr.renderizacao.ModeloCompilado],
+    modelo_id: int,
+    data: dt.date,
+    conteudos: list[fabr.bd.Conteudo],
+) -> JSONResponse:
+    modelo = _buscar_modelo_com_acesso(papeis, sessao, modelo_id)
+
+    # valida todos os conteudos antes de emitir qualquer certificado
+    compilado = fabr.renderizacao.compilar_modelo(
+        config=config,
+        resumo=modelo.resumo,
+        htmlzip=modelo.htmlzip,
+        modelos=modelos,
+    )
+    erros = [
+        dict(linha=n, faltantes=sorted(faltantes))
+        for n, conteudo in enumerate(conteudos)
+        if (faltantes := compilado.faltantes(conteudo))
+    ]
+    if erros:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=erros,
+        )
+
+    codigos = fabr.bd.Certificado.emitir(
+        sessao=sessao,
+        modelo=modelo,
+        data=data,
+        conteudos=conteudos,
+    )
+    sessao.commit()
+
+    return JSONResponse(
+        status_code=fastapi.status.HTTP_201_CREATED,
+        content=dict(modelo=modelo.id, codigos=codigos),
+    )
+
+
+class Emissao(BaseModel):
+    data: dt.date
+    conteudos: list[fabr.bd.Conteudo]
+
+
+@roteador.post(
+    '/modelo/{modelo_id}/emitir',
+    status_code=fastapi.status.HTTP_201_CREATED,
+    response_class=JSONResponse,
+)
+def post_emitir(  # NOQA: PLR0913
+    modelo_id: int,
+    emissao: Emissao,
+    papeis: PapeisDeps,
+    sessao: fabr.bd.Sessao,
+    config: fabr.ambiente.ConfigDeps,
+    modelos: fabr.aplicacao.ModelosDeps,
+) -> JSONResponse:
+    """Emite um certificado para cada conteudo da lista."""
+    return _emitir(
+        papeis=papeis,
+        sessao=sessao,
+        config=config,
+        modelos=modelos,
+        modelo_id=modelo_id,
+        data=emissao.data,
+        conteudos=emissao.conteudos,
+    )
+
+
+def _csv_invalido(detail: str | list[dict[str, object]]) -> NoReturn:
+    raise fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=detail,
+    )
+
+
+def _ler_csv(dados: bytes) -> list[fabr.bd.Conteudo]:
+    """
+    Lê os conteúdos de um csv em UTF-8, um por linha depois do cabeçalho.
+
+    Linhas em branco são ignoradas, como no csv.DictReader. Linhas com mais
+    ou menos colunas que o cabeçalho são recusadas, numeradas como nos erros
+    de campos faltantes.
+    """
+    try:
+        texto = dados.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        _csv_invalido('O arquivo csv deve estar em UTF-8.')
+
+    try:
+        linhas = [linha for linha in csv.reader(io.StringIO(texto)) if linha]
+    except csv.Error as e:
+        _csv_invalido(f'Arquivo csv inválido: {e}.')
+    if not linhas:
+        return []
+    cabecalho, *linhas = linhas
+
+    erros: list[dict[str, object]] = [
+        dict(linha=n, colunas=len(linha), esperadas=len(cabecalho))
+        for n, linha in enumerate(linhas)
+        if len(linha) != len(cabecalho)
+    ]
+    if erros:
+        _csv_invalido(erros)
+    return [dict(zip(cabecalho, linha, strict=True)) for linha in linhas]
+
+
+@roteador.post(
+    '/modelo/{modelo_id}/emitir.csv',
+    status_code=fastapi.status.HTTP_201_CREATED,
+    response_class=JSONResponse,
+)
+def post_emitir_csv(  # NOQA: PLR0913
+    modelo_id: int,
+    data: Annotated[dt.date, Form()],
+    arquivo: UploadFile,
+    papeis: PapeisDeps,
+    sessao: fabr.bd.Sessao,
+    config: fabr.ambiente.ConfigDeps,
+    modelos: fabr.aplicacao.ModelosDeps,
+) -> JSONResponse:
+    """Emite um certificado por linha do csv; a 1ª linha é o cabeçalho."""
+    conteudos = _ler_csv(arquivo.file.read())
+    return _emitir(
+        papeis=papeis,
+        sessao=sessao,
+        config=config,
+        modelos=modelos,
+        modelo_id=modelo_id,
+        data=data,
+        conteudos=conteudos,
+    )
+
+
+class _SaidaDoZip:
+    """Arquivo somente de escrita que acumula o que o zipfile escreve."""
+
+    def __init__(self) -> None:
+        self.partes: list[bytes] = []
+
+    def write(self, dados: bytes) -> int:
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self) -> None:
+        pass
+
+    def esvaziar(self) -> bytes:
+        dados = b''.join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+def gerar_zip(arquivos: Iterable[tuple[str, bytes]]) -> Iterator[bytes]:
+    """Gera um zip aos pedaços, um pedaço por arquivo, sem guardar o todo."""
+    saida = _SaidaDoZip()
+    with zipfile.ZipFile(saida, mode='w') as zf:  # type: ignore[call-overload]
+        for nome, dados in arquivos:
+            # pdfs já são comprimidos, então são apenas armazenados
+            zf.writestr(nome, dados, compress_type=zipfile.ZIP_STORED)
+            yield saida.esvaziar()
+    yield saida.esvaziar()
+
+
+def _certificados_do_zip(
+    config: fabr.ambiente.Config,
+    modelo_id: int,
+    data: dt.date | None,
+) -> Iterator[fabr.bd.Certificado]:
+    """
+    Lê os certificados do zip em páginas, cada uma numa sessão própria.
+
+    O zip é enviado no ritmo de quem o baixa, então nenhuma conexão fica
+    presa durante o download: cada página é lida e a conexão volta ao pool
+    antes de os seus certificados serem renderizados e enviados.
+    """
+    depois_de = None
+    while True:
+        with fabr.bd.criar_sessao(config) as sessao:
+            pagina = fabr.bd.Certificado.listar(
+                sessao=sessao,
+                modelo_id=modelo_id,
+                data=data,
+                depois_de=depois_de,
+                limite=CERTIFICADOS_POR_LEITURA,
+            )
+        yield from pagina
+        if len(pagina) < CERTIFICADOS_POR_LEITURA:
+            return
+        depois_de = pagina[-1].id
+
+
+@roteador.get(
+    '/modelo/{modelo_id}/certificados.zip',
+    status_code=fastapi.status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+def get_certificados_zip(  # NOQA: PLR0913
+    modelo_id: int,
+    papeis: PapeisDeps,
+    sessao: fabr.bd.Sessao,
+    config: fabr.ambiente.ConfigDeps,
+    cache: fabr.aplicacao.CacheDeps,
+    data: dt.date | None = None,
+) -> StreamingResponse:
+    """Retorna um zip com o pdf de todos os certificados do modelo."""
+    _buscar_modelo_com_acesso(papeis, sessao, modelo_id)
+
+    def arquivos() -> Iterator[tuple[str, bytes]]:
+        certs = _certificados_do_zip(config, modelo_id, data)
+        pdfs = fabr.renderizacao.obter_pdfs(certs, config, cache=cache)
+        for cert, pdf_bytes in pdfs:
+            yield f'{cert.codigo}.pdf', pdf_bytes
+
+    cabecalho = {
+        'Content-Disposition': 'attachment; filename=certificados.zip',
+    }
+    return StreamingResponse(
+        gerar_zip(arquivos()),
+        media_type='application/zip',
+        headers=cabecalho,
+    )
+
+
 class TokenRequest(BaseModel):
     nome: str
     senha: str
@@ -257,13 +801,20 @@ class TokenRequest(BaseModel):
     status_code=fastapi.status.HTTP_200_OK,
     response_class=RedirectResponse,
 )
-def post_login(
+async def post_login(
     token_request: Annotated[TokenRequest, Form()],
-    sessao: fabr.bd.Sessao,
+    sessao: fabr.bd.SessaoAssincrona,
     config: fabr.ambiente.ConfigDeps,
 ) -> RedirectResponse:
-    usuaria = fabr.bd.Usuaria.buscar(sessao=sessao, nome=token_request.nome)
-    if usuaria is None or usuaria.verifica_senha(token_request.senha) is False:
+    usuaria = await fabr.bd.Usuaria.buscar_assincrono(
+        sessao=sessao,
+        nome=token_request.nome,
+    )
+    if usuaria is None or not await usuaria.verificar_senha_assincrono(
+        sessao=sessao,
+        config=config,
+        senha_dada=token_request.senha,
+    ):
         return RedirectResponse(
             url='/login',
             status_code=fastapi.status.HTTP_303_SEE_OTHER,
@@ -312,13 +863,9 @@ def get_login(req: Request) -> HTMLResponse:
 def get_u(
     req: Request,
     usuaria: LoginDeps,
-    sessao: fabr.bd.Sessao,
+    papeis: PapeisDeps,
 ) -> HTMLResponse:
-    comunidades = sorted(
-        c.nome
-        for c
-        in usuaria.organizadora(sessao) + usuaria.administradora(sessao)
-    )
+    comunidades = _comunidades_com_acesso(papeis)
     return htmls.TemplateResponse(
         request=req,
         name='u.html',
@@ -326,59 +873,80 @@ def get_u(
     )
 
 
+def _cursor_da_pagina(depois: str | None) -> tuple[str, str] | None:
+    """`depois` é o "tipo:nome" da última pessoa da página anterior."""
+    if depois is None:
+        return None
+    tipo, _, nome = depois.partition(':')
+    return tipo, nome
+
+
+def _etag_da_comunidade(
+    usuaria: fabr.bd.Usuaria,
+    tipo: fabr.bd.TipoDeAcesso,
+    versao: int,
+    depois: str | None,
+) -> str:
+    """Resumo de tudo o que é mostrado na página da comunidade."""
+    dados = repr((usuaria.nome, tipo, versao, depois))
+    dados += _resumo_do_html('comunidade.html')
+    return hashlib.blake2b(dados.encode('utf8'), digest_size=8).hexdigest()
+
+
 @roteador.get(
     '/comunidade/{nome}',
     status_code=fastapi.status.HTTP_200_OK,
     response_model=None,
 )
-def get_comunidade(
+def get_comunidade(  # NOQA: PLR0913
+    req: Request,
     nome: str,
     usuaria: LoginDeps,
+    papeis: PapeisDeps,
     sessao: fabr.bd.Sessao,
-) -> HTMLResponse | RedirectResponse:
-    # verifica se a comunidade existe
-    comunidade = fabr.bd.Comunidade.buscar(sessao, nome=nome)
-    if comunidade is None:
-        return RedirectResponse(
-            url='/u',
-            status_code=fastapi.status.HTTP_404_NOT_FOUND,
-        )
-
-    # verifica se a pessoa tem acesso à comunidade
-    stmt = (
-        sa.select(fabr.bd.Acesso)
-        .where(fabr.bd.Acesso.usuaria_id == usuaria.id)
-        .where(fabr.bd.Acesso.comunidade_id == comunidade.id)
+    depois: str | None = None,
+) -> Response:
+    # verifica se a pessoa tem acesso à comunidade, e se ela existe
+    tipo = papeis.get(nome)
+    versao = fabr.bd.Comunidade.buscar_versao(sessao, nome=nome)
+    if tipo is None or versao is None:
+        status_code = fastapi.status.HTTP_403_FORBIDDEN
+        if versao is None:
+            status_code = fastapi.status.HTTP_404_NOT_FOUND
+        return RedirectResponse(url='/u', status_code=status_code)
+
+    # a página se recarrega sozinha; se a versão da comunidade é a mesma,
+    # responde só o 304, sem consultar as pessoas
+    cabecalho = _cabecalho_de_cache(
+        _etag_da_comunidade(usuaria, tipo, versao, depois),
+        CACHE_DA_COMUNIDADE,
     )
-    acesso = sessao.execute(stmt).scalars().one_or_none()
-    if acesso is None:
-        return RedirectResponse(
-            url='/u',
-            status_code=fastapi.status.HTTP_403_FORBIDDEN,
-        )
-
-    context = dict(comunidade=comunidade.nome)
-
-    # coleta todas as pessoas oragnizadoras e administradoras da comunidade
-    stmt = (
-        sa.select(fabr.bd.Acesso, fabr.bd.Usuaria)
-        .join(fabr.bd.Usuaria)
-        .order_by(fabr.bd.Acesso.tipo, fabr.bd.Usuaria.nome)
+    if _nao_modificado(req, cabecalho):
+        return Response(status_code=304, headers=cabecalho)
+
+    # uma página das pessoas organizadoras e administradoras da comunidade
+    membros = fabr.bd.Acesso.membros(
+        sessao,
+        comunidade=nome,
+        limite=MEMBROS_POR_PAGINA + 1,
+        depois_de=_cursor_da_pagina(depois),
     )
-    acesso_usuaria = sessao.execute(stmt).scalars().all()
-    adiciona_acesso = lambda a: lambda u: setattr(u, 'acesso', a.tipo)
-    usuarias = [toolz.do(adiciona_acesso(a), u) for a, u in acesso_usuaria]
-    context = context | dict(usuarias=usuarias)
 
-    # verifica o tipo de acesso
-    if acesso.tipo in {'organizadora', 'administradora'}:
-        context = context | dict(emitir=True)
-    if acesso.tipo == 'administradora':
-        pass
+    proxima = None
+    if len(membros) > MEMBROS_POR_PAGINA:
+        membros = membros[:MEMBROS_POR_PAGINA]
+        proxima = f'{membros[-1].tipo}:{membros[-1].nome}'
 
-    # retorna a página
+    context = dict(
+        usuaria=usuaria,
+        comunidade=nome,
+        membros=membros,
+        proxima=proxima,
+        emitir=tipo in {'organizadora', 'administradora'},
+    )
     return htmls.TemplateResponse(
         request=req,
         name='comunidade.html',
         context=context,
+        headers=cabecalho,
     )
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Remove do armazém os certificados renderizados que não são mais usados.
+
+Veja `fabr.artefatos.coletar_lixo`.
+"""
+
+import argparse
+import logging.config
+
+import fabriquinha as fabr
+
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger('run-gc')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--outras-versoes',
+        action='store_true',
+        help='remove também o que foi gerado por outra versão do renderizador',
+    )
+    args = parser.parse_args()
+
+    config = fabr.ambiente.criar_config()
+    armazem = fabr.artefatos.criar_armazem(config)
+    if armazem is None:
+        logger.info('Nenhum armazém configurado (ARMAZEM=nenhum)')
+    else:
+        fabr.artefatos.coletar_lixo(
+            config,
+            armazem,
+            outras_versoes=args.outras_versoes,
+        )
@@ -29,4 +29,7 @@ if __name__ == '__main__':
         host='0.0.0.0',
         port=8000,
         workers=1,
+        # a api só é acessada pelo proxy, então o endereço da pessoa vem do
+        # X-Forwarded-For (usado, por exemplo, no limite de buscas)
+        forwarded_allow_ips='*',
     )
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Inicia os trabalhadores da fila de pré-renderização.
+
+Os certificados emitidos são renderizados aqui, em segundo plano, antes da
+primeira visita. As migrações são aplicadas pelo run-server.py.
+"""
+
+import logging.config
+import signal
+import threading
+
+import fabriquinha as fabr
+
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+if __name__ == '__main__':
+    config = fabr.ambiente.criar_config()
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+
+    fabr.renderizacao.aquecer(config)
+    trabalhadores = fabr.fila.iniciar_trabalhadores(config, parar)
+
+    # espera no laço, e não no join, para que o sinal seja atendido
+    while not parar.wait(1):
+        pass
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    fabr.renderizacao.fechar_pool(config)
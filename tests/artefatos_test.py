@@ -0,0 +1,132 @@
+import datetime as dt
+import os
+
+import pytest
+import sqlalchemy as sa
+
+import fabriquinha as fabr
+
+
+AGORA = dt.datetime.now(dt.UTC)
+DEPOIS = AGORA + dt.timedelta(days=1)
+
+
+@pytest.fixture
+def armazem_em_disco(tmp_path):
+    return fabr.artefatos.ArmazemEmDisco(tmp_path)
+
+
+@pytest.fixture
+def armazem_no_banco(sessao, config):
+    return fabr.artefatos.ArmazemNoBanco(config)
+
+
+@pytest.fixture(params=['disco', 'banco'])
+def armazem(request, sessao, config, tmp_path):
+    if request.param == 'disco':
+        return fabr.artefatos.ArmazemEmDisco(tmp_path)
+    return fabr.artefatos.ArmazemNoBanco(config)
+
+
+def test_armazem_guarda_e_obtem(armazem):
+    assert armazem.obter('a.pdf') is None
+    armazem.guardar('a.pdf', b'pdf', tempo=1.5)
+    assert armazem.obter('a.pdf') == b'pdf'
+    (metadados,) = armazem.listar()
+    assert metadados.nome == 'a.pdf'
+    assert metadados.tamanho == 3
+    assert metadados.tempo == 1.5
+    assert metadados.versao == fabr.renderizacao.VERSAO_DO_RENDERIZADOR
+    assert metadados.resumo == fabr.artefatos.resumir(b'pdf')
+
+
+def test_armazem_guarda_bytes_iguais_uma_vez(armazem):
+    armazem.guardar('a.png', b'png', tempo=None)
+    armazem.guardar('b.png', b'png', tempo=None)
+    assert armazem.obter('b.png') == b'png'
+    resumos = {m.resumo for m in armazem.listar()}
+    assert len(resumos) == 1
+
+
+def test_armazem_remove_conteudos_orfaos(armazem):
+    armazem.guardar('a.pdf', b'pdf', tempo=None)
+    armazem.guardar('b.pdf', b'outro', tempo=None)
+    armazem.remover(['b.pdf'])
+    assert armazem.obter('b.pdf') is None
+    # dentro da carência, o órfão fica
+    assert armazem.remover_orfaos(AGORA - dt.timedelta(hours=1)) == 0
+    assert armazem.remover_orfaos(DEPOIS) == 1
+    assert armazem.obter('a.pdf') == b'pdf'
+
+
+def test_armazem_no_banco_guarda_os_bytes_uma_vez(armazem_no_banco, sessao):
+    armazem_no_banco.guardar('a.pdf', b'pdf', tempo=None)
+    armazem_no_banco.guardar('b.pdf', b'pdf', tempo=None)
+    stmt = sa.select(sa.func.count()).select_from(fabr.bd.ConteudoDoArtefato)
+    assert sessao.scalar(stmt) == 1
+
+
+def test_coletar_lixo(certificados, config, armazem_em_disco):
+    chave = certificados[0].chave(config)
+    armazem_em_disco.guardar(chave + '.pdf', b'pdf', tempo=None)
+    armazem_em_disco.guardar(chave + '.png', b'png', tempo=None)
+    armazem_em_disco.guardar('f' * 32 + '.pdf', b'velho', tempo=None)
+    # o conteúdo do arquivo velho foi guardado antes da carência
+    velho = armazem_em_disco._conteudo(fabr.artefatos.resumir(b'velho'))
+    antes = (AGORA - 2 * fabr.artefatos.CARENCIA_DOS_ORFAOS).timestamp()
+    os.utime(velho, (antes, antes))
+
+    coleta = fabr.artefatos.coletar_lixo(config, armazem_em_disco)
+    assert coleta == fabr.artefatos.Coleta(nomes=1, orfaos=1)
+    assert armazem_em_disco.obter(chave + '.pdf') == b'pdf'
+    assert armazem_em_disco.obter('f' * 32 + '.pdf') is None
+    assert not velho.exists()
+
+
+def test_coletar_lixo_de_outras_versoes(
+    certificados,
+    config,
+    armazem_em_disco,
+    monkeypatch,
+):
+    chave = certificados[0].chave(config)
+    armazem_em_disco.guardar(chave + '.pdf', b'pdf', tempo=None)
+    monkeypatch.setattr(
+        fabr.renderizacao,
+        'VERSAO_DO_RENDERIZADOR',
+        'outra versão',
+    )
+    coleta = fabr.artefatos.coletar_lixo(config, armazem_em_disco)
+    assert coleta.nomes == 0
+    coleta = fabr.artefatos.coletar_lixo(
+        config,
+        armazem_em_disco,
+        outras_versoes=True,
+    )
+    assert coleta.nomes == 1
+
+
+def test_processos_compartilham_o_renderizado(
+    certificados,
+    config,
+    tmp_path,
+    monkeypatch,
+):
+    def _config(cache):
+        return config.model_copy(
+            update=dict(
+                cache_diretorio=str(tmp_path / cache),
+                armazem='disco',
+                armazem_diretorio=str(tmp_path / 'armazem'),
+            )
+        )
+
+    cert = certificados[0]
+    pdf = fabr.renderizacao.obter_pdf(cert, _config('a'))
+
+    def _nao_renderizar(*args, **kwargs):
+        raise AssertionError
+
+    monkeypatch.setattr(fabr.renderizacao, 'renderizar', _nao_renderizar)
+    assert fabr.renderizacao.obter_pdf(cert, _config('b')) == pdf
+    assert fabr.renderizacao.obter_png(cert, _config('c')).startswith(b'\x89')
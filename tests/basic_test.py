@@ -1,5 +1,6 @@
 import pydantic
 import pytest
+from fastapi.testclient import TestClient
 
 import fabriquinha as fabr
 
@@ -23,6 +24,12 @@ def test_get_ping_retorna_200(cliente):
     assert resp.status_code == 200
 
 
+def test_get_ping_retorna_503_antes_do_aquecimento(config):
+    app = fabr.main.criar_app(config)
+    resp = TestClient(app).get('ping')
+    assert resp.status_code == 503
+
+
 def test_get_raiz(cliente):
     resp = cliente.get('/')
     assert resp.status_code == 200
@@ -39,3 +46,22 @@ def test_post_html2png(cliente, html):
 def test_get_favicon(cliente):
     resp = cliente.get('/favicon.ico')
     assert resp.status_code == 200
+
+
+def test_contexto_da_aplicacao_e_criado_no_ciclo_de_vida(cliente, config):
+    contexto = cliente.app.state.contexto
+    assert contexto.config == config
+    assert contexto.motor is fabr.bd.criar_motor(config)
+    assert contexto.sessoes is fabr.bd.criar_fabrica_de_sessoes(config)
+    assert contexto.cache is fabr.cache.criar_cache(config)
+
+
+def test_ciclo_de_vida_encerra_o_pool_de_renderizacao(config):
+    config = config.model_copy(update=dict(render_processos=1))
+    app = fabr.main.criar_app(config)
+    with TestClient(app):
+        pool = fabr.renderizacao.criar_pool(config)
+        processos = list(pool._processes.values())
+    assert processos
+    assert not any(p.is_alive() for p in processos)
+    assert config not in fabr.renderizacao._pools
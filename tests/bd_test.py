@@ -1,5 +1,15 @@
+import asyncio
+import base64
 import datetime as dt
-
+import io
+import re
+import threading
+import xml.etree.ElementTree as ET
+import zlib
+from unittest.mock import patch
+
+import PIL.Image
+import pytest
 import sqlalchemy as sa
 
 import fabriquinha as fabr
@@ -47,10 +57,21 @@ def test_buscar_cert_com_codigo_inexistente_retorna_none(sessao, certificados):
     assert resp is None
 
 
-def test_comprimir_retorna_str(gerar_str):
+def test_comprimir_retorna_bytes(gerar_str):
     s = gerar_str(20)
     resp = fabr.bd._comprimir(s)
-    assert isinstance(resp, str)
+    assert isinstance(resp, bytes)
+    assert resp[0] == fabr.bd.FORMATO_ZLIB_COM_DICIONARIO
+
+
+def test_comprimir_usa_o_dicionario(html):
+    sem_dicionario = zlib.compress(html.encode('utf8'), 9)
+    assert len(fabr.bd._comprimir(html)) < len(sem_dicionario) * 0.75
+
+
+def test_descomprimir_formato_desconhecido():
+    with pytest.raises(ValueError, match='desconhecido'):
+        fabr.bd._descomprimir(b'\x00abc')
 
 
 def test_descomprimir_e_inversa_de_comprimir(gerar_str):
@@ -70,11 +91,104 @@ def test_gerar_png_retorna_str(certificados, config):
     assert isinstance(png, str)
 
 
+def test_buscar_assincrono_carrega_modelo_e_comunidade(certificados, config):
+    async def buscar(codigo):
+        motor = fabr.bd.criar_motor_assincrono(config)
+        async with fabr.bd.AsyncSession(motor) as sessao:
+            cert = await fabr.bd.Certificado.buscar_assincrono(sessao, codigo)
+        await motor.dispose()
+        return cert
+
+    cert = asyncio.run(buscar(certificados[0].codigo))
+    assert cert.id == certificados[0].id
+    assert (
+        cert.modelo.comunidade.nome == certificados[0].modelo.comunidade.nome
+    )
+    assert asyncio.run(buscar('nao-existe')) is None
+
+
+def test_buscar_assincrono_carrega_o_html_so_se_pedido(certificados, config):
+    async def buscar(*, com_html):
+        motor = fabr.bd.criar_motor_assincrono(config)
+        async with fabr.bd.AsyncSession(motor) as sessao:
+            cert = await fabr.bd.Certificado.buscar_assincrono(
+                sessao,
+                certificados[0].codigo,
+            )
+            if com_html:
+                await cert.carregar_html_assincrono(sessao)
+        await motor.dispose()
+        return cert
+
+    cert = asyncio.run(buscar(com_html=False))
+    assert 'htmlzip' not in vars(cert.modelo)
+    assert 'nome' not in vars(cert.modelo)
+    cert = asyncio.run(buscar(com_html=True))
+    assert cert.modelo.htmlzip == certificados[0].modelo.htmlzip
+
+
+def test_modelo_nao_carrega_o_html(modelo, config):
+    with fabr.bd.criar_sessao(config) as sessao:
+        m = sessao.get(fabr.bd.Modelo, modelo.id)
+        assert 'htmlzip' not in vars(m)
+        assert fabr.bd._descomprimir(m.htmlzip).startswith(' <!DOCTYPE')
+
+
+def test_chave_do_certificado_e_deterministica(certificados, config):
+    assert certificados[0].chave(config) == certificados[0].chave(config)
+    assert certificados[0].chave(config) != certificados[1].chave(config)
+
+
 def test_gerar_qrcode_retorna_str(gerar_str):
     qrcode = fabr.bd.gerar_qrcode(s=gerar_str(10))
     assert isinstance(qrcode, str)
 
 
+def test_gerar_qrcode_svg_tem_o_tamanho_do_png(gerar_str):
+    s = gerar_str(10)
+    svg = ET.fromstring(fabr.bd.gerar_qrcode_svg(s))  # NOQA: S314
+    lado = int(svg.get('viewBox').split()[-1])
+    png = fabr.bd.gerar_qrcode(s)
+    img = PIL.Image.open(io.BytesIO(base64.b64decode(png)))
+    assert img.size == (2 * lado, 2 * lado)
+    assert svg.get('width') == str(2 * lado)
+
+
+def test_gerar_qrcode_svg_usa_a_memoria(gerar_str):
+    s = gerar_str(10)
+    assert fabr.bd.gerar_qrcode_svg(s) is fabr.bd.gerar_qrcode_svg(s)
+
+
+def test_gerar_qrcodes_gera_cada_url_uma_vez_sem_a_memoria(gerar_str):
+    urls = [gerar_str(10) for _ in range(3)]
+    antes = fabr.bd.gerar_qrcode_svg.cache_info()
+    qrcodes = fabr.bd.gerar_qrcodes(urls + urls)
+    assert fabr.bd.gerar_qrcode_svg.cache_info() == antes
+    assert list(qrcodes) == urls
+    assert qrcodes[urls[0]] == fabr.bd.gerar_qrcode_svg(urls[0])
+    png = fabr.bd.gerar_qrcodes(urls[:1], fabr.bd.gerar_qrcode)
+    assert png == {urls[0]: fabr.bd.gerar_qrcode(urls[0])}
+
+
+def test_gerar_qrcode_svg_tem_os_modulos_do_png(gerar_str):
+    s = gerar_str(10)
+    caminho = ET.fromstring(fabr.bd.gerar_qrcode_svg(s))[1].get('d')  # NOQA: S314
+    escuros_svg = {
+        (int(x) + i, int(y))
+        for x, y, n in re.findall(r'M(\d+) (\d+)h(\d+)', caminho)
+        for i in range(int(n))
+    }
+    png = fabr.bd.gerar_qrcode(s)
+    img = PIL.Image.open(io.BytesIO(base64.b64decode(png))).convert('L')
+    escuros_png = {
+        (x // 2, y // 2)
+        for x in range(0, img.width, 2)
+        for y in range(0, img.height, 2)
+        if img.getpixel((x, y)) == 0
+    }
+    assert escuros_svg == escuros_png
+
+
 def test_gerar_modelo_novo(sessao, comunidades):
     m = fabr.bd.Modelo.novo(
         sessao=sessao,
@@ -85,7 +199,7 @@ def test_gerar_modelo_novo(sessao, comunidades):
     sessao.add(m)
     sessao.commit()
     assert m.nome == 'nome'
-    assert m.htmlzip == 'eJxLTEzkAgADdwEu'
+    assert fabr.bd._descomprimir(m.htmlzip) == 'aaa\n'
     assert m.comunidade.nome == 'GruPy-SP'
     assert m.resumo == 'a1c57efd1cd0c881'
 
@@ -124,6 +238,66 @@ def test_novo_certificado(modelo):
     assert len(cert.codigo) == 12
 
 
+def test_emitir_certificados(sessao, modelo):
+    conteudos = [dict(a=n) for n in range(5)]
+    codigos = fabr.bd.Certificado.emitir(
+        sessao=sessao,
+        modelo=modelo,
+        data=dt.date(2020, 1, 1),
+        conteudos=conteudos,
+    )
+    sessao.commit()
+    assert len(codigos) == 5
+    for codigo, conteudo in zip(codigos, conteudos, strict=True):
+        cert = fabr.bd.Certificado.buscar(sessao, codigo)
+        assert cert.conteudo == conteudo
+        assert cert.modelo == modelo
+
+
+def test_emitir_sem_conteudos_nao_emite_nada(sessao, modelo):
+    codigos = fabr.bd.Certificado.emitir(
+        sessao=sessao,
+        modelo=modelo,
+        data=dt.date(2020, 1, 1),
+        conteudos=[],
+    )
+    assert codigos == []
+
+
+def test_emitir_gera_de_novo_somente_os_codigos_que_colidem(
+    sessao,
+    certificados,
+    modelo,
+):
+    existente = certificados[0].codigo
+    sequencia = iter([[existente, 'b' * 12, 'c' * 12], ['d' * 12]])
+    with patch.object(fabr.bd, 'gerar_codigos', lambda n: next(sequencia)):
+        codigos = fabr.bd.Certificado.emitir(
+            sessao=sessao,
+            modelo=modelo,
+            data=dt.date(2020, 1, 1),
+            conteudos=[dict(a=0), dict(a=1), dict(a=2)],
+        )
+    sessao.commit()
+    assert codigos == ['d' * 12, 'b' * 12, 'c' * 12]
+    assert fabr.bd.Certificado.buscar(sessao, 'd' * 12).conteudo == dict(a=0)
+    assert fabr.bd.Certificado.buscar(sessao, existente) == certificados[0]
+
+
+def test_gerar_codigos():
+    codigos = fabr.bd.gerar_codigos(1000)
+    assert len(codigos) == 1000
+    assert len(set(codigos)) == 1000
+    for codigo in codigos:
+        assert len(codigo) == 12
+        assert set(codigo) <= set(fabr.bd.ALFABETO_DOS_CODIGOS)
+
+
+def test_gerar_codigos_usa_todo_o_alfabeto():
+    caracteres = set(''.join(fabr.bd.gerar_codigos(100)))
+    assert caracteres == set(fabr.bd.ALFABETO_DOS_CODIGOS)
+
+
 def test_usuaria_nova():
     o = fabr.bd.Usuaria.novo(nome='aaa', senha='bbb')
     assert isinstance(o, fabr.bd.Usuaria)
@@ -167,12 +341,165 @@ def test_usuaria_busca_somente_ativa_com_usuaria_inativa(sessao, usuaria):
     assert u is None
 
 
-def test_usuaria_comunidades(sessao, comunidades, usuarias, acessos):
-    assert usuarias[0].administradora(sessao) == comunidades
-    assert usuarias[0].organizadora(sessao) == []
-    assert usuarias[1].administradora(sessao) == []
-    assert usuarias[1].organizadora(sessao) == comunidades
-    assert usuarias[2].administradora(sessao) == comunidades[:1]
-    assert usuarias[2].organizadora(sessao) == []
-    assert usuarias[4].administradora(sessao) == []
-    assert usuarias[4].organizadora(sessao) == comunidades[:1]
+def test_usuaria_papeis(sessao, comunidades, usuarias, acessos):
+    grupy, pyladies = (c.nome for c in comunidades)
+    assert usuarias[0].papeis(sessao) == {
+        grupy: 'administradora',
+        pyladies: 'administradora',
+    }
+    assert usuarias[1].papeis(sessao) == {
+        grupy: 'organizadora',
+        pyladies: 'organizadora',
+    }
+    assert usuarias[2].papeis(sessao) == {grupy: 'administradora'}
+    assert usuarias[4].papeis(sessao) == {grupy: 'organizadora'}
+    assert usuarias[6].papeis(sessao) == {}
+
+
+def test_versao_da_comunidade_muda_com_as_pessoas(
+    sessao,
+    comunidades,
+    usuarias,
+    acessos,
+):
+    grupy, pyladies = (c.nome for c in comunidades)
+    versao = lambda nome: fabr.bd.Comunidade.buscar_versao(sessao, nome)
+    assert (versao(grupy), versao(pyladies)) == (1, 1)
+
+    sessao.delete(acessos[4])
+    sessao.commit()
+    assert (versao(grupy), versao(pyladies)) == (2, 1)
+
+    usuarias[1].ativa = False
+    sessao.commit()
+    assert (versao(grupy), versao(pyladies)) == (3, 2)
+
+    usuarias[1].senha = 'outra'
+    usuarias[6].ativa = False
+    sessao.commit()
+    assert (versao(grupy), versao(pyladies)) == (3, 2)
+    assert versao('Nenhuma') is None
+
+
+def test_buscar_credencial_traz_os_papeis(sessao, acessos, usuarias, config):
+    credencial = fabr.bd.buscar_credencial(sessao, config, usuarias[1].nome)
+    assert credencial.usuaria.id == usuarias[1].id
+    assert credencial.papeis == {
+        'GruPy-SP': 'organizadora',
+        'PyLadies': 'organizadora',
+    }
+
+
+def test_buscar_credencial_de_usuaria_inativa(sessao, usuaria, config):
+    usuaria.ativa = False
+    sessao.commit()
+    assert fabr.bd.buscar_credencial(sessao, config, usuaria.nome) is None
+
+
+def test_executar_senha_usa_o_executor_limitado(config):
+    executor = fabr.bd.criar_executor_de_senhas(config)
+    assert executor._max_workers == config.senha_simultaneas
+    nome = asyncio.run(
+        fabr.bd.executar_senha(config, lambda: threading.current_thread().name)
+    )
+    assert nome.startswith('senhas')
+
+
+def test_membros_da_comunidade_em_paginas(sessao, acessos, comunidades):
+    membros = fabr.bd.Acesso.membros(sessao, comunidades[0].nome, limite=100)
+    assert len(membros) == 6
+    assert membros == sorted(membros, key=lambda m: (m.tipo, m.nome))
+
+    pagina = fabr.bd.Acesso.membros(sessao, comunidades[0].nome, limite=4)
+    resto = fabr.bd.Acesso.membros(
+        sessao,
+        comunidades[0].nome,
+        limite=4,
+        depois_de=(pagina[-1].tipo, pagina[-1].nome),
+    )
+    assert pagina + resto == membros
+
+
+@pytest.fixture
+def participantes(sessao, modelo):
+    conteudos = [
+        dict(titular='Ana Maria', email='ana@exemplo.com'),
+        dict(titular='Mariana Silva', email='Mariana@Exemplo.com'),
+        dict(titular='Bia 100%', email='bia@exemplo.com'),
+        dict(titular='ana maria', email='ana@exemplo.com'),
+    ]
+    fabr.bd.Certificado.emitir(
+        sessao=sessao,
+        modelo=modelo,
+        data=dt.date(2020, 1, 1),
+        conteudos=conteudos,
+    )
+    sessao.commit()
+    return conteudos
+
+
+def _procurar(config, email, limite=10, depois_de=None):
+    async def procurar():
+        motor = fabr.bd.criar_motor_assincrono(config)
+        async with fabr.bd.AsyncSession(motor) as sessao:
+            r = await fabr.bd.Certificado.procurar_assincrono(
+                sessao,
+                email,
+                limite=limite,
+                depois_de=depois_de,
+            )
+        await motor.dispose()
+        return r
+
+    return asyncio.run(procurar())
+
+
+def test_procurar_pelo_email_inteiro(participantes, config):
+    nomes = [e.titular for e in _procurar(config, 'ana@exemplo.com')]
+    assert nomes == ['Ana Maria', 'ana maria']
+    assert _procurar(config, 'ana@exemplo.com')[0].emissora == 'GruPy-SP'
+    assert _procurar(config, 'exemplo.com') == []
+    assert _procurar(config, 'ana@exemplo') == []
+
+
+def test_procurar_sem_diferenciar_maiusculas(participantes, config):
+    for email in ['mariana@exemplo.com', 'Mariana@Exemplo.com']:
+        [encontrado] = _procurar(config, email)
+        assert encontrado.titular == 'Mariana Silva'
+    assert len(_procurar(config, 'ANA@EXEMPLO.COM')) == 2
+
+
+def test_procurar_nao_usa_o_like(participantes, config):
+    assert _procurar(config, '%@exemplo.com') == []
+    assert _procurar(config, 'an_@exemplo.com') == []
+
+
+def test_procurar_em_paginas(participantes, config):
+    todos = _procurar(config, 'ana@exemplo.com')
+    pagina = _procurar(config, 'ana@exemplo.com', limite=1)
+    resto = _procurar(config, 'ana@exemplo.com', depois_de=pagina[-1].id)
+    assert pagina + resto == todos
+
+
+def test_procurar_escreve_o_campo_do_email_no_sql(participantes, config):
+    # o índice é da expressão lower(conteudo ->> 'email'); com o nome do
+    # campo num parâmetro, um plano preparado não poderia usá-lo
+    comandos = []
+
+    async def procurar():
+        motor = fabr.bd.criar_motor_assincrono(config)
+        sa.event.listen(
+            motor.sync_engine,
+            'before_cursor_execute',
+            lambda *args: comandos.append(args[2]),
+        )
+        async with fabr.bd.AsyncSession(motor) as sessao:
+            await fabr.bd.Certificado.procurar_assincrono(
+                sessao,
+                'ana@exemplo.com',
+                10,
+            )
+        await motor.dispose()
+
+    asyncio.run(procurar())
+    assert "WHERE lower((certificado.conteudo ->> 'email')) =" in comandos[-1]
@@ -0,0 +1,144 @@
+import os
+from unittest.mock import Mock, patch
+
+import fabriquinha as fabr
+
+
+def test_cache_em_disco_guarda_e_obtem(tmp_path):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    cache.guardar('abcd', b'conteudo')
+    assert cache.obter('abcd') == b'conteudo'
+    assert cache.acertos == 1
+    assert cache.falhas == 0
+
+
+def test_cache_em_disco_conta_falhas(tmp_path):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    assert cache.obter('abcd') is None
+    assert cache.falhas == 1
+
+
+def test_cache_em_disco_obter_ou_gerar_so_gera_uma_vez(tmp_path):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    chamadas = []
+    gerar = lambda: chamadas.append(1) or b'pdf'
+    assert cache.obter_ou_gerar('abcd', gerar) == b'pdf'
+    assert cache.obter_ou_gerar('abcd', gerar) == b'pdf'
+    assert len(chamadas) == 1
+    assert cache.estatisticas()['acertos'] == 1
+    assert cache.estatisticas()['falhas'] == 1
+
+
+def test_cache_em_disco_descarta_a_entrada_menos_usada(tmp_path):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=10)
+    cache.guardar('aaaa', b'12345')
+    cache.guardar('bbbb', b'12345')
+    cache.obter('aaaa')
+    cache.guardar('cccc', b'12345')
+    assert cache.obter('bbbb') is None
+    assert cache.obter('aaaa') == b'12345'
+    assert cache.obter('cccc') == b'12345'
+    assert cache.tamanho == 10
+
+
+def test_cache_em_disco_persiste_entre_instancias(tmp_path):
+    cache1 = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    cache1.guardar('abcd', b'conteudo')
+    cache2 = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    assert len(cache2) == 1
+    assert cache2.obter('abcd') == b'conteudo'
+
+
+def test_cache_em_disco_reduz_ao_carregar(tmp_path):
+    cache1 = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    cache1.guardar('aaaa', b'12345')
+    cache1.guardar('bbbb', b'12345')
+    cache2 = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=5)
+    assert len(cache2) == 1
+
+
+def test_cache_lru_descarta_a_entrada_menos_usada():
+    cache = fabr.cache.CacheLRU(tamanho_maximo=2)
+    cache.guardar('a', 1)
+    cache.guardar('b', 2)
+    cache.obter('a')
+    cache.guardar('c', 3)
+    assert cache.obter('b') is None
+    assert cache.obter('a') == 1
+
+
+def test_cache_lru_expira_entradas_vencidas():
+    cache = fabr.cache.CacheLRU(tamanho_maximo=2, validade=60)
+    cache.guardar('a', 1)
+    cache.guardar('b', 2, validade=0)
+    assert cache.obter('a') == 1
+    assert cache.obter('b') is None
+    assert len(cache) == 1
+
+
+def test_cache_lru_limitado_pela_soma_dos_tamanhos():
+    cache = fabr.cache.CacheLRU(tamanho_maximo=10, medir=len)
+    cache.guardar('a', b'1234')
+    cache.guardar('b', b'1234')
+    cache.guardar('a', b'12')
+    cache.guardar('c', b'12345')
+    assert cache.obter('b') is None
+    assert cache.tamanho == 7
+    cache.guardar('d', b'0' * 11)
+    assert cache.obter('d') is None
+    assert cache.obter('a') == b'12'
+
+
+def test_cache_em_disco_busca_no_armazem(tmp_path):
+    armazem = fabr.artefatos.ArmazemEmDisco(tmp_path / 'armazem')
+    cache1 = fabr.cache.CacheEmDisco(tmp_path / '1', 1024, armazem=armazem)
+    cache2 = fabr.cache.CacheEmDisco(tmp_path / '2', 1024, armazem=armazem)
+    cache1.guardar('abcd', b'conteudo', tempo=0.5)
+    arquivo = tmp_path / '2' / 'ab' / 'abcd'
+    assert not arquivo.exists()
+    assert cache2.obter('abcd') == b'conteudo'
+    # agora está no disco do segundo cache
+    assert arquivo.read_bytes() == b'conteudo'
+
+
+def test_cache_em_disco_segue_sem_o_armazem(tmp_path):
+    armazem = Mock()
+    armazem.obter.side_effect = OSError('fora do ar')
+    armazem.guardar.side_effect = OSError('fora do ar')
+    cache = fabr.cache.CacheEmDisco(tmp_path, 1024, armazem=armazem)
+    assert cache.obter('abcd') is None
+    cache.guardar('abcd', b'conteudo')
+    assert cache.obter('abcd') == b'conteudo'
+
+
+def test_cache_em_disco_consultar_usa_o_resumo_guardado(tmp_path):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    cache.guardar('abcd', b'conteudo')
+    with patch.object(fabr.artefatos, 'resumir') as resumir:
+        arquivo = cache.consultar('abcd')
+    resumir.assert_not_called()
+    assert arquivo.resumo == fabr.artefatos.resumir(b'conteudo')
+    assert arquivo.caminho.read_bytes() == b'conteudo'
+    assert cache.consultar('dcba') is None
+
+
+def test_cache_em_disco_consultar_acompanha_o_arquivo(tmp_path):
+    cache1 = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    cache1.guardar('abcd', b'conteudo')
+    cache2 = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    # escrito por outra instância: resumido uma vez, no primeiro uso
+    assert cache2.consultar('abcd').resumo == fabr.artefatos.resumir(
+        b'conteudo'
+    )
+    cache2.guardar('abcd', b'outro conteudo')
+    arquivo = cache1.consultar('abcd')
+    assert arquivo.resumo == fabr.artefatos.resumir(b'outro conteudo')
+
+
+def test_cache_em_disco_uso_nao_muda_a_data_de_modificacao(tmp_path):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=1024)
+    cache.guardar('abcd', b'conteudo')
+    arquivo = cache.consultar('abcd')
+    os.utime(arquivo.caminho, (1, arquivo.estado.st_mtime))
+    assert cache.consultar('abcd').estado.st_mtime == arquivo.estado.st_mtime
+    assert arquivo.caminho.stat().st_atime > 1
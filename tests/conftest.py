@@ -11,8 +11,10 @@ import fabriquinha as fabr
 
 @pytest.fixture
 def config():
+    # renderiza no próprio processo: cada aplicação encerra o seu pool ao
+    # terminar, e os testes do pool criam o deles
     c = fabr.ambiente.criar_config()
-    return c
+    return c.model_copy(update=dict(render_processos=0))
 
 
 def pytest_addoption(parser):
@@ -85,8 +87,8 @@ def sessao(_sessao):
 @pytest.fixture
 def cliente(config):
     app = fabr.main.criar_app(config)
-    teste_cli = TestClient(app)
-    return teste_cli
+    with TestClient(app) as teste_cli:
+        yield teste_cli
 
 
 @pytest.fixture
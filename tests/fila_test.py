@@ -0,0 +1,120 @@
+import datetime as dt
+import threading
+from unittest.mock import patch
+
+import sqlalchemy as sa
+
+import fabriquinha as fabr
+
+
+def _emitir(sessao, modelo, n):
+    codigos = fabr.bd.Certificado.emitir(
+        sessao=sessao,
+        modelo=modelo,
+        data=dt.date(2020, 1, 1),
+        conteudos=[dict(teste=str(i)) for i in range(n)],
+    )
+    sessao.commit()
+    return codigos
+
+
+def _tarefas(sessao):
+    sessao.expire_all()
+    return sessao.scalars(sa.select(fabr.bd.Tarefa)).all()
+
+
+def test_emitir_enfileira_os_certificados(sessao, modelo):
+    codigos = _emitir(sessao, modelo, 3)
+    tarefas = _tarefas(sessao)
+    assert sorted(t.certificado.codigo for t in tarefas) == sorted(codigos)
+    assert all(t.tentativas == 0 for t in tarefas)
+
+
+def test_executar_lote_pre_renderiza_e_apaga(sessao, modelo, config):
+    codigos = _emitir(sessao, modelo, 3)
+    assert fabr.fila.executar_lote(sessao, config) == 3
+    assert _tarefas(sessao) == []
+
+    cache = fabr.cache.criar_cache(config)
+    for codigo in codigos:
+        chave = fabr.bd.Certificado.buscar(sessao, codigo).chave(config)
+        assert cache.caminho(chave + '.pdf') is not None
+        assert cache.caminho(chave + '.png') is not None
+        assert cache.caminho(chave + '.completo.webp') is not None
+    assert fabr.fila.executar_lote(sessao, config) == 0
+
+
+def test_falha_no_lote_segue_um_a_um(sessao, modelo, config):
+    _emitir(sessao, modelo, 2)
+    with (
+        patch.object(
+            fabr.renderizacao,
+            'obter_pdfs',
+            side_effect=RuntimeError('falhou'),
+        ),
+        patch.object(fabr.fila.logger, 'warning') as warning,
+    ):
+        assert fabr.fila.executar_lote(sessao, config) == 2
+    assert _tarefas(sessao) == []
+    # o erro do lote é registrado com o traceback
+    assert warning.call_args.kwargs['exc_info'] is True
+
+
+def test_executar_lote_respeita_o_tamanho_do_lote(sessao, modelo, config):
+    _emitir(sessao, modelo, 3)
+    config = config.model_copy(update=dict(fila_lote=2))
+    assert fabr.fila.executar_lote(sessao, config) == 2
+    assert len(_tarefas(sessao)) == 1
+
+
+def test_tarefa_com_falha_e_adiada(sessao, modelo, config):
+    _emitir(sessao, modelo, 1)
+    erro = RuntimeError('falhou')
+    with patch.object(fabr.fila, 'pre_renderizar', side_effect=erro):
+        assert fabr.fila.executar_lote(sessao, config) == 1
+    (tarefa,) = _tarefas(sessao)
+    assert tarefa.tentativas == 1
+    assert 'falhou' in tarefa.erro
+    assert tarefa.disponivel_em > dt.datetime.now(dt.UTC)
+    # ainda não está disponível de novo
+    assert fabr.fila.executar_lote(sessao, config) == 0
+
+
+def test_tarefa_nao_e_tentada_alem_do_limite(sessao, modelo, config):
+    _emitir(sessao, modelo, 1)
+    sessao.execute(
+        sa.update(fabr.bd.Tarefa).values(tentativas=config.fila_tentativas),
+    )
+    sessao.commit()
+    assert fabr.fila.executar_lote(sessao, config) == 0
+    assert len(_tarefas(sessao)) == 1
+
+
+def test_reivindicar_pula_tarefas_travadas(sessao, modelo, config):
+    _emitir(sessao, modelo, 2)
+    with fabr.bd.criar_sessao(config) as outra:
+        travadas = fabr.bd.Tarefa.reivindicar(outra, lote=10, tentativas=5)
+        assert len(travadas) == 2
+        assert fabr.bd.Tarefa.reivindicar(sessao, lote=10, tentativas=5) == []
+        sessao.rollback()
+        outra.rollback()
+    assert len(fabr.bd.Tarefa.reivindicar(sessao, lote=10, tentativas=5)) == 2
+    sessao.rollback()
+
+
+def test_trabalhadores_consomem_a_fila(sessao, modelo, config):
+    _emitir(sessao, modelo, 4)
+    config = config.model_copy(update=dict(fila_trabalhadores=2, fila_lote=1))
+    parar = threading.Event()
+    trabalhadores = fabr.fila.iniciar_trabalhadores(config, parar)
+    try:
+        for _ in range(100):
+            if not _tarefas(sessao):
+                break
+            sessao.rollback()
+            parar.wait(0.1)
+    finally:
+        parar.set()
+        for trabalhador in trabalhadores:
+            trabalhador.join()
+    assert _tarefas(sessao) == []
@@ -0,0 +1,133 @@
+import io
+import time
+import urllib.error
+from unittest.mock import patch
+
+import pytest
+
+import fabriquinha as fabr
+
+
+@pytest.fixture
+def buscador():
+    return fabr.recursos.BuscadorDeRecursos(
+        url_base='https://fabriquinha.org',
+        timeout=1,
+        validade=60,
+        tamanho_maximo=8,
+    )
+
+
+def test_buscador_le_estaticos_do_disco(buscador):
+    with patch.object(fabr.recursos.weasyprint, 'default_url_fetcher') as f:
+        recurso = buscador('https://fabriquinha.org/e/cinza.png')
+    assert f.call_count == 0
+    assert recurso['mime_type'] == 'image/png'
+    assert (
+        recurso['string']
+        == (fabr.recursos.ESTATICO / 'cinza.png').read_bytes()
+    )
+
+
+@pytest.mark.parametrize(
+    'url',
+    [
+        'https://fabriquinha.org/e/../ambiente.py',
+        'https://fabriquinha.org/e/%2e%2e/ambiente.py',
+        'file:///etc/passwd',
+    ],
+)
+def test_buscador_recusa_enderecos_locais(buscador, url):
+    with pytest.raises(ValueError, match='não permitido'):
+        buscador(url)
+
+
+def test_buscador_guarda_recursos_externos_em_memoria(buscador):
+    with patch.object(
+        fabr.recursos.weasyprint,
+        'default_url_fetcher',
+        return_value=dict(string=b'img', mime_type='image/png'),
+    ) as f:
+        r1 = buscador('https://imagens.org/a.png')
+        r2 = buscador('https://imagens.org/a.png')
+    assert f.call_count == 1
+    assert f.call_args.kwargs['timeout'] == 1
+    assert r1 == r2 == dict(string=b'img', mime_type='image/png')
+
+
+def test_buscador_limita_a_memoria_dos_recursos(buscador):
+    with patch.object(
+        fabr.recursos.weasyprint,
+        'default_url_fetcher',
+        return_value=dict(string=b'12345'),
+    ):
+        buscador('https://imagens.org/a.png')
+        buscador('https://imagens.org/b.png')
+    assert buscador.recursos.tamanho == 5
+    assert buscador.recursos.obter('https://imagens.org/a.png') is None
+
+
+def test_buscador_evita_servidor_que_falhou(buscador):
+    erro = urllib.error.URLError(TimeoutError('timed out'))
+    with patch.object(
+        fabr.recursos.weasyprint,
+        'default_url_fetcher',
+        side_effect=erro,
+    ) as f:
+        with pytest.raises(urllib.error.URLError):
+            buscador('https://lento.org/a.png')
+        with pytest.raises(OSError, match='indisponível'):
+            buscador('https://lento.org/b.css')
+    assert f.call_count == 1
+
+
+def test_buscador_recusa_recursos_muito_grandes(buscador):
+    grande = b'0' * (fabr.recursos.TAMANHO_MAXIMO + 1)
+    with (
+        patch.object(
+            fabr.recursos.weasyprint,
+            'default_url_fetcher',
+            return_value=dict(string=grande),
+        ),
+        pytest.raises(ValueError, match='muito grande'),
+    ):
+        buscador('https://imagens.org/grande.png')
+
+
+def test_buscador_le_o_arquivo_do_recurso(buscador):
+    with patch.object(
+        fabr.recursos.weasyprint,
+        'default_url_fetcher',
+        return_value=dict(file_obj=io.BytesIO(b'img'), mime_type='image/png'),
+    ):
+        recurso = buscador('https://imagens.org/a.png')
+    assert recurso == dict(string=b'img', mime_type='image/png')
+
+
+class _ServidorLento(io.RawIOBase):
+    """Resposta que nunca termina, com um byte a cada 50 ms."""
+
+    def readable(self):
+        return True
+
+    def read1(self, tamanho=-1):
+        time.sleep(0.05)
+        return b'0'
+
+
+def test_buscador_desiste_de_servidor_lento(buscador):
+    buscador.timeout = 0.3
+    inicio = time.monotonic()
+    with (
+        patch.object(
+            fabr.recursos.weasyprint,
+            'default_url_fetcher',
+            return_value=dict(file_obj=_ServidorLento()),
+        ) as f,
+        pytest.raises(TimeoutError, match='Prazo esgotado'),
+    ):
+        buscador('https://lento.org/a.png')
+    assert time.monotonic() - inicio < 1
+    with pytest.raises(OSError, match='indisponível'):
+        buscador('https://lento.org/b.png')
+    assert f.call_count == 1
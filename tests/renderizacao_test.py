@@ -0,0 +1,346 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import threading
+from unittest.mock import patch
+
+import jinja2
+import PIL.Image
+import pymupdf
+import pytest
+
+import fabriquinha as fabr
+
+
+def test_pdf_para_png_retorna_png(certificados, config):
+    pdf = certificados[0].to_pdf(config)
+    png = fabr.renderizacao.pdf_para_png(pdf)
+    assert png.startswith(b'\x89PNG')
+
+
+def test_converter_imagem_miniatura_em_webp(certificados, config):
+    png = fabr.renderizacao.obter_png(certificados[0], config)
+    webp = fabr.renderizacao.converter_imagem(png, 'miniatura', 'webp')
+    assert webp[:4] == b'RIFF'
+    assert webp[8:12] == b'WEBP'
+    with PIL.Image.open(io.BytesIO(webp)) as imagem:
+        assert imagem.width == fabr.renderizacao.LARGURA_DA_MINIATURA
+
+
+def test_obter_imagem_guarda_a_variante_no_cache(certificados, config):
+    cert = certificados[0]
+    imagem = fabr.renderizacao.obter_imagem(cert, config, 'miniatura', 'png')
+    cache = fabr.cache.criar_cache(config)
+    assert cache.obter(cert.chave(config) + '.miniatura.png') == imagem
+    completo = fabr.renderizacao.obter_imagem(cert, config, 'completo', 'png')
+    assert cache.obter(cert.chave(config) + '.png') == completo
+
+
+def test_renderizar_guarda_pdf_e_png_no_cache(certificados, config):
+    cert = certificados[0]
+    pdf, png = fabr.renderizacao.renderizar(cert, config)
+    cache = fabr.cache.criar_cache(config)
+    assert cache.obter(cert.chave(config) + '.pdf') == pdf
+    assert cache.obter(cert.chave(config) + '.png') == png
+
+
+def test_obter_png_depois_do_pdf_nao_renderiza_de_novo(certificados, config):
+    cert = certificados[0]
+    fabr.renderizacao.obter_pdf(cert, config)
+    with patch.object(fabr.renderizacao, 'executar') as executar:
+        png = fabr.renderizacao.obter_png(cert, config)
+        pdf = fabr.renderizacao.obter_pdf(cert, config)
+    assert executar.call_count == 0
+    assert png.startswith(b'\x89PNG')
+    assert pdf.startswith(b'%PDF')
+
+
+def test_obter_png_so_com_pdf_no_cache_apenas_rasteriza(certificados, config):
+    cert = certificados[0]
+    cache = fabr.cache.criar_cache(config)
+    cache.guardar(cert.chave(config) + '.pdf', cert.to_pdf(config))
+    with patch.object(fabr.renderizacao, 'executar') as executar:
+        png = fabr.renderizacao.obter_png(cert, config)
+    assert executar.call_count == 0
+    assert png.startswith(b'\x89PNG')
+
+
+def test_obter_pdf_assincrono_le_o_cache_fora_do_event_loop(
+    certificados, config
+):
+    cert = certificados[0]
+    pdf = fabr.renderizacao.obter_pdf(cert, config)
+    cache = fabr.cache.criar_cache(config)
+    threads = []
+
+    def obter(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return fabr.cache.CacheEmDisco.obter(cache, *args, **kwargs)
+
+    with (
+        patch.object(cache, 'obter', side_effect=obter),
+        patch.object(
+            fabr.renderizacao,
+            'run_in_threadpool',
+            wraps=fabr.renderizacao.run_in_threadpool,
+        ) as run_in_threadpool,
+    ):
+        resp = asyncio.run(
+            fabr.renderizacao.obter_pdf_assincrono(cert, config)
+        )
+    assert resp == pdf
+    assert threads
+    assert threading.get_ident() not in threads
+    # no mesmo pool de threads das rotas
+    run_in_threadpool.assert_called_once()
+
+
+def test_compilar_modelo_expoe_variaveis(config, gerar_str):
+    html = '{{ titular }} {{ evento }} {{ qrcode }} {% set x = 1 %}{{ x }}'
+    resumo = gerar_str(16)
+    modelo = fabr.renderizacao.compilar_modelo(
+        config,
+        resumo,
+        fabr.bd._comprimir(html),
+    )
+    assert modelo.variaveis == {'titular', 'evento', 'qrcode'}
+    assert modelo.faltantes(dict(titular='a')) == {'evento'}
+    assert modelo.template.render(titular='a', evento='b') == 'a b  1'
+
+
+def test_compilar_modelo_aceita_variaveis_opcionais(config, gerar_str):
+    html = (
+        '{{ titular }}'
+        '{% if duracao is defined %}{{ duracao }} horas{% endif %}'
+        "{{ local | default('online') }}"
+        "{{ 'com ' ~ tema if tema }}"
+        '{% if not online %}{{ evento }}{% endif %}'
+        '{% if nota > 7 %}!{% endif %}'
+    )
+    modelo = fabr.renderizacao.compilar_modelo(
+        config,
+        gerar_str(16),
+        fabr.bd._comprimir(html),
+    )
+    assert modelo.obrigatorias == {'titular', 'nota'}
+    assert modelo.faltantes(dict(titular='a', nota=5)) == set()
+    assert modelo.faltantes(dict(duracao=2)) == {'titular', 'nota'}
+    assert modelo.template.render(titular='a', nota=5) == 'aonline'
+
+
+def test_compilar_modelo_usa_o_cache_pelo_resumo(config, gerar_str):
+    resumo = gerar_str(16)
+    htmlzip = fabr.bd._comprimir('{{ a }}')
+    m1 = fabr.renderizacao.compilar_modelo(config, resumo, htmlzip)
+    with patch.object(fabr.bd, '_descomprimir') as descomprimir:
+        m2 = fabr.renderizacao.compilar_modelo(config, resumo, htmlzip)
+    assert descomprimir.call_count == 0
+    assert m1 is m2
+
+
+def test_compilar_modelo_roda_numa_sandbox(config, gerar_str):
+    htmlzip = fabr.bd._comprimir('{{ a.__class__.__name__ }}')
+    modelo = fabr.renderizacao.compilar_modelo(config, gerar_str(16), htmlzip)
+    with pytest.raises(jinja2.exceptions.SecurityError):
+        modelo.template.render(a=1)
+
+
+def test_executar_sem_pool_roda_no_proprio_processo(config):
+    config = config.model_copy(update=dict(render_processos=0))
+    assert fabr.renderizacao.criar_pool(config) is None
+    resp = fabr.renderizacao.executar(config, divmod, 7, 2)
+    assert resp == (3, 1)
+
+
+def test_executar_com_pool_renderiza_em_outro_processo(config, html):
+    config = config.model_copy(update=dict(render_processos=1))
+    try:
+        pdf = fabr.renderizacao.executar(
+            config,
+            fabr.renderizacao.html_para_pdf,
+            config,
+            html,
+        )
+        pool = fabr.renderizacao.criar_pool(config)
+        assert pool is not None
+        assert fabr.renderizacao.criar_pool(config) is pool
+        processos = list(pool._processes.values())
+    finally:
+        fabr.renderizacao.fechar_pool(config)
+    assert pdf.startswith(b'%PDF')
+    assert processos
+    assert not any(p.is_alive() for p in processos)
+    assert fabr.renderizacao.criar_pool(config) is not pool
+    fabr.renderizacao.fechar_pool(config)
+
+
+def _pdf_com_output_intent(paginas):
+    doc = pymupdf.Document()
+    for i in range(paginas):
+        doc.new_page().insert_text((72, 72), f'pagina {i}')
+    icc = doc.get_new_xref()
+    doc.update_object(icc, '<< /N 3 >>')
+    doc.update_stream(icc, b'perfil icc')
+    intencao = f'<< /S /GTS_PDFA1 /DestOutputProfile {icc} 0 R >>'
+    doc.xref_set_key(doc.pdf_catalog(), 'OutputIntents', f'[{intencao}]')
+    doc.set_metadata(dict(title='certificado'))
+    return doc.tobytes()
+
+
+def test_dividir_pdf_preserva_paginas_e_pdfa():
+    pdf = _pdf_com_output_intent(5)
+    partes = fabr.renderizacao.dividir_pdf(pdf, [1, 3, 1])
+    docs = [pymupdf.Document(stream=p) for p in partes]
+    assert [d.page_count for d in docs] == [1, 3, 1]
+    assert docs[1][2].get_text().strip() == 'pagina 3'
+    for doc in docs:
+        assert doc.metadata['title'] == 'certificado'
+        tipo, intencoes = doc.xref_get_key(doc.pdf_catalog(), 'OutputIntents')
+        assert tipo == 'array'
+        icc = int(intencoes.split('/DestOutputProfile')[1].split()[0])
+        assert doc.xref_stream(icc) == b'perfil icc'
+
+
+def test_gerar_pdfs_retorna_um_pdf_por_contexto_em_ordem(config, gerar_str):
+    htmlzip = fabr.bd._comprimir('<p>{{ nome }}</p>')
+    contextos = [
+        dict(nome=f'pessoa {i}', url_validacao=f'http://x/v/{i}')
+        for i in range(4)
+    ]
+    pdfs = fabr.renderizacao.gerar_pdfs(
+        config,
+        gerar_str(16),
+        htmlzip,
+        contextos,
+    )
+    assert len(pdfs) == len(contextos)
+    for i, pdf in enumerate(pdfs):
+        doc = pymupdf.Document(stream=pdf)
+        assert doc.page_count == 1
+        assert f'pessoa {i}' in doc[0].get_text()
+
+
+def test_gerar_pdfs_gera_os_qrcodes_em_lote(config, gerar_str):
+    htmlzip = fabr.bd._comprimir('<p>{{ nome }}</p>{{ qrcode_svg }}')
+    contextos = [
+        dict(nome=f'pessoa {i}', url_validacao=f'http://x/v/{i % 2}')
+        for i in range(4)
+    ]
+    with (
+        patch.object(
+            fabr.bd,
+            'gerar_qrcodes',
+            wraps=fabr.bd.gerar_qrcodes,
+        ) as gerar_qrcodes,
+        patch.object(fabr.bd, 'gerar_qrcode') as gerar_qrcode,
+    ):
+        pdfs = fabr.renderizacao.gerar_pdfs(
+            config,
+            gerar_str(16),
+            htmlzip,
+            contextos,
+        )
+    assert len(pdfs) == 4
+    assert gerar_qrcodes.call_count == 1
+    urls, gerar = gerar_qrcodes.call_args.args
+    assert urls == [c['url_validacao'] for c in contextos]
+    assert gerar is fabr.bd.gerar_qrcode_svg
+    assert gerar_qrcode.call_count == 0
+
+
+def test_obter_pdfs_renderiza_em_lote_so_os_faltantes(certificados, config):
+    config = config.model_copy(update=dict(render_processos=0))
+    fabr.renderizacao.renderizar(certificados[3], config)
+    with patch.object(
+        fabr.renderizacao,
+        'gerar_pdfs_e_pngs',
+        wraps=fabr.renderizacao.gerar_pdfs_e_pngs,
+    ) as gerar:
+        resp = list(fabr.renderizacao.obter_pdfs(certificados, config, lote=4))
+    assert [c for c, _ in resp] == certificados
+    assert [len(k['contextos']) for _, k in gerar.call_args_list] == [3, 4, 2]
+    cache = fabr.cache.criar_cache(config)
+    for cert, pdf in resp:
+        assert cache.obter(cert.chave(config) + '.pdf') == pdf
+
+
+def test_usar_fontes_e_compartilhada_entre_as_threads():
+    with patch.object(fabr.renderizacao, '_fontes', []):
+        with (
+            fabr.renderizacao.usar_fontes() as fontes,
+            fabr.renderizacao.usar_fontes() as outras,
+        ):
+            assert outras is not fontes
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            emprestadas = pool.submit(_fontes_emprestadas).result()
+        assert emprestadas is fontes
+
+
+def _fontes_emprestadas():
+    with fabr.renderizacao.usar_fontes() as fontes:
+        return fontes
+
+
+def test_usar_fontes_guarda_no_maximo_o_limite():
+    with (
+        patch.object(fabr.renderizacao, '_fontes', []) as estoque,
+        patch.object(fabr.renderizacao, 'MAXIMO_DE_FONTES', 2),
+        contextlib.ExitStack() as pilha,
+    ):
+        for _ in range(3):
+            pilha.enter_context(fabr.renderizacao.usar_fontes())
+        pilha.close()
+        assert len(estoque) == 2
+
+
+def test_aquecer_deixa_as_fontes_para_as_outras_threads(config):
+    config = config.model_copy(update=dict(render_processos=0))
+    fabr.renderizacao._aquecer_processo.cache_clear()
+    with patch.object(fabr.renderizacao, '_fontes', []) as estoque:
+        fabr.renderizacao.aquecer(config)
+        assert len(estoque) == 1
+        aquecidas = estoque[0]
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            assert pool.submit(_fontes_emprestadas).result() is aquecidas
+
+
+def test_html_para_pdf_renderiza_em_paralelo_nas_threads(config):
+    # cada renderização só termina quando a outra também começou
+    barreira = threading.Barrier(2, timeout=5)
+
+    class HTML:
+        def write_pdf(self, **kwargs):
+            barreira.wait()
+            return b'%PDF'
+
+    with (
+        patch.object(fabr.renderizacao, '_html', return_value=HTML()),
+        concurrent.futures.ThreadPoolExecutor(2) as pool,
+    ):
+        futuros = [
+            pool.submit(fabr.renderizacao.html_para_pdf, config, '')
+            for _ in range(2)
+        ]
+        pdfs = [f.result() for f in futuros]
+    assert pdfs == [b'%PDF', b'%PDF']
+
+
+def test_aquecer_compila_o_modelo_ficticio(config):
+    config = config.model_copy(update=dict(render_processos=0))
+    fabr.renderizacao.aquecer(config)
+    modelos = fabr.renderizacao.criar_cache_de_modelos(config)
+    assert modelos.obter('aquecimento') is not None
+
+
+def test_gerar_pdf_so_gera_os_qrcodes_usados_pelo_modelo(config, gerar_str):
+    htmlzip = fabr.bd._comprimir('<p>{{ qrcode_svg }}</p>')
+    with patch.object(fabr.bd, 'gerar_qrcode') as gerar_qrcode:
+        pdf = fabr.renderizacao.gerar_pdf(
+            config,
+            gerar_str(16),
+            htmlzip,
+            dict(url_validacao='http://x/v/1'),
+        )
+    assert gerar_qrcode.call_count == 0
+    assert pdf.startswith(b'%PDF')
@@ -0,0 +1,71 @@
+import datetime as dt
+
+from fastapi.testclient import TestClient
+
+import fabriquinha as fabr
+
+
+def _emitir(sessao, modelo, titulares):
+    codigos = fabr.bd.Certificado.emitir(
+        sessao=sessao,
+        modelo=modelo,
+        data=dt.date(2020, 1, 1),
+        conteudos=[
+            dict(titular=t, email=f'{t.lower()}@exemplo.com')
+            for t in titulares
+        ],
+    )
+    sessao.commit()
+    return codigos
+
+
+def test_get_busca_pelo_email(sessao, modelo, cliente):
+    (_, codigo) = _emitir(sessao, modelo, ['Ana', 'Bia'])
+    resp = cliente.get('/busca', params=dict(email='Bia@Exemplo.com'))
+    assert resp.status_code == 200
+    assert f'/v/{codigo}' in resp.text
+    assert 'Ana' not in resp.text
+
+
+def test_get_busca_nao_aceita_parte_do_nome_ou_do_email(
+    sessao, modelo, cliente
+):
+    _emitir(sessao, modelo, ['Ana'])
+    for termo in ['ana', 'Ana', 'exemplo.com', 'ana@', '%@exemplo.com']:
+        resp = cliente.get('/busca', params=dict(email=termo))
+        assert resp.status_code == 200
+        assert 'href="/v/' not in resp.text
+
+
+def test_get_busca_sem_resultados(sessao, modelo, cliente):
+    _emitir(sessao, modelo, ['Ana'])
+    resp = cliente.get('/busca', params=dict(email='carla@exemplo.com'))
+    assert 'Nenhum certificado encontrado' in resp.text
+
+
+def test_get_busca_paginada(sessao, modelo, cliente, monkeypatch):
+    monkeypatch.setattr(fabr.rotas, 'RESULTADOS_POR_PAGINA', 2)
+    for _ in range(3):
+        _emitir(sessao, modelo, ['Ana'])
+    resp = cliente.get('/busca', params=dict(email='ana@exemplo.com'))
+    assert resp.text.count('href="/v/') == 2
+    proxima = resp.text.split('href="?', 1)[1].split('"', 1)[0]
+    resp = cliente.get('/busca?' + proxima.replace('&amp;', '&'))
+    assert resp.text.count('href="/v/') == 1
+    assert 'Próxima página' not in resp.text
+
+
+def test_get_busca_limitada_por_endereco(sessao, modelo, config):
+    _emitir(sessao, modelo, ['Ana'])
+    config = config.model_copy(update=dict(busca_limite=2))
+    params = dict(email='ana@exemplo.com')
+    with TestClient(fabr.main.criar_app(config)) as cliente:
+        for _ in range(2):
+            resp = cliente.get('/busca', params=params)
+            assert resp.status_code == 200
+        resp = cliente.get('/busca', params=params)
+        assert resp.status_code == 429
+        assert int(resp.headers['retry-after']) <= 60
+        # o que não é um email não consulta o banco nem conta
+        resp = cliente.get('/busca', params=dict(email='ana'))
+        assert resp.status_code == 200
@@ -0,0 +1,80 @@
+import datetime as dt
+import io
+import zipfile
+
+import fabriquinha as fabr
+
+
+def test_gerar_zip_produz_um_pedaco_por_arquivo():
+    arquivos = [(f'{n}.pdf', bytes([n]) * 100) for n in range(3)]
+    pedacos = list(fabr.rotas.gerar_zip(arquivos))
+    assert len(pedacos) == 4
+    with zipfile.ZipFile(io.BytesIO(b''.join(pedacos))) as zf:
+        assert zf.namelist() == ['0.pdf', '1.pdf', '2.pdf']
+        assert zf.read('2.pdf') == bytes([2]) * 100
+
+
+def test_get_certificados_zip(cliente, acessos, admin, modelo, certificados):
+    resp = cliente.get(f'/modelo/{modelo.id}/certificados.zip')
+    assert resp.status_code == 200, resp.text
+    assert resp.headers['content-type'] == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        nomes = zf.namelist()
+        assert nomes == [f'{c.codigo}.pdf' for c in certificados]
+        assert zf.read(nomes[0]).startswith(b'%PDF')
+
+
+def test_get_certificados_zip_filtra_pela_data(
+    sessao,
+    cliente,
+    acessos,
+    admin,
+    modelo,
+    certificados,
+):
+    certificados[0].data = dt.date(2021, 1, 1)
+    sessao.commit()
+    resp = cliente.get(
+        f'/modelo/{modelo.id}/certificados.zip',
+        params=dict(data='2021-01-01'),
+    )
+    assert resp.status_code == 200, resp.text
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        assert zf.namelist() == [f'{certificados[0].codigo}.pdf']
+
+
+def test_get_certificados_zip_com_usuaria_sem_acesso(cliente, admin, modelo):
+    resp = cliente.get(f'/modelo/{modelo.id}/certificados.zip')
+    assert resp.status_code == 403
+
+
+def test_get_certificados_zip_le_os_certificados_em_paginas(
+    cliente,
+    acessos,
+    admin,
+    modelo,
+    certificados,
+    monkeypatch,
+):
+    monkeypatch.setattr(fabr.rotas, 'CERTIFICADOS_POR_LEITURA', 3)
+    resp = cliente.get(f'/modelo/{modelo.id}/certificados.zip')
+    assert resp.status_code == 200, resp.text
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        assert zf.namelist() == [f'{c.codigo}.pdf' for c in certificados]
+
+
+def test_certificados_do_zip_nao_seguram_a_conexao(
+    config,
+    modelo,
+    certificados,
+    monkeypatch,
+):
+    monkeypatch.setattr(fabr.rotas, 'CERTIFICADOS_POR_LEITURA', 4)
+    motor = fabr.bd.criar_fabrica_de_sessoes(config).kw['bind']
+    codigos = []
+    for cert in fabr.rotas._certificados_do_zip(config, modelo.id, None):
+        assert motor.pool.checkedout() == 0
+        assert cert.modelo.comunidade.nome == 'GruPy-SP'
+        assert cert.modelo.htmlzip == modelo.htmlzip
+        codigos.append(cert.codigo)
+    assert codigos == [c.codigo for c in certificados]
@@ -1,8 +1,114 @@
-import pytest
+from unittest.mock import patch
+
+import fabriquinha as fabr
 
 
-@pytest.mark.skip
 def test_get_comunidade(sessao, cliente, acessos, comunidades, admin):
     resp = cliente.get(f'/comunidade/{comunidades[0].nome}')
     assert resp.status_code == 200
     assert comunidades[0].nome in resp.text
+
+
+def test_get_comunidade_lista_so_as_pessoas_da_comunidade(
+    cliente,
+    acessos,
+    comunidades,
+    usuarias,
+    admin,
+):
+    resp = cliente.get(f'/comunidade/{comunidades[1].nome}')
+    assert resp.status_code == 200
+    for u in usuarias[:2]:
+        assert u.nome in resp.text
+    for u in usuarias[2:6]:
+        assert u.nome not in resp.text
+
+
+def test_get_comunidade_paginada(
+    cliente,
+    acessos,
+    comunidades,
+    usuarias,
+    admin,
+    monkeypatch,
+):
+    monkeypatch.setattr(fabr.rotas, 'MEMBROS_POR_PAGINA', 4)
+    url = f'/comunidade/{comunidades[0].nome}'
+    resp = cliente.get(url)
+    assert 'Próxima página' in resp.text
+    proxima = resp.text.split('href="?depois=', 1)[1].split('"', 1)[0]
+    resp2 = cliente.get(f'{url}?depois={proxima}')
+    assert 'Próxima página' not in resp2.text
+    assert resp.text.count('<th scope="row">') == 4
+    assert resp2.text.count('<th scope="row">') == 2
+    # a primeira pessoa é quem está logada, e aparece nas duas páginas
+    for u in usuarias[1:6]:
+        assert (u.nome in resp.text) != (u.nome in resp2.text)
+
+
+def test_get_comunidade_com_etag_responde_304(
+    cliente,
+    acessos,
+    comunidades,
+    admin,
+):
+    url = f'/comunidade/{comunidades[0].nome}'
+    etag = cliente.get(url).headers['etag']
+    resp = cliente.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert 'private' in resp.headers['cache-control']
+
+
+def test_get_comunidade_sem_acesso_ou_inexistente(
+    sessao,
+    cliente,
+    acessos,
+    usuarias,
+    admin,
+):
+    sessao.add(fabr.bd.Comunidade(nome='Outra'))
+    sessao.commit()
+    assert cliente.get('/comunidade/Outra').status_code == 403
+    assert cliente.get('/comunidade/Nenhuma').status_code == 404
+
+
+def test_get_comunidade_com_etag_nao_consulta_as_pessoas(
+    cliente,
+    acessos,
+    comunidades,
+    admin,
+):
+    url = f'/comunidade/{comunidades[0].nome}'
+    etag = cliente.get(url).headers['etag']
+    with patch.object(fabr.bd.Acesso, 'membros') as membros:
+        resp = cliente.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert membros.call_count == 0
+
+
+def test_get_comunidade_etag_muda_com_as_pessoas(
+    sessao,
+    cliente,
+    acessos,
+    comunidades,
+    usuarias,
+    admin,
+):
+    url = f'/comunidade/{comunidades[1].nome}'
+    etag = cliente.get(url).headers['etag']
+    sessao.add(
+        fabr.bd.Acesso(
+            usuaria_id=usuarias[7].id,
+            comunidade_id=comunidades[1].id,
+            tipo='organizadora',
+        )
+    )
+    sessao.commit()
+    resp = cliente.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert usuarias[7].nome in resp.text
+
+    usuarias[1].ativa = False
+    sessao.commit()
+    resp2 = cliente.get(url, headers={'If-None-Match': resp.headers['etag']})
+    assert resp2.status_code == 200
@@ -1,3 +1,9 @@
+import email.utils
+from unittest.mock import patch
+
+import fabriquinha as fabr
+
+
 def test_get_download_com_codigo_valido(certificados, cliente):
     resp = cliente.get('download/' + certificados[0].codigo + '.pdf')
     assert resp.status_code == 200
@@ -7,9 +13,165 @@ def test_get_download_com_codigo_valido(certificados, cliente):
     assert len(conteudo) > 1024
 
 
+def test_get_download_repetido_usa_o_cache(certificados, cliente, config):
+    cache = fabr.cache.criar_cache(config)
+    resp1 = cliente.get('download/' + certificados[0].codigo + '.pdf')
+    acertos, falhas = cache.acertos, cache.falhas
+    resp2 = cliente.get('download/' + certificados[0].codigo + '.pdf')
+    assert resp1.content == resp2.content
+    assert cache.acertos == acertos + 1
+    assert cache.falhas == falhas
+
+
 def test_get_download_com_codigo_inexistente(certificados, cliente):
     resp = cliente.get('download/' + certificados[0].codigo + 'a.pdf')
     assert resp.status_code == 200
     assert 'não encontrado' in resp.text
     assert len(resp.history) == 1
     assert resp.history[0].status_code == 302
+
+
+def test_get_download_tem_cabecalhos_de_cache(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    for _ in range(2):
+        # a primeira renderiza, a segunda lê do cache em disco
+        resp = cliente.get(url)
+        resumo = fabr.artefatos.resumir(resp.content)
+        assert resp.headers['etag'] == f'"{resumo}"'
+        assert 'last-modified' in resp.headers
+        assert 'immutable' in resp.headers['cache-control']
+
+
+def test_get_download_com_etag_responde_304(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    etag = cliente.get(url).headers['etag']
+    with patch.object(
+        fabr.bd.Certificado,
+        'carregar_html_assincrono',
+    ) as carregar:
+        resp = cliente.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.content == b''
+    assert resp.headers['etag'] == etag
+    carregar.assert_not_called()
+
+
+def test_get_download_com_if_modified_since_responde_304(
+    certificados, cliente
+):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    modificado = cliente.get(url).headers['last-modified']
+    with patch.object(
+        fabr.bd.Certificado,
+        'carregar_html_assincrono',
+    ) as carregar:
+        resp = cliente.get(url, headers={'If-Modified-Since': modificado})
+    assert resp.status_code == 304
+    assert resp.headers['last-modified'] == modificado
+    carregar.assert_not_called()
+
+    antes = email.utils.parsedate_to_datetime(modificado).timestamp() - 1
+    resp = cliente.get(
+        url,
+        headers={'If-Modified-Since': email.utils.formatdate(antes)},
+    )
+    assert resp.status_code == 200
+    assert len(resp.content) > 1024
+
+
+def test_get_download_com_etag_diferente(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    resp = cliente.get(url, headers={'If-None-Match': '"outro", W/"mais"'})
+    assert resp.status_code == 200
+    assert len(resp.content) > 1024
+
+
+def test_get_download_etag_muda_com_o_arquivo_renderizado_de_novo(
+    certificados, cliente, config
+):
+    cert = certificados[0]
+    url = 'download/' + cert.codigo + '.pdf'
+
+    # renderizado em lote, como na exportação em zip e na fila
+    [(_, pdf_lote)] = fabr.renderizacao.obter_pdfs([cert], config)
+    lote = cliente.get(url)
+    assert lote.content == pdf_lote
+    resumo = fabr.artefatos.resumir(pdf_lote)
+    assert lote.headers['etag'] == f'"{resumo}"'
+
+    # renderizado de novo, sozinho, como depois de um descarte do cache: o
+    # pdf dividido do lote não tem os mesmos bytes
+    pdf_unico, _ = fabr.renderizacao.renderizar(cert, config)
+    assert pdf_unico != pdf_lote
+    resp = cliente.get(
+        url,
+        headers={'Range': 'bytes=10-', 'If-Range': lote.headers['etag']},
+    )
+    assert resp.status_code == 200
+    assert resp.content == pdf_unico
+    resumo = fabr.artefatos.resumir(pdf_unico)
+    assert resp.headers['etag'] == f'"{resumo}"'
+
+
+def test_get_download_tem_content_length(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    for _ in range(2):
+        # a primeira renderiza, a segunda lê do cache em disco
+        resp = cliente.get(url)
+        assert resp.status_code == 200
+        assert int(resp.headers['content-length']) == len(resp.content)
+        assert 'certificado.pdf' in resp.headers['content-disposition']
+
+
+def test_get_download_com_range(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    completo = cliente.get(url)
+    resp = cliente.get(url, headers={'Range': 'bytes=100-199'})
+    assert resp.status_code == 206
+    assert resp.content == completo.content[100:200]
+    tamanho = len(completo.content)
+    assert resp.headers['content-range'] == f'bytes 100-199/{tamanho}'
+
+
+def test_get_download_com_if_range(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    completo = cliente.get(url)
+    resp = cliente.get(
+        url,
+        headers={'Range': 'bytes=10-', 'If-Range': completo.headers['etag']},
+    )
+    assert resp.status_code == 206
+    assert resp.content == completo.content[10:]
+    resp = cliente.get(
+        url,
+        headers={'Range': 'bytes=10-', 'If-Range': '"outra-versao"'},
+    )
+    assert resp.status_code == 200
+    assert resp.content == completo.content
+
+
+def test_get_download_consulta_o_cache_numa_thread(certificados, cliente):
+    url = 'download/' + certificados[0].codigo + '.pdf'
+    cliente.get(url)
+    with patch.object(
+        fabr.rotas,
+        'run_in_threadpool',
+        wraps=fabr.rotas.run_in_threadpool,
+    ) as run_in_threadpool:
+        resp = cliente.get(url)
+    assert resp.status_code == 200
+    consultar = run_in_threadpool.call_args.args[0]
+    assert consultar.__func__ is fabr.cache.CacheEmDisco.consultar
+
+
+def test_get_download_renderiza_no_cache_do_contexto(
+    certificados, cliente, config, tmp_path
+):
+    cache = fabr.cache.CacheEmDisco(tmp_path, tamanho_maximo=2**24)
+    cliente.app.dependency_overrides[fabr.aplicacao.cache_deps] = lambda: cache
+    cert = certificados[0]
+    resp = cliente.get('download/' + cert.codigo + '.pdf')
+    assert resp.status_code == 200
+    assert cache.obter(cert.chave(config) + '.pdf') == resp.content
+    processo = fabr.cache.criar_cache(config)
+    assert processo.obter(cert.chave(config) + '.pdf') is None
@@ -0,0 +1,128 @@
+import sqlalchemy as sa
+
+import fabriquinha as fabr
+
+
+def conteudo(n):
+    return dict(titular=f'pessoa {n}', evento='evento', duracao='2h')
+
+
+def test_post_emitir_nao_logado_redireciona_para_login(cliente, modelo):
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir',
+        json=dict(data='2020-01-01', conteudos=[conteudo(0)]),
+        follow_redirects=False,
+    )
+    assert resp.status_code == 303
+    assert resp.headers['location'] == '/login'
+
+
+def test_post_emitir(sessao, cliente, acessos, admin, modelo):
+    conteudos = [conteudo(n) for n in range(30)]
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir',
+        json=dict(data='2020-01-01', conteudos=conteudos),
+    )
+    assert resp.status_code == 201, resp.text
+    codigos = resp.json()['codigos']
+    assert len(codigos) == 30
+    assert len(set(codigos)) == 30
+
+    stmt = sa.select(fabr.bd.Certificado).order_by(fabr.bd.Certificado.id)
+    certificados = sessao.execute(stmt).scalars().all()
+    assert [c.codigo for c in certificados] == codigos
+    assert [c.conteudo for c in certificados] == conteudos
+    assert all(c.modelo_id == modelo.id for c in certificados)
+
+
+def test_post_emitir_csv(sessao, cliente, acessos, admin, modelo):
+    csv = 'titular,evento,duracao\nana,pybr,2h\nbia,pybr,3h\n'
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir.csv',
+        data=dict(data='2020-01-01'),
+        files=dict(arquivo=('lista.csv', csv, 'text/csv')),
+    )
+    assert resp.status_code == 201, resp.text
+    assert len(resp.json()['codigos']) == 2
+
+    stmt = sa.select(fabr.bd.Certificado).order_by(fabr.bd.Certificado.id)
+    certificados = sessao.execute(stmt).scalars().all()
+    assert [c.conteudo['titular'] for c in certificados] == ['ana', 'bia']
+
+
+def test_post_emitir_csv_fora_do_utf8(sessao, cliente, acessos, admin, modelo):
+    csv = 'titular,evento,duracao\nJoão,pybr,2h\n'.encode('cp1252')
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir.csv',
+        data=dict(data='2020-01-01'),
+        files=dict(arquivo=('lista.csv', csv, 'text/csv')),
+    )
+    assert resp.status_code == 422
+    assert resp.json()['detail'] == 'O arquivo csv deve estar em UTF-8.'
+    stmt = sa.select(fabr.bd.Certificado)
+    assert sessao.execute(stmt).scalars().all() == []
+
+
+def test_post_emitir_csv_com_linhas_irregulares(
+    sessao, cliente, acessos, admin, modelo
+):
+    csv = 'titular,evento,duracao\nana,pybr,2h\n\nbia,pybr\ncris,pybr,2h,x\n'
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir.csv',
+        data=dict(data='2020-01-01'),
+        files=dict(arquivo=('lista.csv', csv, 'text/csv')),
+    )
+    assert resp.status_code == 422
+    assert resp.json()['detail'] == [
+        dict(linha=1, colunas=2, esperadas=3),
+        dict(linha=2, colunas=4, esperadas=3),
+    ]
+    stmt = sa.select(fabr.bd.Certificado)
+    assert sessao.execute(stmt).scalars().all() == []
+
+
+def test_post_emitir_com_campos_faltantes(
+    sessao, cliente, acessos, admin, modelo
+):
+    conteudos = [conteudo(0), dict(titular='ana')]
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir',
+        json=dict(data='2020-01-01', conteudos=conteudos),
+    )
+    assert resp.status_code == 422
+    assert resp.json()['detail'] == [
+        dict(linha=1, faltantes=['duracao', 'evento']),
+    ]
+    stmt = sa.select(fabr.bd.Certificado)
+    assert sessao.execute(stmt).scalars().all() == []
+
+
+def test_post_emitir_com_usuaria_sem_acesso(sessao, cliente, admin, modelo):
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir',
+        json=dict(data='2020-01-01', conteudos=[conteudo(0)]),
+    )
+    assert resp.status_code == 403
+
+
+def test_post_emitir_com_modelo_inexistente(cliente, acessos, admin, modelo):
+    resp = cliente.post(
+        f'/modelo/{modelo.id + 1}/emitir',
+        json=dict(data='2020-01-01', conteudos=[conteudo(0)]),
+    )
+    assert resp.status_code == 404
+
+
+def test_post_emitir_compila_no_cache_de_modelos_do_contexto(
+    cliente, acessos, admin, modelo
+):
+    modelos = fabr.cache.CacheLRU(tamanho_maximo=4)
+    cliente.app.dependency_overrides[fabr.aplicacao.modelos_deps] = (
+        lambda: modelos
+    )
+    resp = cliente.post(
+        f'/modelo/{modelo.id}/emitir',
+        json=dict(data='2020-01-01', conteudos=[conteudo(0)]),
+    )
+    assert resp.status_code == 201, resp.text
+    assert modelos.obter(modelo.resumo) is not None
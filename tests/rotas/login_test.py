@@ -1,5 +1,7 @@
 import pytest
 
+import fabriquinha as fabr
+
 
 def test_get_login(cliente):
     resp = cliente.get('/login')
@@ -36,3 +38,27 @@ def test_post_login_com_informacao_incorreta(incorreto, usuaria, cliente):
     assert 'set-cookie' not in resp.headers
     assert 'location' in resp.headers
     assert resp.headers['location'] == r'/login'
+
+
+def test_post_login_refaz_hash_com_o_custo_da_config(
+    sessao,
+    usuaria,
+    cliente,
+    config,
+):
+    hash_antigo = usuaria.senha
+    hasher = fabr.bd.criar_hasher(config)
+    assert hasher.check_needs_rehash(hash_antigo)
+
+    dados = dict(nome=usuaria.nome, senha='senha')
+    resp = cliente.post('/login', data=dados, follow_redirects=False)
+    assert resp.headers['location'] == r'/u'
+
+    sessao.refresh(usuaria)
+    assert usuaria.senha != hash_antigo
+    assert not hasher.check_needs_rehash(usuaria.senha)
+    assert usuaria.verifica_senha('senha')
+
+    # o novo hash continua valendo para o próximo login
+    resp = cliente.post('/login', data=dados, follow_redirects=False)
+    assert resp.headers['location'] == r'/u'
@@ -1,5 +1,9 @@
 from unittest.mock import patch
 
+import sqlalchemy as sa
+
+import fabriquinha as fabr
+
 
 def test_get_u_sem_usuario_retorna_redirecionamento_para_login(cliente):
     resp = cliente.get('/u', follow_redirects=False)
@@ -78,3 +82,84 @@ def test_get_u_com_token_gerado_para_usuaria_inativa(sessao, usuaria, cliente):
     assert resp2.status_code == 303
     assert 'location' in resp2.headers
     assert resp2.headers['location'] == r'/login'
+
+
+def _entrar(cliente, usuaria):
+    resp = cliente.post(
+        '/login',
+        data=dict(nome=usuaria.nome, senha='senha'),
+        follow_redirects=False,
+    )
+    cliente.cookies.set('Authorization', resp.cookies.get('Authorization'))
+
+
+def test_get_u_repetido_nao_busca_a_usuaria_de_novo(usuaria, cliente):
+    _entrar(cliente, usuaria)
+    cliente.get('/u')
+    with patch.object(
+        fabr.bd.Usuaria,
+        'buscar',
+        wraps=fabr.bd.Usuaria.buscar,
+    ) as buscar:
+        resp = cliente.get('/u')
+    assert resp.status_code == 200
+    assert usuaria.nome in resp.text
+    assert buscar.call_count == 0
+
+
+def test_get_u_depois_de_inativar_usuaria_ja_em_cache(
+    sessao, usuaria, cliente
+):
+    _entrar(cliente, usuaria)
+    assert cliente.get('/u').status_code == 200
+
+    usuaria.ativa = False
+    sessao.commit()
+
+    resp = cliente.get('/u', follow_redirects=False)
+    assert resp.status_code == 303
+    assert resp.headers['location'] == r'/login'
+
+
+def test_get_u_mostra_acesso_novo_a_usuaria_ja_em_cache(
+    sessao,
+    usuaria,
+    comunidades,
+    cliente,
+):
+    _entrar(cliente, usuaria)
+    assert 'PyLadies' not in cliente.get('/u').text
+
+    acesso = fabr.bd.Acesso(
+        usuaria_id=usuaria.id,
+        comunidade_id=comunidades[1].id,
+        tipo='organizadora',
+    )
+    sessao.add(acesso)
+    sessao.commit()
+
+    assert 'PyLadies' in cliente.get('/u').text
+
+
+def test_paginas_com_usuaria_em_cache_nao_consultam_acessos(
+    usuaria,
+    acessos,
+    comunidades,
+    cliente,
+):
+    _entrar(cliente, usuaria)
+    cliente.get('/u')
+
+    consultas = []
+    motor = cliente.app.state.contexto.motor
+    ouvinte = lambda *args: consultas.append(args[2])
+    sa.event.listen(motor, 'before_cursor_execute', ouvinte)
+    try:
+        assert cliente.get('/u').status_code == 200
+        assert cliente.get('/criar-modelo').status_code == 200
+        resp = cliente.get(f'/comunidade/{comunidades[0].nome}')
+        assert resp.status_code == 200
+    finally:
+        sa.event.remove(motor, 'before_cursor_execute', ouvinte)
+    # só a lista de pessoas da comunidade
+    assert len([c for c in consultas if 'acesso' in c]) == 1
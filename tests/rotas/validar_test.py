@@ -1,3 +1,17 @@
+import sqlalchemy as sa
+
+
+def _contar_consultas(cliente):
+    consultas = []
+    motor = cliente.app.state.contexto.motor_assincrono.sync_engine
+    sa.event.listen(
+        motor,
+        'before_cursor_execute',
+        lambda *args: consultas.append(args[2]),
+    )
+    return consultas
+
+
 def test_get_validar_com_codigo_inexistente(certificados, cliente):
     resp = cliente.get('v/aaaaaaaaaaa')
     assert resp.status_code == 200
@@ -9,3 +23,76 @@ def test_get_validar_com_codigo_valido(certificados, cliente):
     assert resp.status_code == 200
     assert certificados[0].modelo.comunidade.nome in resp.text
     assert 'Certificado OK!' in resp.text
+
+
+def test_get_validar_com_etag_responde_304(certificados, cliente):
+    url = 'v/' + certificados[0].codigo
+    resp = cliente.get(url)
+    assert resp.headers['cache-control'] == 'no-cache'
+    resp = cliente.get(url, headers={'If-None-Match': resp.headers['etag']})
+    assert resp.status_code == 304
+    assert resp.content == b''
+
+
+def test_get_validar_faz_uma_consulta(certificados, cliente):
+    consultas = _contar_consultas(cliente)
+    cliente.get('v/' + certificados[0].codigo)
+    assert len(consultas) == 1
+    assert 'htmlzip' not in consultas[0]
+
+
+def test_get_validar_etag_diferente_do_download(certificados, cliente):
+    codigo = certificados[0].codigo
+    validar = cliente.get('v/' + codigo).headers['etag']
+    download = cliente.get('download/' + codigo + '.pdf').headers['etag']
+    assert validar != download
+
+
+def test_get_validar_inexistente_sem_etag(certificados, cliente):
+    resp = cliente.get('v/aaaaaaaaaaa')
+    assert 'etag' not in resp.headers
+
+
+def test_get_validar_nao_embute_a_imagem(certificados, cliente):
+    codigo = certificados[0].codigo
+    resp = cliente.get('v/' + codigo)
+    assert 'base64' not in resp.text
+    assert f'/v/{codigo}.webp' in resp.text
+    assert 'loading="lazy"' in resp.text
+
+
+def test_get_imagem_png_e_webp(certificados, cliente):
+    codigo = certificados[0].codigo
+    resp = cliente.get(f'v/{codigo}.png')
+    assert resp.status_code == 200
+    assert resp.headers['content-type'] == 'image/png'
+    assert resp.content.startswith(b'\x89PNG')
+    assert 'immutable' in resp.headers['cache-control']
+    resp = cliente.get(f'v/{codigo}.webp')
+    assert resp.status_code == 200
+    assert resp.headers['content-type'] == 'image/webp'
+    assert resp.content[8:12] == b'WEBP'
+
+
+def test_get_imagem_miniatura_menor_que_a_completa(certificados, cliente):
+    codigo = certificados[0].codigo
+    completa = cliente.get(f'v/{codigo}.png')
+    for _ in range(2):
+        # a segunda vem do arquivo no cache
+        miniatura = cliente.get(f'v/{codigo}.png?variante=miniatura')
+        assert miniatura.status_code == 200
+        assert len(miniatura.content) < len(completa.content)
+        assert miniatura.headers['etag'] != completa.headers['etag']
+
+
+def test_get_imagem_com_etag_responde_304(certificados, cliente):
+    url = f'v/{certificados[0].codigo}.webp'
+    etag = cliente.get(url).headers['etag']
+    resp = cliente.get(url, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+
+def test_get_imagem_inexistente(certificados, cliente):
+    assert cliente.get('v/aaaaaaaaaaa.png').status_code == 404
+    codigo = certificados[0].codigo
+    assert cliente.get(f'v/{codigo}.gif').status_code == 422